@@ -0,0 +1,74 @@
+"""
+Reading the points of a page of receipts: one GET per receipt against one POST :batchGet.
+
+    python -m benchmarks.batch_get --receipts 20000 --page 50 200 --backend memory sqlite
+
+Pages are random receipt ids, requested through the Flask test client with the response cache
+disabled, so every read reaches the storage.
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+from unittest.mock import patch
+
+from src import receipt_app
+from src.response_cache import ResponseCache
+from src.storage_factory import STORAGE_BACKENDS
+from src.sqlite_receipt_storage import SqliteReceiptStorage
+from benchmarks.generators import synthetic_receipts
+
+
+def single_gets(client, page, route):
+    for receipt_id in page:
+        client.get(route.format(receipt_id))
+
+
+def batch_get(client, page, route):
+    client.post(route, json={'ids': page})
+
+
+ROUTES = {
+    'points': ('/receipts/{}/points', '/receipts/points:batchGet'),
+    'receipts': ('/receipts/{}', '/receipts:batchGet'),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--receipts', type=int, default=20_000)
+    parser.add_argument('--page', type=int, nargs='+', default=[50, 200], help='ids per page')
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--backend', nargs='+', default=['memory', 'sqlite'])
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    inputs = list(synthetic_receipts(args.receipts))
+    rnd = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in args.backend:
+            storage = (SqliteReceiptStorage(os.path.join(directory, 'receipts.db'))
+                       if backend == 'sqlite' else STORAGE_BACKENDS[backend]())
+            receipt_ids = [receipt_id for receipt_id in storage.process_receipts(inputs)
+                           if isinstance(receipt_id, str)]
+            with patch.object(receipt_app, 'receipt_storage', storage), \
+                    patch.object(receipt_app, 'response_cache', ResponseCache(max_bytes=0)):
+                client = receipt_app.app.test_client()
+                for page_size in args.page:
+                    pages = [rnd.sample(receipt_ids, page_size) for _ in range(args.pages)]
+                    for name, routes in ROUTES.items():
+                        timings = []
+                        for read, route in zip((single_gets, batch_get), routes):
+                            started = time.perf_counter()
+                            for page in pages:
+                                read(client, page, route)
+                            timings.append((time.perf_counter() - started) / len(pages) * 1e3)
+                        print(f"{backend:>8} {name:>8} page of {page_size:4}: GET per id "
+                              f"{timings[0]:8.2f}ms  batchGet {timings[1]:7.2f}ms  "
+                              f"({timings[0] / timings[1]:5.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Bulk import throughput (rows/s) by number of worker processes.
+
+    python -m benchmarks.bulk_import --receipts 400000 --workers 1 2 4 8
+"""
+import argparse
+import json
+import os
+import tempfile
+
+from src.bulk_import import import_file
+from src.compact_receipt_storage import CompactReceiptStorage
+from benchmarks.generators import synthetic_receipts
+
+
+def write_ndjson(path, count, duplicate_ratio):
+    with open(path, 'w', encoding='utf-8') as file:
+        for input_data in synthetic_receipts(count, duplicate_ratio=duplicate_ratio):
+            file.write(json.dumps(input_data))
+            file.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--receipts', type=int, default=400_000)
+    parser.add_argument('--duplicate-ratio', type=float, default=0.01)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count()])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'receipts.ndjson')
+        write_ndjson(path, args.receipts, args.duplicate_ratio)
+        print(f"{args.receipts:,} receipts, {os.path.getsize(path) / 1024 / 1024:.0f} MB")
+        baseline = None
+        for workers in args.workers:
+            stats = import_file(path, CompactReceiptStorage(), workers=workers)
+            rate = stats.rows / stats.elapsed
+            baseline = baseline or rate
+            print(f"{workers:>3} workers: {rate:10,.0f} rows/s  ({rate / baseline:4.1f}x)  "
+                  f"{stats.duplicates:,} duplicates, {stats.rejected:,} rejected")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Duplicate index memory and lookups: (retailer, formatted date-time) tuples against compact keys.
+
+    python -m benchmarks.duplicate_index --keys 10000000
+
+Every index is filled in a fresh process with --keys identifiers; memory is the growth of the
+resident set size per key, lookups are timed on the storage path (from retailer and datetime)
+for stored identifiers and for new ones (the common "not a duplicate" case).
+SqliteReceiptStorage.is_duplicate is timed too, with and without its Bloom filter prefilter.
+"""
+import argparse
+import datetime
+import gc
+import multiprocessing
+import os
+import tempfile
+import time
+
+from src.duplicate_index import DuplicateIndex, BloomFilter, identifier_hash
+from src.model.receipt import Receipt
+from src.sqlite_receipt_storage import SqliteReceiptStorage
+from benchmarks.generators import synthetic_receipts
+from benchmarks.storage_memory import resident_bytes
+
+RETAILERS = 10_000
+LOOKUPS = 200_000
+BASE_DATE_TIME = datetime.datetime(2015, 1, 1)
+
+
+def identifiers(start, count):
+    """(retailer, purchase datetime) pairs, unique for distinct positions."""
+    retailer_names = [f"Retailer {index}" for index in range(RETAILERS)]
+    for position in range(start, start + count):
+        slot, retailer = divmod(position, RETAILERS)
+        yield retailer_names[retailer], BASE_DATE_TIME + datetime.timedelta(minutes=slot)
+
+
+class TupleIndex:
+    """The previous index: identifier tuple (strftime formatted date-time) -> receipt id."""
+    def __init__(self):
+        self.identifiers = {}
+
+    def add(self, retailer, purchase_date_time):
+        self.identifiers[(retailer, Receipt.format_receipt_date(purchase_date_time))] = None
+
+    def contains(self, retailer, purchase_date_time):
+        return (retailer, Receipt.format_receipt_date(purchase_date_time)) in self.identifiers
+
+
+class BloomOnly:
+    """The prefilter of the sqlite backend on its own (the database holds the identifiers)."""
+    def __init__(self, capacity):
+        self.bloom = BloomFilter(capacity)
+
+    def add(self, retailer, purchase_date_time):
+        self.bloom.add(identifier_hash(retailer, purchase_date_time))
+
+    def contains(self, retailer, purchase_date_time):
+        return identifier_hash(retailer, purchase_date_time) in self.bloom
+
+
+INDEXES = {
+    'tuple dict': lambda keys: TupleIndex(),
+    'int key set': lambda keys: DuplicateIndex(),
+    'int key set + bloom': lambda keys: DuplicateIndex(bloom_capacity=keys),
+    'bloom only': BloomOnly,
+}
+
+
+def lookup_ns(index, pairs):
+    started = time.perf_counter_ns()
+    for retailer, purchase_date_time in pairs:
+        index.contains(retailer, purchase_date_time)
+    return (time.perf_counter_ns() - started) / len(pairs)
+
+
+def measure(name, keys):
+    stored = list(identifiers(0, LOOKUPS))
+    new = list(identifiers(keys, LOOKUPS))
+    gc.collect()
+    baseline = resident_bytes()
+    index = INDEXES[name](keys)
+    started = time.perf_counter()
+    for retailer, purchase_date_time in identifiers(0, keys):
+        index.add(retailer, purchase_date_time)
+    fill_seconds = time.perf_counter() - started
+    gc.collect()
+    return {'index': name, 'bytes_per_key': (resident_bytes() - baseline) / keys,
+            'fill_seconds': fill_seconds,
+            'stored_lookup_ns': lookup_ns(index, stored), 'new_lookup_ns': lookup_ns(index, new)}
+
+
+def sqlite_lookups(receipt_count):
+    """is_duplicate ns for (stored, new) receipts of an SQLite storage, per bloom_capacity."""
+    stored = [Receipt.from_input(data) for data in synthetic_receipts(receipt_count)]
+    new = [Receipt.from_input(data)
+           for data in synthetic_receipts(LOOKUPS // 10, offset=receipt_count)]
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for bloom_capacity in (0, receipt_count):
+            storage = SqliteReceiptStorage(os.path.join(directory, f'{bloom_capacity}.db'),
+                                           bloom_capacity=bloom_capacity)
+            storage.store_receipts(stored)
+            timings = []
+            for receipts in (stored[:len(new)], new):
+                started = time.perf_counter_ns()
+                for receipt in receipts:
+                    storage.is_duplicate(receipt)
+                timings.append((time.perf_counter_ns() - started) / len(receipts))
+            storage.close()
+            results[bloom_capacity] = timings
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--keys', type=int, default=10_000_000)
+    parser.add_argument('--indexes', nargs='+', default=list(INDEXES), choices=list(INDEXES))
+    parser.add_argument('--sqlite-receipts', type=int, default=100_000,
+                        help='receipts stored for the SQLite is_duplicate timing, 0 skips it')
+    args = parser.parse_args()
+
+    for name in args.indexes:
+        with multiprocessing.Pool(1) as pool:
+            result = pool.apply(measure, (name, args.keys))
+        print(f"{result['index']:>20}: {result['bytes_per_key']:7.1f} bytes/key, "
+              f"lookup {result['stored_lookup_ns']:6.0f} ns stored / "
+              f"{result['new_lookup_ns']:6.0f} ns new (filled in {result['fill_seconds']:.1f}s)")
+
+    if args.sqlite_receipts:
+        for bloom_capacity, (stored_ns, new_ns) in sqlite_lookups(args.sqlite_receipts).items():
+            label = 'sqlite + bloom' if bloom_capacity else 'sqlite'
+            print(f"{label:>20}: is_duplicate {stored_ns:6.0f} ns stored / {new_ns:6.0f} ns new "
+                  f"({args.sqlite_receipts:,} receipts)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Streaming GET /receipts/export against building the whole export body first.
+
+    python -m benchmarks.export --sizes 1000000 10000000 --backends memory compact sqlite
+
+Every measurement runs in a fresh process holding a filled storage, and reports export
+throughput and the growth of the resident set size (Linux /proc/self/statm) over the filled
+storage while the export is consumed chunk by chunk, or joined into one body. With --ingest a
+writer thread keeps storing receipts during the streamed export (its receipts count in the RSS
+growth then), its rate shows ingestion is not blocked.
+"""
+import argparse
+import gc
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+from src import receipt_app
+from src.model.receipt import Receipt
+from src.storage_factory import create_receipt_storage
+from src.sqlite_receipt_storage import SqliteReceiptStorage
+from benchmarks.generators import synthetic_receipts
+from benchmarks.storage_memory import resident_bytes
+
+
+def fill_storage(backend, size, directory):
+    storage = (SqliteReceiptStorage(os.path.join(directory, 'receipts.db'))
+               if backend == 'sqlite' else create_receipt_storage(backend))
+    for input_data in synthetic_receipts(size):
+        storage._store(Receipt(**input_data))  # pylint: disable=protected-access
+    return storage
+
+
+def ingest_during(storage, stop, offset):
+    """Stores new receipts until stop is set, returns the count in a list."""
+    stored = [0]
+
+    def write():
+        for input_data in synthetic_receipts(10_000_000, seed=1, offset=offset):
+            if stop.is_set():
+                return
+            storage._store(Receipt(**input_data))  # pylint: disable=protected-access
+            stored[0] += 1
+
+    thread = threading.Thread(target=write, daemon=True)
+    thread.start()
+    return thread, stored
+
+
+def export(backend, size, export_format, streamed, ingest):
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as directory:
+        storage = fill_storage(backend, size, directory)
+        gc.collect()
+        baseline = peak = resident_bytes()
+        stop = threading.Event()
+        writer, stored = ingest_during(storage, stop, size) if streamed and ingest else (None, [0])
+        with patch.object(receipt_app, 'receipt_storage', storage):
+            client = receipt_app.app.test_client()
+            started = time.perf_counter()
+            response = client.get(f'/receipts/export?format={export_format}', buffered=False)
+            exported = 0
+            if streamed:
+                for chunk in response.response:
+                    exported += len(chunk)
+                    peak = max(peak, resident_bytes())
+            else:
+                body = b''.join(response.response)
+                exported = len(body)
+                peak = resident_bytes()
+            elapsed = time.perf_counter() - started
+            response.close()
+        stop.set()
+        if writer is not None:
+            writer.join()
+    return {'rss_growth': peak - baseline, 'seconds': elapsed, 'bytes': exported,
+            'ingested_per_second': stored[0] / elapsed}
+
+
+def measure(*args):
+    with multiprocessing.Pool(1) as pool:
+        return pool.apply(export, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000])
+    parser.add_argument('--backends', nargs='+', default=['memory', 'compact', 'sqlite'])
+    parser.add_argument('--format', default='ndjson', choices=['ndjson', 'csv'])
+    parser.add_argument('--ingest', action='store_true', help='store receipts during the export')
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        for backend in args.backends:
+            for streamed in (True, False):
+                result = measure(backend, size, args.format, streamed, args.ingest)
+                mode = 'streamed' if streamed else 'joined'
+                print(f"{backend:>8} {size:>10} receipts {mode:>8}: "
+                      f"{size / result['seconds']:9,.0f} receipts/s  "
+                      f"{result['bytes'] / 2**20:8.1f}MiB out  "
+                      f"RSS +{result['rss_growth'] / 2**20:7.1f}MiB"
+                      + (f"  ingest during export {result['ingested_per_second']:7,.0f}/s"
+                         if args.ingest and streamed else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Synthetic receipt generators shared by the benchmarks.
+Generated receipts follow request_schema and are unique on retailer + purchase date-time
+unless a duplicate ratio is requested.
+"""
+import datetime
+import random
+
+BASE_DATE_TIME = datetime.datetime(2015, 1, 1)
+RETAILER_COUNT = 1000
+DESCRIPTIONS = ["Mountain Dew 12PK", "Emils Cheese Pizza", "Knorr Creamy Chicken",
+                "Doritos Nacho Cheese", "Klarbrunn 12-PK 12 FL OZ", "Gatorade", "Milk",
+                "Bread", "Eggs", "Pepsi - 12-oz", "Dasani"]
+
+
+def retailer_name(index, length=12):
+    name = f"Retailer {index}"
+    return (name + " & Co" * length)[:max(length, len(name))]
+
+
+def synthetic_receipt(index, rnd, items=(2, 6), retailer_length=12, retailer_count=RETAILER_COUNT):
+    """Input JSON (as dict) of the index-th synthetic receipt."""
+    slot, retailer_index = divmod(index, retailer_count)
+    purchase = BASE_DATE_TIME + datetime.timedelta(minutes=slot * 7)
+    receipt_items = [
+        {"shortDescription": rnd.choice(DESCRIPTIONS),
+         "price": f"{rnd.randint(0, 40)}.{rnd.randint(0, 99):02d}"}
+        for _ in range(rnd.randint(*items))
+    ]
+    return {
+        "retailer": retailer_name(retailer_index, retailer_length),
+        "purchaseDate": purchase.strftime("%Y-%m-%d"),
+        "purchaseTime": purchase.strftime("%H:%M"),
+        "total": f"{rnd.randint(0, 200)}.{rnd.choice([0, 25, 50, 75, rnd.randint(0, 99)]):02d}",
+        "items": receipt_items,
+    }
+
+
+def synthetic_receipts(count, seed=0, items=(2, 6), retailer_length=12, duplicate_ratio=0.0,
+                       offset=0, retailer_count=RETAILER_COUNT):
+    """
+    Yields count receipt inputs of retailer_count retailers; about duplicate_ratio of them repeat
+    an earlier receipt. Receipts of generators with offsets at least count apart never collide.
+    """
+    rnd = random.Random(seed)
+    unique = offset
+    for _ in range(count):
+        if unique > offset and rnd.random() < duplicate_ratio:
+            yield synthetic_receipt(rnd.randrange(offset, unique), random.Random(seed), items,
+                                    retailer_length, retailer_count)
+            continue
+        yield synthetic_receipt(unique, rnd, items, retailer_length, retailer_count)
+        unique += 1
@@ -0,0 +1,112 @@
+"""
+HTTP load generator for a running receipt service (Flask or ASGI).
+
+    python src/receipt_app.py &                                   # Flask, port 5000
+    uvicorn src.receipt_asgi:app --port 5001 --log-level warning &
+    python -m benchmarks.http_load --url http://127.0.0.1:5000 --concurrency 200
+    python -m benchmarks.http_load --url http://127.0.0.1:5001 --concurrency 200
+
+Every connection POSTs unique receipts and reads back their points (--reads per POST),
+reporting requests/s, latency percentiles and non-2xx responses.
+"""
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from benchmarks.generators import synthetic_receipts
+
+
+class Connection:
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b''):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        headers = (f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n'
+                   f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n')
+        self.writer.write(headers.encode() + body)
+        status_line = await self.reader.readline()
+        version, status = status_line.split()[:2]
+        length, keep_alive = 0, version == b'HTTP/1.1'
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.partition(b':')
+            name = name.strip().lower()
+            if name == b'content-length':
+                length = int(value)
+            elif name == b'connection':
+                keep_alive = value.strip().lower() != b'close'
+        payload = await self.reader.readexactly(length)
+        if not keep_alive:
+            await self.close()
+        return int(status), payload
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+            self.reader = self.writer = None
+
+
+async def worker(url, receipts, reads, latencies, errors):
+    connection = Connection(url.hostname, url.port or 80)
+    try:
+        for input_data in receipts:
+            started = time.perf_counter()
+            status, payload = await connection.request('POST', '/receipts/process',
+                                                       json.dumps(input_data).encode())
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors.append(status)
+                continue
+            receipt_id = json.loads(payload)['id']
+            for _ in range(reads):
+                started = time.perf_counter()
+                status, _ = await connection.request('GET', f'/receipts/{receipt_id}/points')
+                latencies.append(time.perf_counter() - started)
+                if status != 200:
+                    errors.append(status)
+    finally:
+        await connection.close()
+
+
+async def run(url, concurrency, receipts, reads, seed):
+    # a random offset keeps runs against the same server from posting duplicates,
+    # generated purchase dates stay in the past below ~400M receipts
+    offset = seed % (400_000_000 // receipts) * receipts
+    inputs = list(synthetic_receipts(receipts, seed=seed, offset=offset))
+    latencies, errors = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(url, inputs[n::concurrency], reads, latencies, errors)
+                           for n in range(concurrency)))
+    return time.perf_counter() - started, latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--receipts', type=int, default=5000)
+    parser.add_argument('--reads', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=time.time_ns() // 1000)
+    args = parser.parse_args()
+
+    elapsed, latencies, errors = asyncio.run(
+        run(urlsplit(args.url), args.concurrency, args.receipts, args.reads, args.seed))
+    latencies.sort()
+    p50, p99 = (latencies[int(len(latencies) * fraction)] * 1000 for fraction in (0.5, 0.99))
+    print(f"{args.url} concurrency={args.concurrency}: {len(latencies) / elapsed:,.0f} req/s, "
+          f"p50 {p50:.1f}ms, p99 {p99:.1f}ms, errors {len(errors)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Cost of a retried POST /receipts/process: answered from the idempotency cache against rejected
+as a duplicate.
+
+    python -m benchmarks.idempotent_retries --receipts 20000
+
+Every receipt is posted once, then posted again through the Flask test client, with the
+idempotency cache on (retries get their id back) and off (retries are parsed, scored and
+rejected with a 400). The last line times the server side work alone: hashing the body and
+the cache lookup against parsing, scoring and the duplicate check.
+"""
+import argparse
+import json
+import logging
+import time
+from unittest.mock import patch
+
+from src import receipt_app
+from src.idempotency_cache import IdempotencyCache, request_key
+from src.model.receipt import Receipt
+from benchmarks.generators import synthetic_receipts
+
+
+def post_all(client, inputs):
+    started = time.perf_counter()
+    statuses = {client.post('/receipts/process', json=input_data).status_code
+                for input_data in inputs}
+    return (time.perf_counter() - started) / len(inputs) * 1e6, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--receipts', type=int, default=20_000)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    inputs = list(synthetic_receipts(args.receipts))
+    client = receipt_app.app.test_client()
+    for name, max_entries in (('off', 0), ('on', args.receipts)):
+        cache = IdempotencyCache(max_entries=max_entries)
+        with patch.object(receipt_app, 'idempotency_cache', cache):
+            receipt_app.receipt_storage.clear()
+            first, _ = post_all(client, inputs)
+            retry, statuses = post_all(client, inputs)
+        print(f"idempotency cache {name:>3}: first post {first:7.1f}us  "
+              f"retry {retry:7.1f}us (status {', '.join(map(str, sorted(statuses)))})")
+
+    bodies = [json.dumps(input_data).encode() for input_data in inputs]
+    cache = IdempotencyCache(max_entries=len(bodies))
+    for body in bodies:
+        cache.put(request_key(body), 'id', 200)
+    started = time.perf_counter()
+    for body in bodies:
+        cache.get(request_key(body))
+    replay = (time.perf_counter() - started) / len(bodies) * 1e6
+    storage = receipt_app.receipt_storage
+    started = time.perf_counter()
+    for body in bodies:
+        storage.is_duplicate(Receipt.from_input(json.loads(body)))
+    rejection = (time.perf_counter() - started) / len(bodies) * 1e6
+    print(f"retry server side work: hash + lookup {replay:5.1f}us, "
+          f"parse + score + duplicate check {rejection:5.1f}us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+POST /receipts/process latency and throughput, storing in the request against the ingestion queue.
+
+    python -m benchmarks.ingest_pipeline --receipts 20000 --clients 8 --backend sqlite \
+        --fsync always
+
+Client threads post receipts through the Flask test client to a storage logging to a temporary
+RECEIPT_DATA_DIR. Latency is per request; throughput counts until every receipt is stored
+(the queue drained), so both modes do the same work.
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+from src import receipt_app
+from src.idempotency_cache import IdempotencyCache
+from src.ingest_pipeline import IngestPipeline
+from src.persistence import ReceiptLog
+from src.storage_factory import STORAGE_BACKENDS
+from src.sqlite_receipt_storage import SqliteReceiptStorage
+from benchmarks.generators import synthetic_receipts
+
+
+def run(mode, args, inputs, directory):
+    storage = (SqliteReceiptStorage(os.path.join(directory, f'{mode}.db'))
+               if args.backend == 'sqlite' else STORAGE_BACKENDS[args.backend]())
+    log = ReceiptLog(os.path.join(directory, mode), fsync_policy=args.fsync, snapshot_every=0)
+    storage.recover(log)
+    pipeline = IngestPipeline(storage, queue_size=len(inputs), workers=args.workers) \
+        if mode == 'queue' else None
+    latencies = []
+    shares = [inputs[n::args.clients] for n in range(args.clients)]
+
+    def client(share):
+        test_client = receipt_app.app.test_client()
+        timings = []
+        for input_data in share:
+            started = time.perf_counter()
+            test_client.post('/receipts/process', json=input_data)
+            timings.append(time.perf_counter() - started)
+        latencies.extend(timings)
+
+    # a fresh idempotency cache, else the queue run replays the ids the request run stored
+    with patch.object(receipt_app, 'receipt_storage', storage), \
+            patch.object(receipt_app, 'ingest', pipeline), \
+            patch.object(receipt_app, 'idempotency_cache', IdempotencyCache()):
+        threads = [threading.Thread(target=client, args=(share,)) for share in shares]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if pipeline is not None:
+            pipeline.close()
+        elapsed = time.perf_counter() - started
+    assert len(storage) == len(inputs), (mode, len(storage))
+    log.close()
+    latencies.sort()
+    return {'receipts_per_s': len(inputs) / elapsed,
+            'p50_us': statistics.median(latencies) * 1e6,
+            'p99_us': latencies[int(len(latencies) * 0.99)] * 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--receipts', type=int, default=20_000)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=2, help='ingestion worker threads')
+    parser.add_argument('--backend', default='sqlite')
+    parser.add_argument('--fsync', default='always', choices=('always', 'interval', 'never'))
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    inputs = list(synthetic_receipts(args.receipts))
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ('request', 'queue'):
+            result = run(mode, args, inputs, directory)
+            print(f"{args.backend} fsync={args.fsync} store in {mode:>7}: "
+                  f"{result['receipts_per_s']:8,.0f} receipts/s, latency p50 "
+                  f"{result['p50_us']:7.0f}us p99 {result['p99_us']:8.0f}us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Per-receipt cost of serializing GET /receipts/<id> responses and parsing POST bodies, per codec.
+
+    python -m benchmarks.json_codec --receipts 2000 --items 2 10 500
+
+'formatted copy + json.dumps' is the response path before src/json_codec.py: a copy of the
+record with its purchase date-time formatted, then the stdlib encoder. The codecs encode the
+record's datetime natively. Parsing times the request body bytes to a dict.
+"""
+import argparse
+import json
+import time
+
+from src.config import DT_FORMAT
+from src.json_codec import JSON_CODECS, orjson
+from src.model.receipt import Receipt
+from benchmarks.generators import synthetic_receipts
+
+
+def formatted_dumps(content):
+    receipt = dict(content['receipt'])
+    receipt['purchaseDateTime'] = Receipt.format_receipt_date(receipt['purchaseDateTime'],
+                                                             DT_FORMAT)
+    return json.dumps({'receipt': receipt}, separators=(',', ':'), sort_keys=True).encode()
+
+
+def timed(function, values):
+    started = time.perf_counter()
+    for value in values:
+        function(value)
+    return (time.perf_counter() - started) / len(values) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--receipts', type=int, default=2000)
+    parser.add_argument('--items', type=int, nargs='+', default=[2, 10, 500],
+                        help='items per receipt (receipts need 2 or more)')
+    args = parser.parse_args()
+
+    codecs = [JSON_CODECS[name]() for name in JSON_CODECS if name != 'orjson' or orjson]
+    for item_count in args.items:
+        inputs = list(synthetic_receipts(args.receipts, items=(item_count, item_count)))
+        responses = [{'receipt': Receipt.record_response(Receipt.from_input(input_data).to_dict())}
+                     for input_data in inputs]
+        bodies = [json.dumps(input_data).encode() for input_data in inputs]
+
+        print(f"{item_count} items, {sum(map(len, bodies)) // len(bodies)} bytes per body")
+        serializers = {'formatted copy + json.dumps': formatted_dumps}
+        serializers.update((f'{codec.name} codec', codec.dumps) for codec in codecs)
+        for name, dumps in serializers.items():
+            print(f"  serialize {name:>28}: {timed(dumps, responses):8.1f}us/receipt")
+        for codec in codecs:
+            print(f"  parse     {codec.name + ' codec':>28}: "
+                  f"{timed(codec.loads, bodies):8.1f}us/receipt")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+POST /receipts/process latency with logging off, logging in the request thread and queued logging.
+
+    python -m benchmarks.logging_overhead --receipts 20000
+
+'inline' is the previous setup: a text StreamHandler on the root logger at DEBUG, formatted and
+written by the request thread. 'queued' is src/logging_config.py (JSON lines written by the
+listener thread), 'queued sampled' keeps 1 in --sample INFO records. Logs go to a temporary file.
+"""
+import argparse
+import logging
+import statistics
+import tempfile
+import time
+
+from src import receipt_app
+from src.logging_config import TEXT_FORMAT, configure_logging, stop_logging
+from benchmarks.generators import synthetic_receipts
+
+
+def inline_logging(stream):
+    stop_logging()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    root.addHandler(handler)
+    root.setLevel(logging.DEBUG)
+
+
+def run(inputs):
+    client = receipt_app.app.test_client()
+    receipt_app.receipt_storage.clear()
+    latencies = []
+    for input_data in inputs:
+        started = time.perf_counter()
+        client.post('/receipts/process', json=input_data)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return (statistics.mean(latencies) * 1e6, latencies[len(latencies) // 2] * 1e6,
+            latencies[int(len(latencies) * 0.99)] * 1e6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--receipts', type=int, default=20_000)
+    parser.add_argument('--sample', type=int, default=100, help='INFO records kept 1 in n')
+    args = parser.parse_args()
+
+    inputs = list(synthetic_receipts(args.receipts))
+    logging.disable(logging.CRITICAL)
+    run(inputs[:1000])  # warm-up
+    logging.disable(logging.NOTSET)
+    with tempfile.TemporaryFile('w') as stream:
+        modes = {
+            'off': lambda: logging.disable(logging.CRITICAL),
+            'inline': lambda: inline_logging(stream),
+            'queued': lambda: configure_logging(level='INFO', sample_every={}, stream=stream),
+            'queued sampled': lambda: configure_logging(
+                level='INFO', sample_every={'INFO': args.sample}, stream=stream),
+        }
+        for name, setup in modes.items():
+            setup()
+            mean, p50, p99 = run(inputs)
+            stop_logging()
+            logging.disable(logging.NOTSET)
+            print(f"logging {name:>14}: mean {mean:7.1f}us  p50 {p50:7.1f}us  p99 {p99:8.1f}us")
+    configure_logging()
+
+
+if __name__ == '__main__':
+    main()
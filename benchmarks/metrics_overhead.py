@@ -0,0 +1,52 @@
+"""
+Cost of the /metrics instrumentation: receipt processing with metrics on and off.
+
+    python -m benchmarks.metrics_overhead --receipts 20000
+"""
+import argparse
+import logging
+import time
+
+from src import metrics
+from src.receipt_storage import ReceiptStorage
+from benchmarks.generators import synthetic_receipts
+
+
+def storage_run(inputs):
+    storage = ReceiptStorage()
+    started = time.perf_counter()
+    for input_data in inputs:
+        storage.process_receipt(input_data)
+    return time.perf_counter() - started
+
+
+def flask_run(inputs):
+    from src import receipt_app  # pylint: disable=import-outside-toplevel
+    client = receipt_app.app.test_client()
+    receipt_app.receipt_storage.clear()
+    started = time.perf_counter()
+    for input_data in inputs:
+        client.post('/receipts/process', json=input_data)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--receipts', type=int, default=20_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    inputs = list(synthetic_receipts(args.receipts))
+    for name, run in (('storage.process_receipt', storage_run), ('flask POST', flask_run)):
+        timings = {}
+        for enabled in (False, True):
+            metrics.set_enabled(enabled)
+            timings[enabled] = min(run(inputs) for _ in range(args.repeat)) / len(inputs) * 1e6
+        print(f"{name:>24}: off {timings[False]:7.2f}us  on {timings[True]:7.2f}us  "
+              f"overhead {timings[True] - timings[False]:5.2f}us "
+              f"({timings[True] / timings[False] - 1:+.1%})")
+
+
+if __name__ == '__main__':
+    main()
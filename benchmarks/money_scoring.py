@@ -0,0 +1,105 @@
+"""
+Scoring cost of the money rules: float dollars (the previous model) against integer cents.
+
+    python -m benchmarks.money_scoring --receipts 100000 --items 2 6
+
+Both rule sets are compiled the same way and score the same receipts, once with total and
+prices as floats and once as cents; the vectorized batch rules are timed over float64
+and int64 columns too.
+"""
+import argparse
+import copy
+import math
+import time
+
+import numpy as np
+
+from src.model.points_calculator import PointsCalculator, CompiledRules, ReceiptColumns
+from src.model.receipt import Receipt
+from benchmarks.generators import synthetic_receipts
+
+FLOAT_RULES = {
+    "total_round_dollar": {
+        'field': 'total',
+        'method': lambda total: 50 if total % 1 == 0 else 0,
+        'batch_method': lambda columns: np.where(columns.totals % 1 == 0, 50, 0),
+    },
+    "total_in_quarters": {
+        'field': 'total',
+        'method': lambda total: 25 if total * 100 % 25 == 0 else 0,
+        'batch_method': lambda columns: np.where(columns.totals * 100 % 25 == 0, 25, 0),
+    },
+    "items_names_in3": {
+        'field': 'items',
+        'method': lambda items: sum([math.ceil(0.2 * item["price"]) for item in items
+                                     if len(item["shortDescription"].strip()) % 3 == 0]),
+        'batch_method': lambda columns: np.bincount(
+            columns.item_owner[columns.item_description_lengths % 3 == 0],
+            weights=np.ceil(0.2 * columns.item_prices[columns.item_description_lengths % 3 == 0]),
+            minlength=columns.size).astype(np.int64),
+    },
+}
+
+
+def money_rules(rules):
+    return {rule: rules[rule] for rule in FLOAT_RULES}
+
+
+def float_receipts(receipts):
+    """Copies of receipts with total and prices back in float dollars."""
+    copies = copy.deepcopy(receipts)
+    for receipt in copies:
+        receipt.total = receipt.total / 100
+        for item in receipt.items:
+            item["price"] = item["price"] / 100
+    return copies
+
+
+def timed(run, count, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        run()
+        best = min(best, time.perf_counter_ns() - started)
+    return best / count
+
+
+def money_columns(receipts):
+    """ReceiptColumns of receipts, with float64 money columns for float dollar receipts."""
+    columns = ReceiptColumns(receipts)
+    if isinstance(receipts[0].total, float):
+        columns.totals = np.fromiter((r.total for r in receipts), dtype=np.float64)
+        columns.item_prices = np.fromiter((item["price"] for r in receipts for item in r.items),
+                                          dtype=np.float64)
+    return columns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--receipts', type=int, default=100_000)
+    parser.add_argument('--items', type=int, nargs=2, default=(2, 6), metavar=('MIN', 'MAX'))
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    cents = [Receipt.from_input(input_data)
+             for input_data in synthetic_receipts(args.receipts, items=tuple(args.items))]
+    dollars = float_receipts(cents)
+    cases = (('float dollars', FLOAT_RULES, dollars),
+             ('integer cents', money_rules(PointsCalculator.rules), cents))
+
+    results = {}
+    for name, rules, receipts in cases:
+        score = CompiledRules(rules, memo_size=0).score
+        columns = money_columns(receipts)
+        results[name] = [score(receipt) for receipt in receipts]
+        scalar = timed(lambda score=score, receipts=receipts: [score(r) for r in receipts],
+                       len(receipts), args.repeat)
+        batch = timed(lambda rules=rules, columns=columns: [
+            info['batch_method'](columns) for info in rules.values()], len(receipts), args.repeat)
+        print(f"{name:>14}: {scalar:8.0f} ns/receipt scalar, {batch:6.1f} ns/receipt batch")
+    mismatches = sum(a != b for a, b in zip(*results.values()))
+    print(f"receipts scored differently: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
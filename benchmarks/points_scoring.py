@@ -0,0 +1,56 @@
+"""
+Scoring cost per receipt: the interpreted rule table against the compiled scoring function.
+
+    python -m benchmarks.points_scoring --receipts 100000 --retailers 1000
+"""
+import argparse
+import time
+
+from src.model.points_calculator import PointsCalculator, CompiledRules
+from src.model.receipt import Receipt
+from benchmarks.generators import synthetic_receipts
+
+
+def interpreted_points(receipt):
+    """PointsCalculator.calculate_points before the rules were compiled."""
+    rule_values = {}
+    for rule, info in PointsCalculator.rules.items():
+        value = getattr(receipt, info['field'])
+        rule_values[rule] = info['method'](value)
+    return sum(rule_values.values())
+
+
+def timed(score, receipts, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        for receipt in receipts:
+            score(receipt)
+        best = min(best, time.perf_counter_ns() - started)
+    return best / len(receipts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--receipts', type=int, default=100_000)
+    parser.add_argument('--retailers', type=int, default=1000,
+                        help='distinct retailer names, what the retailer memo is keyed by')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    receipts = [Receipt.from_input(input_data)
+                for input_data in synthetic_receipts(args.receipts)]
+    for index, receipt in enumerate(receipts):
+        receipt.retailer = f'Retailer {index % args.retailers}'
+
+    scorers = {
+        'interpreted rules': interpreted_points,
+        'compiled, no memo': CompiledRules(PointsCalculator.rules, memo_size=0).score,
+        'compiled + memo': CompiledRules(PointsCalculator.rules).score,
+    }
+    for name, score in scorers.items():
+        print(f"{name:>20}: {timed(score, receipts, args.repeat):8.0f} ns/receipt")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Hot receipt reads through the Flask app: uncached, from the response cache, and 304 revalidations.
+
+    python -m benchmarks.read_cache --receipts 1000 --reads 20000
+
+"client" times full test client requests, "handler" the view function alone
+(the test client's own per-request cost is several times the handler's).
+"""
+import argparse
+import logging
+import random
+import time
+
+from src import receipt_app
+from benchmarks.generators import synthetic_receipts
+
+
+def timed_reads(client, paths, etags=None):
+    started = time.perf_counter()
+    for path in paths:
+        headers = {'If-None-Match': etags[path]} if etags else None
+        client.get(path, headers=headers)
+    return (time.perf_counter() - started) / len(paths) * 1e6
+
+
+def timed_handler(view, receipt_ids, etag=None):
+    headers = {'If-None-Match': etag} if etag else None
+    with receipt_app.app.test_request_context(headers=headers):
+        started = time.perf_counter()
+        for receipt_id in receipt_ids:
+            view(receipt_id)
+        return (time.perf_counter() - started) / len(receipt_ids) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--receipts', type=int, default=1000, help='hot receipts')
+    parser.add_argument('--reads', type=int, default=20_000)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    client = receipt_app.app.test_client()
+    cache = receipt_app.response_cache
+    receipt_app.receipt_storage.clear()
+    receipt_ids = [client.post('/receipts/process', json=input_data).json['id']
+                   for input_data in synthetic_receipts(args.receipts)]
+    rnd = random.Random(1)
+    hot_ids = [rnd.choice(receipt_ids) for _ in range(args.reads)]
+    for template, view in (('/receipts/{}/points', receipt_app.get_points),
+                           ('/receipts/{}', receipt_app.view_receipt)):
+        paths = [template.format(receipt_id) for receipt_id in hot_ids]
+
+        max_bytes = cache.max_bytes
+        cache.max_bytes = 0
+        cache.clear()
+        uncached = timed_reads(client, paths), timed_handler(view, hot_ids)
+        cache.max_bytes = max_bytes
+
+        etags = {path: client.get(path).headers['ETag'] for path in set(paths)}
+        cached = timed_reads(client, paths), timed_handler(view, hot_ids)
+        # one etag for every read: the handler timing only needs the comparison to happen
+        not_modified = (timed_reads(client, paths, etags),
+                        timed_handler(view, hot_ids[:1] * len(hot_ids), etags[paths[0]]))
+        for name, (client_us, handler_us) in (('uncached', uncached), ('cached', cached),
+                                              ('304', not_modified)):
+            print(f"GET {template:<20} {name:>9}: client {client_us:7.1f}us  "
+                  f"handler {handler_us:6.1f}us")
+
+
+if __name__ == '__main__':
+    main()
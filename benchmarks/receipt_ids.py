@@ -0,0 +1,82 @@
+"""
+Receipt id generation and lookup cost: str(uuid.uuid4()) against the uuid4 and uuid7 generators.
+
+    python -m benchmarks.receipt_ids --ids 1000000
+
+Generation is per id, as an int and rendered as a string. Lookup finds every id in a dict
+keyed by the string and in one keyed by the int parsed from the string (what the compact
+storage does). The SQLite part inserts the string ids in generation order into a table with
+a unique id index, where time-ordered ids append to the index instead of landing at random.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+
+from src.model.receipt_ids import ID_GENERATORS, format_receipt_id, parse_receipt_id
+
+
+def timed(function, count):
+    started = time.perf_counter()
+    result = function()
+    return result, (time.perf_counter() - started) / count * 1e9
+
+
+def sqlite_inserts(receipt_ids, directory):
+    path = os.path.join(directory, 'ids.db')
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE receipts (seq INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE)')
+    started = time.perf_counter()
+    for start in range(0, len(receipt_ids), 10_000):
+        with connection:
+            connection.executemany('INSERT INTO receipts (id) VALUES (?)',
+                                   ((receipt_id,)
+                                    for receipt_id in receipt_ids[start:start + 10_000]))
+    elapsed = time.perf_counter() - started
+    connection.close()
+    os.remove(path)
+    return len(receipt_ids) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--ids', type=int, default=1_000_000)
+    parser.add_argument('--sqlite-ids', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    _, baseline = timed(lambda: [str(uuid.uuid4()) for _ in range(args.ids)], args.ids)
+    print(f"{'str(uuid.uuid4())':>18}: generate {baseline:6.0f}ns/id")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, generator_class in ID_GENERATORS.items():
+            generator = generator_class()
+            id_ints, generate_ns = timed(
+                lambda generator=generator: [generator.new_id() for _ in range(args.ids)],
+                args.ids)
+            receipt_ids, render_ns = timed(
+                lambda id_ints=id_ints: [format_receipt_id(id_int) for id_int in id_ints],
+                args.ids)
+            by_string = dict.fromkeys(receipt_ids, 0)
+            by_int = dict.fromkeys(id_ints, 0)
+            lookups = random.Random(0).sample(receipt_ids, len(receipt_ids))
+            _, string_lookup_ns = timed(
+                lambda by_string=by_string, lookups=lookups:
+                [by_string[receipt_id] for receipt_id in lookups], args.ids)
+            _, int_lookup_ns = timed(
+                lambda by_int=by_int, lookups=lookups:
+                [by_int[parse_receipt_id(receipt_id)] for receipt_id in lookups], args.ids)
+            key_bytes = (sys.getsizeof(receipt_ids[0]), sys.getsizeof(id_ints[0]))
+            inserts = sqlite_inserts(
+                [format_receipt_id(generator.new_id()) for _ in range(args.sqlite_ids)],
+                directory)
+            print(f"{name:>18}: generate {generate_ns:6.0f}ns/id (+{render_ns:.0f}ns as string)  "
+                  f"lookup by string {string_lookup_ns:4.0f}ns, by int {int_lookup_ns:4.0f}ns "
+                  f"(key {key_bytes[0]} vs {key_bytes[1]} bytes)  "
+                  f"sqlite {inserts:9,.0f} inserts/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Range and group-by queries: the secondary indexes (src/receipt_index.py) against a full scan.
+
+    python -m benchmarks.receipt_index --receipts 10000000
+
+Stored records are generated directly (the shape of benchmarks/generators.py: RETAILER_COUNT
+retailers, a receipt every 7 minutes per retailer) and bulk-loaded into a compact storage,
+which is then indexed. Every query is answered by the index and by a scan of iter_receipts;
+both answers are compared. Index memory is the growth of the resident set size while indexing.
+"""
+import argparse
+import datetime
+import gc
+import random
+import time
+import uuid
+
+from src.compact_receipt_storage import CompactReceiptStorage
+from src.model.receipt import RECEIPT_ID_NAME
+from src.persistence import SnapshotTable
+from src.receipt_index import scan_receipt_ids, scan_retailer_totals, scan_day_totals
+from benchmarks.generators import BASE_DATE_TIME, RETAILER_COUNT, DESCRIPTIONS, retailer_name
+from benchmarks.storage_memory import resident_bytes
+
+RETAILER = retailer_name(7)
+
+
+def stored_records(count, seed=0):
+    rnd = random.Random(seed)
+    retailers = [retailer_name(index) for index in range(RETAILER_COUNT)]
+    for index in range(count):
+        slot, retailer = divmod(index, RETAILER_COUNT)
+        yield {
+            RECEIPT_ID_NAME: str(uuid.UUID(int=rnd.getrandbits(128), version=4)),
+            "retailer": retailers[retailer],
+            "purchaseDateTime": BASE_DATE_TIME + datetime.timedelta(minutes=slot * 7),
+            "total": rnd.randrange(20_000),
+            "items": [{"shortDescription": rnd.choice(DESCRIPTIONS), "price": rnd.randrange(4000)}
+                      for _ in range(2)],
+            "points": rnd.randrange(120),
+        }
+
+
+def queries(receipt_count):
+    """(name, indexed query, scan query) of a storage; ranges fall in the middle of the data."""
+    middle = BASE_DATE_TIME + datetime.timedelta(
+        minutes=receipt_count // RETAILER_COUNT * 7 // 2)
+    day, week = datetime.timedelta(days=1), datetime.timedelta(days=7)
+    return [
+        ('search, 1 retailer, 1 day, 100', (RETAILER, middle, middle + day),
+         lambda storage, args: storage.index.receipt_ids(*args, limit=100),
+         lambda storage, args: scan_receipt_ids(storage.iter_receipts(), *args, limit=100)),
+        ('search, all, 1 hour, 100', (None, middle, middle + datetime.timedelta(hours=1)),
+         lambda storage, args: storage.index.receipt_ids(*args, limit=100),
+         lambda storage, args: scan_receipt_ids(storage.iter_receipts(), *args, limit=100)),
+        ('totals per retailer', (),
+         lambda storage, args: storage.index.retailer_totals(),
+         lambda storage, args: scan_retailer_totals(storage.iter_receipts())),
+        ('totals per retailer, 1 week', (middle, middle + week),
+         lambda storage, args: storage.index.retailer_totals(*args),
+         lambda storage, args: scan_retailer_totals(storage.iter_receipts(), *args)),
+        ('totals per day, 1 retailer', (RETAILER,),
+         lambda storage, args: storage.index.day_totals(*args),
+         lambda storage, args: scan_day_totals(storage.iter_receipts(), *args)),
+    ]
+
+
+def timed(query, storage, args, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = query(storage, args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--receipts', type=int, default=10_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--scan-repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    storage = CompactReceiptStorage()
+    storage.restore_table(SnapshotTable.from_records(stored_records(args.receipts)))
+    print(f"loaded {len(storage):,} receipts in {time.perf_counter() - started:.1f}s")
+
+    gc.collect()
+    baseline = resident_bytes()
+    started = time.perf_counter()
+    storage.enable_index()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    print(f"indexed in {elapsed:.1f}s, "
+          f"{(resident_bytes() - baseline) / args.receipts:.0f} bytes/receipt")
+
+    for name, query_args, indexed, scanned in queries(args.receipts):
+        index_seconds, index_result = timed(indexed, storage, query_args, args.repeat)
+        scan_seconds, scan_result = timed(scanned, storage, query_args, args.scan_repeat)
+        assert index_result == scan_result, name
+        print(f"{name:>30}: index {index_seconds * 1000:9.3f} ms, "
+              f"scan {scan_seconds * 1000:10.1f} ms ({scan_seconds / index_seconds:,.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
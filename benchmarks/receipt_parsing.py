@@ -0,0 +1,56 @@
+"""
+Per-receipt cost of validating and parsing request input.
+
+    python -m benchmarks.receipt_parsing --receipts 20000
+
+Compares jsonschema.validate (what flask_expects_json ran per request), a precompiled
+jsonschema validator, each followed by Receipt(**data), against the fused Receipt.from_input.
+"""
+import argparse
+import time
+
+from jsonschema import validate
+from jsonschema.validators import validator_for
+
+from src.model.receipt import Receipt
+from src.validation_schema import request_schema
+from benchmarks.generators import synthetic_receipts
+
+request_validator = validator_for(request_schema)(request_schema)
+
+
+def schema_validate(input_data):
+    validate(input_data, request_schema)
+    return Receipt(**input_data)
+
+
+def compiled_validate(input_data):
+    request_validator.validate(input_data)
+    return Receipt(**input_data)
+
+
+PATHS = {
+    'jsonschema.validate + Receipt': schema_validate,
+    'compiled validator + Receipt': compiled_validate,
+    'Receipt.from_input': Receipt.from_input,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--receipts', type=int, default=20_000)
+    parser.add_argument('--items', type=int, default=5, help='items per receipt')
+    args = parser.parse_args()
+
+    receipts = list(synthetic_receipts(args.receipts, items=(args.items, args.items)))
+    for name, parse in PATHS.items():
+        started = time.perf_counter()
+        for input_data in receipts:
+            parse(input_data)
+        elapsed = time.perf_counter() - started
+        print(f"{name:>32}: {elapsed / len(receipts) * 1e6:8.1f}us/receipt  "
+              f"{len(receipts) / elapsed:10,.0f}/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Startup recovery time from a snapshot plus log tail.
+
+    python -m benchmarks.recovery --receipts 10000000 --tail 100000
+
+Records are generated directly (no scoring), written as a snapshot and a log tail,
+then recovered into each storage backend.
+"""
+import argparse
+import datetime
+import tempfile
+import time
+import uuid
+
+from src.model.money import to_cents
+from src.model.receipt import RECEIPT_ID_NAME
+from src.persistence import ReceiptLog, SnapshotTable, FSYNC_NEVER
+from src.storage_factory import STORAGE_BACKENDS
+from benchmarks.generators import synthetic_receipts
+
+
+def synthetic_records(count):
+    for input_data in synthetic_receipts(count):
+        yield {
+            RECEIPT_ID_NAME: str(uuid.uuid4()),
+            "retailer": input_data["retailer"],
+            "purchaseDateTime": datetime.datetime.fromisoformat(
+                f'{input_data["purchaseDate"]} {input_data["purchaseTime"]}'),
+            "total": to_cents(input_data["total"]),
+            "items": [{"shortDescription": item["shortDescription"],
+                       "price": to_cents(item["price"])}
+                      for item in input_data["items"]],
+            "points": 0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--receipts', type=int, default=1_000_000)
+    parser.add_argument('--tail', type=int, default=100_000)
+    parser.add_argument('--backends', nargs='+', default=sorted(STORAGE_BACKENDS))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        log = ReceiptLog(directory, fsync_policy=FSYNC_NEVER)
+        records = synthetic_records(args.receipts + args.tail)
+        started = time.perf_counter()
+        log.snapshot(lambda: SnapshotTable.from_records(next(records)
+                                                        for _ in range(args.receipts)))
+        for record in records:
+            log.append(record)
+        log.close()
+        print(f"wrote {args.receipts} snapshot + {args.tail} log receipts "
+              f"in {time.perf_counter() - started:.1f}s")
+
+        for backend in args.backends:
+            log = ReceiptLog(directory, fsync_policy=FSYNC_NEVER)
+            storage = STORAGE_BACKENDS[backend]()
+            started = time.perf_counter()
+            storage.recover(log)
+            elapsed = time.perf_counter() - started
+            log.close()
+            print(f"{backend:>10}: recovered {len(storage)} receipts in {elapsed:.2f}s "
+                  f"({len(storage) / elapsed:,.0f} receipts/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Insert + read throughput of the shared memory storage as the number of worker processes grows.
+
+    python -m benchmarks.shared_storage --processes 1 2 4 8 --receipts 200000
+
+Receipts are parsed up front, then forked processes attach to one fresh store file, each stores
+its share and reads points of receipts stored by the others. The in-memory backend in a single
+process is the baseline; process counts past the core count only add contention.
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from src.model.receipt import Receipt
+from src.receipt_storage import ReceiptStorage
+from src.shared_receipt_storage import SharedReceiptStorage
+from benchmarks.generators import synthetic_receipts
+
+
+def worker(path, receipts, read_ids, start):
+    storage = SharedReceiptStorage(path)
+    start.wait()
+    for receipt in receipts:
+        storage._store(receipt)  # pylint: disable=protected-access
+    for receipt_id in read_ids:
+        storage.get_receipt_points(receipt_id)
+
+
+def run(process_count, receipts, directory):
+    path = os.path.join(directory, f'{process_count}.shm')
+    SharedReceiptStorage(path, capacity=len(receipts)).close()
+    context = multiprocessing.get_context('fork')
+    start = context.Barrier(process_count + 1)
+    shares = [receipts[n::process_count] for n in range(process_count)]
+    processes = [context.Process(target=worker, args=(
+        path, share, [receipt.receipt_id for receipt in shares[(n + 1) % process_count]], start))
+                 for n, share in enumerate(shares)]
+    for process in processes:
+        process.start()
+    start.wait()
+    started = time.perf_counter()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+    storage = SharedReceiptStorage(path)
+    assert len(storage) == len(receipts)
+    storage.close()
+    os.remove(path)
+    return len(receipts) / elapsed
+
+
+def run_memory(receipts):
+    storage = ReceiptStorage()
+    started = time.perf_counter()
+    for receipt in receipts:
+        storage._store(receipt)  # pylint: disable=protected-access
+    for receipt in receipts:
+        storage.get_receipt_points(receipt.receipt_id)
+    return len(receipts) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--receipts', type=int, default=200_000)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    receipts = [Receipt.from_input(input_data) for input_data in synthetic_receipts(args.receipts)]
+    print(f"{'memory':>8}   1 process:   {run_memory(receipts):12,.0f} receipts/s "
+          f"({os.cpu_count()} cores)")
+    with tempfile.TemporaryDirectory() as directory:
+        for process_count in args.processes:
+            rate = run(process_count, receipts, directory)
+            print(f"{'shared':>8} {process_count:>3} processes: {rate:12,.0f} receipts/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Insert throughput and read latency percentiles per storage backend.
+
+    python -m benchmarks.storage_backends --receipts 100000 --backends memory sqlite
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from src.model.receipt import Receipt
+from src.storage_factory import STORAGE_BACKENDS
+from src.sqlite_receipt_storage import SqliteReceiptStorage
+from benchmarks.generators import synthetic_receipts
+
+BATCH_SIZE = 500
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {name: samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1e6
+            for name, fraction in (('p50', 0.5), ('p99', 0.99), ('max', 1.0))}
+
+
+def timed_reads(read, receipt_ids, lookups, rnd):
+    samples = []
+    for _ in range(lookups):
+        receipt_id = rnd.choice(receipt_ids)
+        started = time.perf_counter()
+        read(receipt_id)
+        samples.append(time.perf_counter() - started)
+    return percentiles(samples)
+
+
+def run(backend, receipts, lookups, directory):
+    if backend == 'sqlite':
+        storage = SqliteReceiptStorage(os.path.join(directory, f'bench-{time.time_ns()}.db'))
+    else:
+        storage = STORAGE_BACKENDS[backend]()
+
+    started = time.perf_counter()
+    for start in range(0, len(receipts), BATCH_SIZE):
+        storage._store_many(receipts[start:start + BATCH_SIZE])  # pylint: disable=protected-access
+    insert_rate = len(receipts) / (time.perf_counter() - started)
+
+    rnd = random.Random(1)
+    receipt_ids = [receipt.receipt_id for receipt in receipts]
+    points = timed_reads(storage.get_receipt_points, receipt_ids, lookups, rnd)
+    receipt = timed_reads(storage.get_receipt, receipt_ids, lookups, rnd)
+    duplicates = timed_reads(lambda receipt_id: storage.is_duplicate(receipts[0]),
+                             receipt_ids, lookups, rnd)
+    return insert_rate, points, receipt, duplicates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--receipts', type=int, default=100_000)
+    parser.add_argument('--lookups', type=int, default=20_000)
+    parser.add_argument('--backends', nargs='+', default=sorted(STORAGE_BACKENDS))
+    args = parser.parse_args()
+
+    receipts = [Receipt(**input_data) for input_data in synthetic_receipts(args.receipts)]
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in args.backends:
+            insert_rate, points, receipt, duplicates = run(backend, receipts, args.lookups,
+                                                           directory)
+            print(f"{backend:>10}: insert {insert_rate:10,.0f}/s (batches of {BATCH_SIZE})")
+            for name, latency in (('points', points), ('receipt', receipt),
+                                  ('duplicate', duplicates)):
+                print(f"{'':>12}{name:>10} p50 {latency['p50']:7.1f}us  "
+                      f"p99 {latency['p99']:7.1f}us  max {latency['max']:8.1f}us")
+
+
+if __name__ == '__main__':
+    main()
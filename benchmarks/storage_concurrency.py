@@ -0,0 +1,56 @@
+"""
+Insert + read throughput of a storage backend as the number of threads grows.
+
+    python -m benchmarks.storage_concurrency --backend concurrent --threads 1 2 4 8 16
+
+Receipts are parsed up front, every thread then stores its share and reads it back,
+so the numbers reflect storage (locking) cost rather than parsing.
+"""
+import argparse
+import threading
+import time
+
+from src.model.receipt import Receipt
+from src.storage_factory import create_receipt_storage
+from benchmarks.generators import synthetic_receipts
+
+
+def run(backend, thread_count, receipts):
+    storage = create_receipt_storage(backend)
+    shares = [receipts[n::thread_count] for n in range(thread_count)]
+    start = threading.Barrier(thread_count + 1)
+
+    def worker(share):
+        start.wait()
+        for receipt in share:
+            storage._store(receipt)  # pylint: disable=protected-access
+        for receipt in share:
+            storage.get_receipt_points(receipt.receipt_id)
+
+    threads = [threading.Thread(target=worker, args=(share,)) for share in shares]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    start.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    assert len(storage) == len(receipts)
+    return len(receipts) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--backend', default='concurrent')
+    parser.add_argument('--receipts', type=int, default=200_000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    receipts = [Receipt(**input_data) for input_data in synthetic_receipts(args.receipts)]
+    for thread_count in args.threads:
+        rate = run(args.backend, thread_count, receipts)
+        print(f"{args.backend:>10} {thread_count:>3} threads: {rate:12,.0f} receipts/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Bytes per stored receipt for every storage backend.
+
+    python -m benchmarks.storage_memory --sizes 1000000 10000000
+
+Every measurement runs in a fresh process and reports the growth of its resident
+set size (Linux /proc/self/statm) while the storage is filled.
+"""
+import argparse
+import gc
+import multiprocessing
+import os
+import tempfile
+import time
+
+from src.config import Config
+from src.model.receipt import Receipt
+from src.shared_receipt_storage import SharedReceiptStorage
+from src.storage_factory import STORAGE_BACKENDS, create_receipt_storage
+from benchmarks.generators import synthetic_receipts
+
+
+def resident_bytes():
+    with open('/proc/self/statm', encoding='ascii') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def new_shared_storage(capacity):
+    """
+    A shared storage for capacity receipts on a store file of its own: the default path would be
+    reattached, with the receipts of earlier runs in it. discard_storage removes the file.
+    """
+    descriptor, path = tempfile.mkstemp(prefix='receipt-benchmark-',
+                                        dir=os.path.dirname(Config.SHARED_STORE_PATH))
+    os.close(descriptor)
+    return SharedReceiptStorage(path, capacity=capacity)
+
+
+def discard_storage(storage):
+    """Closes a shared storage and removes its store file; other storages are left to gc."""
+    if isinstance(storage, SharedReceiptStorage):
+        storage.close()
+        os.remove(storage.path)
+
+
+def fill(backend, size):
+    gc.collect()
+    baseline = resident_bytes()
+    storage = new_shared_storage(size) if backend == 'shared' else create_receipt_storage(backend)
+    started = time.perf_counter()
+    for input_data in synthetic_receipts(size):
+        storage._store(Receipt(**input_data))  # pylint: disable=protected-access
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    result = {'backend': backend, 'receipts': len(storage),
+              'bytes_per_receipt': (resident_bytes() - baseline) / size, 'fill_seconds': elapsed}
+    discard_storage(storage)
+    return result
+
+
+def measure(backend, size):
+    with multiprocessing.Pool(1) as pool:
+        return pool.apply(fill, (backend, size))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000])
+    parser.add_argument('--backends', nargs='+', default=sorted(STORAGE_BACKENDS))
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        for backend in args.backends:
+            result = measure(backend, size)
+            print(f"{result['backend']:>10} {result['receipts']:>10} receipts: "
+                  f"{result['bytes_per_receipt']:8.1f} bytes/receipt "
+                  f"(filled in {result['fill_seconds']:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
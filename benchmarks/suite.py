@@ -0,0 +1,261 @@
+"""
+Benchmark suite: model, storage and HTTP layer timings plus memory per receipt, as JSON.
+
+    python -m benchmarks.suite run --output baseline.json
+    python -m benchmarks.suite run --output current.json --layers model storage
+    python -m benchmarks.suite compare baseline.json current.json --threshold 0.10
+
+Every result is lower-is-better (ns/op or bytes/receipt); timings are the best of --repeat runs.
+compare lists every shared result with its change and exits with status 1 when any of them
+regressed past the threshold.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from src.model.points_calculator import PointsCalculator
+from src.model.receipt import Receipt
+from src.storage_factory import STORAGE_BACKENDS
+from src.sqlite_receipt_storage import SqliteReceiptStorage
+from benchmarks.generators import synthetic_receipts
+from benchmarks import storage_memory
+
+NS_PER_OP = 'ns/op'
+BYTES_PER_RECEIPT = 'bytes/receipt'
+ITEM_COUNTS = (2, 10, 50)
+RETAILER_LENGTHS = (12, 64)
+DUPLICATE_RATIO = 0.1
+HTTP_BATCH_SIZE = 100
+
+
+def best_ns(run, count, repeat, setup=None, teardown=None):
+    """
+    Best wall time of repeat calls of run(setup()), in ns per each of the count operations;
+    teardown gets every setup() result once it is timed.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        started = time.perf_counter_ns()
+        run(state)
+        best = min(best, time.perf_counter_ns() - started)
+        if teardown is not None:
+            teardown(state)
+    return best / count
+
+
+def model_cases(size, repeat):
+    for items in ITEM_COUNTS:
+        for retailer_length in RETAILER_LENGTHS:
+            inputs = list(synthetic_receipts(size, items=(items, items),
+                                             retailer_length=retailer_length))
+            yield (f'model.receipt_from_input[items={items},retailer={retailer_length}]',
+                   best_ns(lambda _, inputs=inputs: [Receipt.from_input(data)
+                                                     for data in inputs],
+                           size, repeat), NS_PER_OP)
+
+        receipts = [Receipt.from_input(data)
+                    for data in synthetic_receipts(size, items=(items, items))]
+        yield (f'model.calculate_points[items={items}]',
+               best_ns(lambda _, receipts=receipts: [PointsCalculator.calculate_points(r)
+                                                     for r in receipts],
+                       size, repeat), NS_PER_OP)
+        yield (f'model.calculate_points_batch[items={items}]',
+               best_ns(lambda _, receipts=receipts:
+                       PointsCalculator.calculate_points_batch(receipts),
+                       size, repeat), NS_PER_OP)
+
+    # a retailer per receipt, new to the rule memo (reset before every run): the scalar rules count
+    # the characters of every retailer, the batch path counts them all in one numpy pass
+    receipts = [Receipt.from_input(data) for data in synthetic_receipts(
+        size, retailer_length=RETAILER_LENGTHS[-1], retailer_count=size)]
+    yield ('model.calculate_points[retailers=distinct]',
+           best_ns(lambda _: [PointsCalculator.calculate_points(r) for r in receipts],
+                   size, repeat, setup=PointsCalculator.reset_rules), NS_PER_OP)
+    yield ('model.calculate_points_batch[retailers=distinct]',
+           best_ns(lambda _: PointsCalculator.calculate_points_batch(receipts),
+                   size, repeat, setup=PointsCalculator.reset_rules), NS_PER_OP)
+
+
+def storage_cases(size, repeat):
+    inputs = list(synthetic_receipts(size, duplicate_ratio=DUPLICATE_RATIO))
+    receipts = [Receipt.from_input(data) for data in inputs]
+    with tempfile.TemporaryDirectory() as directory:
+        def new_storage(backend):
+            if backend == 'sqlite':
+                return SqliteReceiptStorage(os.path.join(directory, f'{time.time_ns()}.db'))
+            if backend == 'shared':
+                return storage_memory.new_shared_storage(size)
+            return STORAGE_BACKENDS[backend]()
+
+        for backend in sorted(STORAGE_BACKENDS):
+            yield (f'storage.{backend}.store_receipts[duplicates={DUPLICATE_RATIO}]',
+                   best_ns(lambda storage: storage.store_receipts(receipts), size, repeat,
+                           setup=lambda backend=backend: new_storage(backend),
+                           teardown=storage_memory.discard_storage), NS_PER_OP)
+            yield (f'storage.{backend}.process_receipt[duplicates={DUPLICATE_RATIO}]',
+                   best_ns(lambda storage: _process_all(storage, inputs), size, repeat,
+                           setup=lambda backend=backend: new_storage(backend),
+                           teardown=storage_memory.discard_storage), NS_PER_OP)
+
+            storage = new_storage(backend)
+            receipt_ids = [outcome for outcome in storage.store_receipts(receipts)
+                           if isinstance(outcome, str)]
+            for name in ('get_receipt_points', 'get_receipt_dict'):
+                read = getattr(storage, name)
+                yield (f'storage.{backend}.{name}',
+                       best_ns(lambda _, read=read, receipt_ids=receipt_ids:
+                               [read(receipt_id) for receipt_id in receipt_ids],
+                               len(receipt_ids), repeat), NS_PER_OP)
+            yield (f'storage.{backend}.is_duplicate',
+                   best_ns(lambda _, storage=storage: [storage.is_duplicate(r) for r in receipts],
+                           size, repeat), NS_PER_OP)
+            storage_memory.discard_storage(storage)
+
+
+def _process_all(storage, inputs):
+    for input_data in inputs:
+        try:
+            storage.process_receipt(input_data)
+        except Exception:  # pylint: disable=broad-except
+            pass  # duplicates
+
+
+def http_cases(size, repeat):
+    # the app logs every request (and every duplicate as an error), that is not what is measured
+    logging.disable(logging.CRITICAL)
+    from src import receipt_app  # pylint: disable=import-outside-toplevel
+    client = receipt_app.app.test_client()
+    storage = receipt_app.receipt_storage
+    inputs = list(synthetic_receipts(size, duplicate_ratio=DUPLICATE_RATIO))
+
+    def post_all(_):
+        for input_data in inputs:
+            client.post('/receipts/process', json=input_data)
+
+    yield (f'http.flask.process_receipt[duplicates={DUPLICATE_RATIO}]',
+           best_ns(post_all, size, repeat, setup=storage.clear), NS_PER_OP)
+
+    def post_batches(_):
+        for start in range(0, size, HTTP_BATCH_SIZE):
+            client.post('/receipts/process/batch', json=inputs[start:start + HTTP_BATCH_SIZE])
+
+    yield (f'http.flask.process_batch[size={HTTP_BATCH_SIZE}]',
+           best_ns(post_batches, size, repeat, setup=storage.clear), NS_PER_OP)
+
+    storage.clear()
+    receipt_ids = [client.post('/receipts/process', json=data).json.get('id') for data in inputs]
+    receipt_ids = [receipt_id for receipt_id in receipt_ids if receipt_id]
+    for name, path in (('get_points', '/receipts/{}/points'), ('view_receipt', '/receipts/{}')):
+        yield (f'http.flask.{name}',
+               best_ns(lambda _, path=path: [client.get(path.format(receipt_id))
+                                             for receipt_id in receipt_ids],
+                       len(receipt_ids), repeat), NS_PER_OP)
+    storage.clear()
+    logging.disable(logging.NOTSET)
+
+
+def memory_cases(size, _repeat):
+    # sqlite keeps receipts on disk, its resident size says nothing about the receipts
+    for backend in sorted(set(STORAGE_BACKENDS) - {'sqlite'}):
+        result = storage_memory.measure(backend, size)
+        yield f'memory.{backend}', result['bytes_per_receipt'], BYTES_PER_RECEIPT
+
+
+LAYERS = {
+    'model': model_cases,
+    'storage': storage_cases,
+    'http': http_cases,
+    'memory': memory_cases,
+}
+
+
+def run(layers, size, repeat, memory_size):
+    results = {}
+    for layer in layers:
+        layer_size = memory_size if layer == 'memory' else size
+        for name, value, unit in LAYERS[layer](layer_size, repeat):
+            results[name] = {'value': round(value, 1), 'unit': unit}
+            print(f"{name:<64} {value:14,.1f} {unit}", file=sys.stderr)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'size': size,
+            'memory_size': memory_size,
+            'repeat': repeat,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold):
+    """Returns (report lines, regressed names); a result regressed when it grew past threshold."""
+    lines = []
+    regressed = []
+    for name in sorted(set(baseline['results']) | set(current['results'])):
+        if name not in current['results'] or name not in baseline['results']:
+            side = 'baseline' if name in baseline['results'] else 'current'
+            lines.append(f"{name:<64} only in {side}")
+            continue
+        before = baseline['results'][name]['value']
+        after = current['results'][name]['value']
+        change = after / before - 1 if before else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressed.append(name)
+        elif change < -threshold:
+            flag = '  improved'
+        lines.append(f"{name:<64} {before:14,.1f} -> {after:14,.1f} "
+                     f"{current['results'][name]['unit']:<14} {change:+7.1%}{flag}")
+    return lines, regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='run the benchmarks, write JSON results')
+    run_parser.add_argument('--layers', nargs='+', choices=sorted(LAYERS), default=list(LAYERS))
+    run_parser.add_argument('--size', type=int, default=5000, help='receipts per timing')
+    run_parser.add_argument('--memory-size', type=int, default=200_000,
+                            help='receipts stored per memory measurement')
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--output', help='JSON file, stdout when omitted')
+
+    compare_parser = commands.add_parser('compare', help='compare two JSON results')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10,
+                                help='relative growth reported as a regression')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        results = run(args.layers, args.size, args.repeat, args.memory_size)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as output:
+                json.dump(results, output, indent=2)
+        else:
+            json.dump(results, sys.stdout, indent=2)
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as baseline_file, \
+            open(args.current, encoding='utf-8') as current_file:
+        lines, regressed = compare(json.load(baseline_file), json.load(current_file),
+                                   args.threshold)
+    print('\n'.join(lines))
+    if regressed:
+        print(f"{len(regressed)} regression(s) past {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,23 @@
+"""
+gunicorn settings: pre-forked workers serving one data set through the 'shared' storage backend.
+
+    gunicorn --config gunicorn.conf.py src.receipt_app:app
+"""
+# gunicorn reads its settings from lowercase module-level names
+# pylint: disable=invalid-name
+import multiprocessing
+import os
+
+# before src.config is imported: Config reads the environment once
+os.environ.setdefault('RECEIPT_STORAGE_BACKEND', 'shared')
+
+from src.config import Config  # pylint: disable=wrong-import-position
+
+bind = f'{Config.HOST}:{Config.PORT}'
+workers = int(os.environ.get('RECEIPT_WORKERS', str(multiprocessing.cpu_count())))
+
+
+def on_starting(server):  # pylint: disable=unused-argument
+    """Every server start begins empty, like the single process app; restarted workers reattach."""
+    if Config.STORAGE_BACKEND == 'shared' and os.path.exists(Config.SHARED_STORE_PATH):
+        os.remove(Config.SHARED_STORE_PATH)
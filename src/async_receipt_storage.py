@@ -0,0 +1,50 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from src.config import Config
+
+
+class AsyncReceiptStorage:
+    """
+    Async interface over a BaseReceiptStorage for the ASGI app.
+    In-memory engines are called directly (they never wait on I/O); engines doing disk I/O
+    (blocking engines or any engine writing a durable log) run in a thread pool,
+    so they never block the event loop.
+    """
+    def __init__(self, storage, executor=None):
+        self.storage = storage
+        self._executor = executor
+        self._owns_executor = False
+
+    @property
+    def offloaded(self):
+        return self.storage.blocking or self.storage.log is not None
+
+    async def _call(self, method, *args):
+        if not self.offloaded:
+            return method(*args)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=Config.ASYNC_STORAGE_THREADS,
+                                                thread_name_prefix='receipt-storage')
+            self._owns_executor = True
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(method, *args))
+
+    async def process_receipt(self, input_data):
+        return await self._call(self.storage.process_receipt, input_data)
+
+    async def process_receipts(self, input_items):
+        return await self._call(self.storage.process_receipts, input_items)
+
+    async def get_receipt_points(self, receipt_id):
+        return await self._call(self.storage.get_receipt_points, receipt_id)
+
+    async def get_receipt_dict(self, receipt_id):
+        return await self._call(self.storage.get_receipt_dict, receipt_id)
+
+    def close(self):
+        if self._owns_executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._owns_executor = False
@@ -0,0 +1,224 @@
+"""
+Memory-bounded in-memory storage: ReceiptStorage with a byte budget and an eviction policy.
+Evicted receipts optionally spill to an on-disk SqliteReceiptStorage and are faulted back in
+when read; duplicates of evicted receipts are rejected either way.
+"""
+import datetime
+import heapq
+import threading
+from collections import OrderedDict
+
+from src.config import Config
+from src.model.receipt import RECEIPT_ID_NAME
+from src.duplicate_index import DuplicateIndex
+from src.receipt_storage import BaseReceiptStorage, ReceiptStorage
+from src.sqlite_receipt_storage import SqliteReceiptStorage
+from src.exceptions import ReceiptNotFound
+
+EVICTION_LRU = 'lru'
+EVICTION_TTL = 'ttl'
+EVICTION_AGE = 'age'
+EVICTION_POLICIES = (EVICTION_LRU, EVICTION_TTL, EVICTION_AGE)
+# a full budget is evicted down to this share of it, so evictions (and spills) come in batches
+EVICT_TO_RATIO = 0.9
+
+# record_bytes estimates of what metrics.deep_sizeof measures (CPython 3.x, 64-bit):
+# record dict with its id string, datetime and ints, items list
+RECORD_BYTES = 560
+# item dict with its price, plus its items list slot
+ITEM_BYTES = 220
+# str object header, per retailer and description
+STR_BYTES = 49
+# entry of the receipt map and eviction order, identifier key
+INDEX_BYTES = 200
+
+
+def record_bytes(record):
+    """Approximate memory taken by a stored record and its index entries."""
+    return (RECORD_BYTES + INDEX_BYTES + STR_BYTES + len(record["retailer"])
+            + sum(ITEM_BYTES + STR_BYTES + len(item["shortDescription"])
+                  for item in record["items"]))
+
+
+class BoundedReceiptStorage(ReceiptStorage):
+    """
+    ReceiptStorage keeping at most max_bytes of receipts (as estimated by record_bytes) in memory.
+    Over budget, receipts are evicted by policy: 'lru' the least recently stored or read,
+    'age' the earliest stored, 'ttl' the earliest purchased; with 'ttl' receipts purchased
+    more than ttl_days ago are evicted even under budget.
+
+    With spill_path, evicted receipts are moved to an SQLite database there (cleared on start,
+    durability is the receipt log's job) and get_receipt / get_receipt_points fault them back in.
+    Without it evicted receipts are dropped but their identifiers are kept,
+    so is_duplicate stays exact either way.
+    hits, misses, faults (misses served from the spill) and evictions count reads and evictions.
+    Not indexable: a ReceiptIndex keeps every receipt ever stored, outside of max_bytes.
+    Exports can not be resumed: evictions and LRU reads reorder the receipts under a cursor.
+    """
+    indexable = False
+    resumable_export = False
+    COUNTERS = {
+        'hits': 'Receipt reads served from memory.',
+        'misses': 'Receipt reads not in memory.',
+        'faults': 'Receipt reads faulted back in from the spill database.',
+        'evictions': 'Receipts evicted from memory.',
+    }
+
+    def __init__(self, max_bytes=None, policy=None, ttl_days=None, spill_path=None):
+        super().__init__()
+        self.max_bytes = Config.STORAGE_MAX_BYTES if max_bytes is None else max_bytes
+        self.policy = policy or Config.EVICTION_POLICY
+        if self.policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy '{self.policy}', "
+                             f"expected one of {EVICTION_POLICIES}")
+        self.ttl = datetime.timedelta(
+            days=Config.RECEIPT_TTL_DAYS if ttl_days is None else ttl_days)
+        spill_path = spill_path or Config.SPILL_PATH
+
+        # resident receipts in eviction order (lru, age); ttl evicts from a purchase time heap
+        self.receipt_storage = OrderedDict()
+        self._purchases = []
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+        self.spill = None
+        # resident receipts that have a copy in the spill database (faulted in)
+        self._on_disk = set()
+        self._spilled = 0
+        if spill_path:
+            self.spill = SqliteReceiptStorage(spill_path)
+            self.spill.clear()
+        # evictions write to the spill database and misses read from it
+        self.blocking = self.spill is not None
+        # identifiers of dropped receipts when there is no spill database
+        self.evicted_identifiers = DuplicateIndex(self.receipt_identifier.retailers)
+
+        self.hits = 0
+        self.misses = 0
+        self.faults = 0
+        self.evictions = 0
+
+    def is_duplicate(self, receipt):
+        key = self.receipt_identifier.key(receipt.retailer, receipt.purchase_date_time)
+        if key is not None and (self.receipt_identifier.contains_key(key)
+                                or self.evicted_identifiers.contains_key(key)):
+            return True
+        return bool(self._spilled) and self.spill.is_duplicate(receipt)
+
+    def _store(self, receipt):
+        self._store_record(receipt.to_dict())
+
+    def _store_record(self, record):
+        with self._lock:
+            self._admit(record)
+
+    def _admit(self, record):
+        """Makes room for record, then makes it resident (it is never evicted on its way in)."""
+        size = record_bytes(record)
+        self._evict_due(size)
+        receipt_id = record[RECEIPT_ID_NAME]
+        self.receipt_storage[receipt_id] = record
+        self.receipt_identifier.add(record["retailer"], record["purchaseDateTime"])
+        if self.policy == EVICTION_TTL:
+            heapq.heappush(self._purchases, (record["purchaseDateTime"], receipt_id))
+        self._bytes += size
+
+    def _evict_due(self, incoming_bytes):
+        victims = []
+        if self.policy == EVICTION_TTL:
+            expired = datetime.datetime.now() - self.ttl
+            while self._purchases and self._purchases[0][0] < expired:
+                victims.append(self._pop_victim())
+        if self._bytes + incoming_bytes > self.max_bytes:
+            target = self.max_bytes * EVICT_TO_RATIO - incoming_bytes
+            while self._bytes > target and self.receipt_storage:
+                victims.append(self._pop_victim())
+        if victims:
+            self._evict(victims)
+
+    def _pop_victim(self):
+        if self.policy == EVICTION_TTL:
+            _, receipt_id = heapq.heappop(self._purchases)
+            record = self.receipt_storage.pop(receipt_id)
+        else:
+            receipt_id, record = self.receipt_storage.popitem(last=False)
+        self.receipt_identifier.discard(record["retailer"], record["purchaseDateTime"])
+        self._bytes -= record_bytes(record)
+        return record
+
+    def _evict(self, records):
+        self.evictions += len(records)
+        if self.spill is None:
+            for record in records:
+                self.evicted_identifiers.add(record["retailer"], record["purchaseDateTime"])
+            return
+        new = []
+        for record in records:
+            if record[RECEIPT_ID_NAME] in self._on_disk:
+                self._on_disk.discard(record[RECEIPT_ID_NAME])
+            else:
+                new.append(record)
+        if new:
+            self.spill.store_records(new)
+            self._spilled += len(new)
+
+    def get_receipt(self, receipt_id):
+        with self._lock:
+            record = self.receipt_storage.get(receipt_id)
+            if record is not None:
+                self.hits += 1
+                if self.policy == EVICTION_LRU:
+                    self.receipt_storage.move_to_end(receipt_id)
+                return record
+
+            self.misses += 1
+            if not self._spilled:
+                raise ReceiptNotFound(receipt_id)
+            record = self.spill.get_receipt(receipt_id)
+            self.faults += 1
+            self._admit(record)
+            self._on_disk.add(receipt_id)
+            return record
+
+    def get_receipt_points(self, receipt_id):
+        return self.get_receipt(receipt_id)["points"]
+
+    # receipt by receipt: reads refresh the LRU order and fault evicted receipts in
+    get_many = BaseReceiptStorage.get_many
+    get_many_points = BaseReceiptStorage.get_many_points
+    # positions count iter_receipts from its start; evictions and LRU reads reorder it, so they
+    # only hold within one walk (resumable_export is False)
+    iter_positions = BaseReceiptStorage.iter_positions
+
+    def is_in(self, receipt_id):
+        return (receipt_id in self.receipt_storage
+                or (bool(self._spilled) and self.spill.is_in(receipt_id)))
+
+    def iter_receipts(self):
+        with self._lock:
+            resident = list(self.receipt_storage.values())
+        yield from resident
+        if self._spilled:
+            # faulted in receipts are on disk too, they were yielded as resident ones
+            resident_ids = {record[RECEIPT_ID_NAME] for record in resident}
+            for record in self.spill.iter_receipts():
+                if record[RECEIPT_ID_NAME] not in resident_ids:
+                    yield record
+
+    def approximate_bytes(self):
+        """Estimated bytes of the resident receipts plus the identifiers of dropped ones."""
+        return self._bytes + self.evicted_identifiers.approximate_bytes()
+
+    def _clear(self):
+        with self._lock:
+            super()._clear()
+            self._purchases.clear()
+            self._bytes = 0
+            self._on_disk.clear()
+            self.evicted_identifiers.clear()
+            if self.spill is not None:
+                self.spill.clear()
+            self._spilled = 0
+
+    def __len__(self):
+        return len(self.receipt_storage) - len(self._on_disk) + self._spilled
@@ -0,0 +1,175 @@
+"""
+Bulk import of NDJSON receipt files (one receipt input per line, as POSTed to /receipts/process).
+
+    python -m src.bulk_import receipts.ndjson --workers 8 --backend compact --data-dir data
+
+The file is never loaded whole: it is split into byte ranges aligned on line boundaries,
+worker processes read, parse and score one range each, and the parent stores every range's
+receipts in one batch (duplicates are resolved in file order, the first receipt wins).
+With a data directory the receipts are logged in those batches and a snapshot is written at the end.
+"""
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from src.config import Config
+from src.exceptions import ReceiptIsDuplicate
+from src.model.receipt import Receipt
+from src.persistence import ReceiptLog, FSYNC_NEVER
+from src.storage_factory import STORAGE_BACKENDS
+
+CHUNK_BYTES = 8 * 1024 * 1024
+REJECT_SAMPLES = 10
+PROGRESS_INTERVAL_S = 5
+# ranges parsed ahead of the one being stored, per worker
+READ_AHEAD = 2
+
+
+class ImportStats:  # pylint: disable=too-few-public-methods
+    """Counters of one import; rejects holds up to REJECT_SAMPLES (byte offset, message) pairs."""
+    def __init__(self):
+        self.rows = 0
+        self.stored = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self.rejects = []
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        elapsed = self.elapsed
+        return (f"{self.rows:,} rows in {elapsed:.1f}s ({self.rows / elapsed:,.0f} rows/s): "
+                f"{self.stored:,} stored, {self.rejected:,} rejected, "
+                f"{self.duplicates:,} duplicates")
+
+
+def iter_ranges(path, chunk_bytes=CHUNK_BYTES):
+    """Yields (start, end) byte ranges of path, each ending right after a newline (or at EOF)."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as file:
+        start = 0
+        while start < size:
+            file.seek(min(start + chunk_bytes, size))
+            file.readline()  # moves to the end of the line the boundary falls into
+            end = min(file.tell(), size)
+            yield start, end
+            start = end
+
+
+def parse_range(task):
+    """
+    Worker: reads, parses and scores the lines of one byte range.
+    Returns (rows, receipts, rejects) with rejects as (byte offset, message) pairs.
+    """
+    path, start, end = task
+    with open(path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+
+    rows = 0
+    receipts = []
+    rejects = []
+    offset = start
+    for line in data.splitlines(keepends=True):
+        line_offset = offset
+        offset += len(line)
+        if not line.strip():
+            continue
+        rows += 1
+        try:
+            receipts.append(Receipt.from_input(json.loads(line)))
+        except Exception as e:  # pylint: disable=broad-except
+            rejects.append((line_offset, str(e)))
+    return rows, receipts, rejects
+
+
+def _parsed_ranges(tasks, pool, workers):
+    """
+    parse_range results in file order (so duplicates resolve in file order too), with at most
+    READ_AHEAD ranges per worker in flight so results never pile up when storing is the bottleneck.
+    """
+    if pool is None:
+        yield from map(parse_range, tasks)
+        return
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(pool.apply_async(parse_range, (task,)))
+        if len(pending) >= workers * READ_AHEAD:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def import_file(path, storage, workers=None, chunk_bytes=CHUNK_BYTES, progress=None):
+    """
+    Imports the NDJSON file at path into storage, returns ImportStats.
+    workers=1 parses in this process; progress(stats) is called every PROGRESS_INTERVAL_S.
+    """
+    workers = workers or os.cpu_count()
+    stats = ImportStats()
+    tasks = ((path, start, end) for start, end in iter_ranges(path, chunk_bytes))
+
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        reported = stats.started
+        for rows, receipts, rejects in _parsed_ranges(tasks, pool, workers):
+            stats.rows += rows
+            stats.rejected += len(rejects)
+            stats.rejects.extend(rejects[:REJECT_SAMPLES - len(stats.rejects)])
+            for outcome in storage.store_receipts(receipts):
+                if isinstance(outcome, ReceiptIsDuplicate):
+                    stats.duplicates += 1
+                else:
+                    stats.stored += 1
+
+            if progress is not None and time.perf_counter() - reported >= PROGRESS_INTERVAL_S:
+                reported = time.perf_counter()
+                progress(stats)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('path', help='NDJSON file, one receipt per line')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='parsing processes, 1 parses in the importing process')
+    parser.add_argument('--chunk-mb', type=float, default=CHUNK_BYTES / 1024 / 1024,
+                        help='size of the byte range parsed (and stored) as one batch')
+    parser.add_argument('--backend', default=Config.STORAGE_BACKEND,
+                        choices=sorted(STORAGE_BACKENDS))
+    parser.add_argument('--data-dir', default=Config.DATA_DIR,
+                        help='receipt log directory: existing receipts are recovered first, '
+                             'a snapshot is written at the end')
+    args = parser.parse_args(argv)
+
+    storage = STORAGE_BACKENDS[args.backend]()
+    if args.data_dir:
+        # the final snapshot is what makes the import durable, no fsync per batch
+        storage.recover(ReceiptLog(args.data_dir, fsync_policy=FSYNC_NEVER, snapshot_every=0))
+
+    stats = import_file(args.path, storage, args.workers, int(args.chunk_mb * 1024 * 1024),
+                        progress=lambda stats: print(stats.summary(), file=sys.stderr))
+    if args.data_dir:
+        print(f"snapshot of {storage.snapshot():,} receipts written to {args.data_dir}",
+              file=sys.stderr)
+        storage.log.close()
+
+    print(stats.summary())
+    for offset, message in stats.rejects:
+        print(f"  rejected line at byte {offset}: {message}")
+    return stats
+
+
+if __name__ == '__main__':
+    main()
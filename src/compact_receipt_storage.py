@@ -0,0 +1,175 @@
+import sys
+import threading
+from array import array
+
+from src.model.receipt import (Receipt, RECEIPT_ID_NAME, datetime_to_minutes,
+                               minutes_to_datetime)
+from src.model.receipt_ids import format_receipt_id, parse_receipt_id
+from src.persistence import SnapshotTable
+from src.duplicate_index import DuplicateIndex, StringPool, identifier_key
+from src.receipt_storage import BaseReceiptStorage
+from src.exceptions import ReceiptNotFound
+
+
+class CompactReceiptStorage(BaseReceiptStorage):
+    """
+    Columnar in-memory storage: every receipt is a row across typed arrays,
+    retailers and item descriptions are interned, items live in a side table
+    addressed by per-row offsets. Receipt dicts are built on demand only.
+    Rows are appended under a writer lock and published in rows once complete,
+    reads take no locks.
+    """
+    def __init__(self):
+        # receipt id (as 128-bit int) -> row
+        self.rows = {}
+        self.id_high = array('Q')
+        self.id_low = array('Q')
+        self.retailer = array('I')
+        self.purchase_minutes = array('q')
+        # money columns hold integer cents
+        self.total = array('q')
+        self.points = array('q')
+        # items of row r are item_* [item_offset[r]:item_offset[r + 1]]
+        self.item_offset = array('Q', [0])
+        self.item_description = array('I')
+        self.item_price = array('q')
+
+        self.retailers = StringPool()
+        self.descriptions = StringPool()
+        # retailer index + purchase minute packed in one int
+        self.receipt_identifier = DuplicateIndex(self.retailers)
+        self._lock = threading.Lock()
+
+    def is_duplicate(self, receipt):
+        return self.receipt_identifier.contains(receipt.retailer, receipt.purchase_date_time)
+
+    def _store(self, receipt):
+        id_int = receipt.id_int
+        with self._lock:
+            retailer = self.retailers.add(receipt.retailer)
+            minutes = datetime_to_minutes(receipt.purchase_date_time)
+            key = identifier_key(retailer, minutes)
+            if self.receipt_identifier.contains_key(key):
+                raise self.duplicate_error(
+                    (receipt.retailer, Receipt.format_receipt_date(receipt.purchase_date_time)))
+
+            row = len(self.total)
+            self.id_high.append(id_int >> 64)
+            self.id_low.append(id_int & 0xFFFFFFFFFFFFFFFF)
+            self.retailer.append(retailer)
+            self.purchase_minutes.append(minutes)
+            self.total.append(receipt.total)
+            self.points.append(receipt.points)
+            for item in receipt.items:
+                self.item_description.append(self.descriptions.add(item["shortDescription"]))
+                self.item_price.append(item["price"])
+            self.item_offset.append(len(self.item_price))
+
+            # every column holds the row now: publish it
+            self.rows[id_int] = row
+            self.receipt_identifier.add_key(key)
+
+    def _store_record(self, record):
+        self._store(Receipt.from_record(record))
+
+    def _row(self, receipt_id):
+        row = self.rows.get(parse_receipt_id(receipt_id))
+        if row is None:
+            raise ReceiptNotFound(receipt_id)
+        return row
+
+    def _receipt_id(self, row):
+        return format_receipt_id((self.id_high[row] << 64) | self.id_low[row])
+
+    def get_receipt(self, receipt_id):
+        return self._row_dict(self._row(receipt_id))
+
+    def _row_dict(self, row):
+        start, end = self.item_offset[row], self.item_offset[row + 1]
+        return {
+            RECEIPT_ID_NAME: self._receipt_id(row),
+            "retailer": self.retailers[self.retailer[row]],
+            "purchaseDateTime": minutes_to_datetime(self.purchase_minutes[row]),
+            "total": self.total[row],
+            "items": [
+                {"shortDescription": self.descriptions[description], "price": price}
+                for description, price in zip(self.item_description[start:end],
+                                              self.item_price[start:end])
+            ],
+            "points": self.points[row],
+        }
+
+    def get_receipt_points(self, receipt_id):
+        return self.points[self._row(receipt_id)]
+
+    def is_in(self, receipt_id):
+        return parse_receipt_id(receipt_id) in self.rows
+
+    def snapshot_table(self):
+        # rows are append-only: columns cut at the complete row count are a consistent copy
+        rows = len(self.item_offset) - 1
+        items = self.item_offset[rows]
+        table = SnapshotTable()
+        for name in SnapshotTable.COLUMNS:
+            if name == 'item_offset':
+                limit = rows + 1
+            elif name.startswith('item_'):
+                limit = items
+            else:
+                limit = rows
+            setattr(table, name, getattr(self, name)[:limit])
+        table.retailers = self.retailers.strings[:]
+        table.descriptions = self.descriptions.strings[:]
+        return table
+
+    def restore_table(self, table):
+        if len(self):
+            super().restore_table(table)
+            return
+
+        # the table columns have the storage layout already, they are adopted as they are
+        for name in SnapshotTable.COLUMNS:
+            setattr(self, name, getattr(table, name))
+        self.retailers.load(table.retailers)
+        self.descriptions.load(table.descriptions)
+        self.rows = {(high << 64) | low: row
+                     for row, (high, low) in enumerate(zip(self.id_high, self.id_low))}
+        self.receipt_identifier.load_keys(
+            identifier_key(retailer, minutes)
+            for retailer, minutes in zip(self.retailer, self.purchase_minutes))
+
+    def iter_receipts(self):
+        # a row is complete once its closing item offset is appended
+        for row in range(len(self.item_offset) - 1):
+            yield self._row_dict(row)
+
+    def iter_positions(self, cursor=0):
+        # positions are rows, which are append-only
+        for row in range(cursor, len(self.item_offset) - 1):
+            yield row + 1, self._row_dict(row)
+
+    def approximate_bytes(self):
+        """Column buffers plus the id and identifier indexes and the string pools."""
+        columns = sum(column.buffer_info()[1] * column.itemsize for column in (
+            self.id_high, self.id_low, self.retailer, self.purchase_minutes, self.total,
+            self.points, self.item_offset, self.item_description, self.item_price))
+        # index keys are ints of up to 128 bits, pool strings are short
+        indexes = (sys.getsizeof(self.rows) + 36 * len(self.rows)
+                   + self.receipt_identifier.approximate_bytes())
+        pools = sum(sys.getsizeof(pool.index) + sum(map(sys.getsizeof, pool.strings))
+                    for pool in (self.retailers, self.descriptions))
+        return columns + indexes + pools
+
+    def _clear(self):
+        with self._lock:
+            self.rows.clear()
+            for column in (self.id_high, self.id_low, self.retailer, self.purchase_minutes,
+                           self.total, self.points, self.item_description, self.item_price):
+                del column[:]
+            del self.item_offset[1:]
+            self.retailers.clear()
+            self.descriptions.clear()
+            self.receipt_identifier.clear()
+
+    def __len__(self):
+        return len(self.rows)
@@ -0,0 +1,92 @@
+import threading
+
+from src.config import Config
+from src.model.receipt import Receipt, RECEIPT_ID_NAME
+from src.receipt_storage import BaseReceiptStorage
+from src.exceptions import ReceiptNotFound
+
+# iter_positions: shard * SHARD_POSITIONS + the receipts walked in the shard
+SHARD_POSITIONS = 1 << 40
+
+
+class ConcurrentReceiptStorage(BaseReceiptStorage):
+    """
+    Thread-safe storage for multi-threaded servers.
+    Both maps are split into shards by key hash, each shard has its own lock.
+    The duplicate check and the identifier insert happen under one shard lock,
+    so two identical receipts can not both be stored. Reads take no locks.
+    """
+    def __init__(self, shard_count=None):
+        self.shard_count = shard_count or Config.STORAGE_SHARDS
+        self.receipt_shards = [{} for _ in range(self.shard_count)]
+        self.receipt_locks = [threading.Lock() for _ in range(self.shard_count)]
+        self.identifier_shards = [{} for _ in range(self.shard_count)]
+        self.identifier_locks = [threading.Lock() for _ in range(self.shard_count)]
+
+    def _receipt_shard(self, receipt_id):
+        return hash(receipt_id) % self.shard_count
+
+    def _identifier_shard(self, identifier):
+        return hash(identifier) % self.shard_count
+
+    def is_duplicate(self, receipt):
+        # minute precision datetimes identify receipts like their formatted form, without strftime
+        identifier = (receipt.retailer, receipt.purchase_date_time)
+        return identifier in self.identifier_shards[self._identifier_shard(identifier)]
+
+    def _store(self, receipt):
+        self._insert((receipt.retailer, receipt.purchase_date_time), receipt.receipt_id,
+                     receipt.to_dict())
+
+    def _store_record(self, record):
+        self._insert((record["retailer"], record["purchaseDateTime"]), record[RECEIPT_ID_NAME],
+                     record)
+
+    def _insert(self, identifier, receipt_id, record):
+        shard = self._identifier_shard(identifier)
+        with self.identifier_locks[shard]:
+            identifiers = self.identifier_shards[shard]
+            if identifier in identifiers:
+                retailer, purchase_date_time = identifier
+                raise self.duplicate_error(
+                    (retailer, Receipt.format_receipt_date(purchase_date_time)))
+            identifiers[identifier] = receipt_id
+
+        shard = self._receipt_shard(receipt_id)
+        with self.receipt_locks[shard]:
+            self.receipt_shards[shard][receipt_id] = record
+
+    def get_receipt(self, receipt_id):
+        receipt = self.receipt_shards[self._receipt_shard(receipt_id)].get(receipt_id)
+        if receipt is None:
+            raise ReceiptNotFound(receipt_id)
+        return receipt
+
+    def get_receipt_points(self, receipt_id):
+        return self.get_receipt(receipt_id)["points"]
+
+    def is_in(self, receipt_id):
+        return receipt_id in self.receipt_shards[self._receipt_shard(receipt_id)]
+
+    def iter_receipts(self):
+        for shard in self.receipt_shards:
+            yield from list(shard.values())
+
+    def iter_positions(self, cursor=0):
+        # shard by shard, a shard's receipts in insertion order
+        first_shard, skip = divmod(cursor, SHARD_POSITIONS)
+        for shard in range(first_shard, self.shard_count):
+            records = list(self.receipt_shards[shard].values())
+            for index in range(skip, len(records)):
+                yield shard * SHARD_POSITIONS + index + 1, records[index]
+            skip = 0
+
+    def _clear(self):
+        for locks, shards in ((self.identifier_locks, self.identifier_shards),
+                              (self.receipt_locks, self.receipt_shards)):
+            for lock, shard in zip(locks, shards):
+                with lock:
+                    shard.clear()
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.receipt_shards)
@@ -1,12 +1,115 @@
+import os
+import tempfile
+
 class Config:
     HOST = '0.0.0.0'
     PORT = 5000
+    # upper bound on receipts accepted by a single /receipts/process/batch call
+    BATCH_MAX_SIZE = 1000
+    # upper bound on ids of a single /receipts:batchGet or /receipts/points:batchGet call
+    BATCH_GET_MAX_SIZE = 1000
+    # 'memory' keeps receipt dicts, 'bounded' receipt dicts within a memory budget,
+    # 'compact' keeps columnar arrays, 'concurrent' is lock-striped for threaded servers,
+    # 'sqlite' is on disk, 'shared' is shared memory for pre-forked workers (src/storage_factory.py)
+    STORAGE_BACKEND = os.environ.get('RECEIPT_STORAGE_BACKEND', 'memory')
+    # number of lock shards of the 'concurrent' storage backend
+    STORAGE_SHARDS = 64
+    # database file of the 'sqlite' storage backend
+    SQLITE_PATH = os.environ.get('RECEIPT_SQLITE_PATH', 'receipts.db')
+    SQLITE_CACHED_STATEMENTS = 64
+    SQLITE_BUSY_TIMEOUT_MS = 5000
+    # 'bounded' storage backend (src/bounded_receipt_storage.py): memory budget of the receipts,
+    # eviction policy past it ('lru', 'ttl' or 'age'), TTL on the purchase date-time for 'ttl'
+    # and the SQLite file evicted receipts spill to (unset = evicted receipts are dropped)
+    STORAGE_MAX_BYTES = int(os.environ.get('RECEIPT_STORAGE_MAX_BYTES', str(512 * 1024 * 1024)))
+    EVICTION_POLICY = os.environ.get('RECEIPT_EVICTION_POLICY', 'lru')
+    RECEIPT_TTL_DAYS = int(os.environ.get('RECEIPT_TTL_DAYS', '365'))
+    SPILL_PATH = os.environ.get('RECEIPT_SPILL_PATH')
+    # 'shared' storage backend (src/shared_receipt_storage.py): file every worker maps (on /dev/shm
+    # when there is one), receipts it holds and the average encoded bytes reserved per receipt.
+    # The file is created by the first process and sized when it is; delete it to resize
+    SHARED_STORE_PATH = os.environ.get(
+        'RECEIPT_SHARED_STORE_PATH',
+        os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),
+                     'receipt-store.bin'))
+    SHARED_STORE_CAPACITY = int(os.environ.get('RECEIPT_SHARED_STORE_CAPACITY', '1000000'))
+    SHARED_STORE_RECORD_BYTES = 256
+    # Bloom filter in front of the duplicate check (src/duplicate_index.py): receipts it is sized
+    # for and its false positive rate. The 'sqlite' backend (and the 'bounded' spill database)
+    # use it so new receipts skip the database lookup; 0 disables it
+    DUPLICATE_BLOOM_CAPACITY = int(os.environ.get('RECEIPT_DUPLICATE_BLOOM_CAPACITY',
+                                                  '10000000'))
+    DUPLICATE_BLOOM_ERROR_RATE = 0.01
+    # retailer and purchase date-time indexes with running totals (src/receipt_index.py) behind
+    # /receipts/search and /receipts/stats/*; without them those queries scan every receipt
+    SECONDARY_INDEXES = os.environ.get('RECEIPT_SECONDARY_INDEXES', '1') != '0'
+    # receipts per /receipts/search page: default and maximum
+    QUERY_LIMIT = 100
+    QUERY_MAX_LIMIT = 1000
+    # receipts per chunk of a streamed /receipts/export response (src/receipt_export.py)
+    EXPORT_CHUNK = 1000
+    # asynchronous ingestion (src/ingest_pipeline.py): /receipts/process validates, answers 202
+    # with the id and queues the receipt; worker threads score and store queued receipts in
+    # batches of up to INGEST_BATCH_SIZE. A full queue answers 503. Reads of a queued receipt
+    # wait up to INGEST_WAIT_MS for it, then answer 202 pending. Rejections (duplicates that
+    # raced the queue) are kept for reads of the last INGEST_REJECTED_SIZE of them
+    INGEST_ASYNC = os.environ.get('RECEIPT_INGEST_ASYNC', '0') == '1'
+    INGEST_QUEUE_SIZE = int(os.environ.get('RECEIPT_INGEST_QUEUE_SIZE', '10000'))
+    INGEST_WORKERS = int(os.environ.get('RECEIPT_INGEST_WORKERS', '2'))
+    INGEST_BATCH_SIZE = 256
+    INGEST_WAIT_MS = 50
+    INGEST_REJECTED_SIZE = 10000
+    # JSON of requests and responses (src/json_codec.py): 'orjson', 'stdlib' or 'auto' (orjson
+    # when it is installed)
+    JSON_CODEC = os.environ.get('RECEIPT_JSON_CODEC', 'auto')
+    # receipt ids (src/model/receipt_ids.py): 'uuid7' time-ordered or 'uuid4' random, generated
+    # RECEIPT_ID_BATCH at a time; uuid7 ids are not handed out more than RECEIPT_ID_MAX_AGE_MS
+    # after their timestamp
+    RECEIPT_ID_GENERATOR = os.environ.get('RECEIPT_ID_GENERATOR', 'uuid7')
+    RECEIPT_ID_BATCH = 256
+    RECEIPT_ID_MAX_AGE_MS = 2
+    # thread pool the ASGI app (src/receipt_asgi.py) runs blocking storage calls in
+    ASYNC_STORAGE_THREADS = 8
+    # LRU size of the points rules marked 'memo' (src/model/points_calculator.py), 0 disables it
+    POINTS_RULE_MEMO_SIZE = 4096
+    # stage latency histograms, counters and storage gauges served at /metrics (src/metrics.py)
+    METRICS_ENABLED = os.environ.get('RECEIPT_METRICS', '1') != '0'
+    # logging (src/logging_config.py): level, 'json' (one object per line) or 'text' output,
+    # records kept per level for high volume events (1 in n of each message, e.g. INFO 100 keeps
+    # 1 in 100 'Processed receipt' lines) and records queued for the writer thread before new
+    # ones are dropped
+    LOG_LEVEL = os.environ.get('RECEIPT_LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.environ.get('RECEIPT_LOG_FORMAT', 'json')
+    LOG_SAMPLE_EVERY = {'DEBUG': int(os.environ.get('RECEIPT_LOG_SAMPLE_DEBUG', '1')),
+                        'INFO': int(os.environ.get('RECEIPT_LOG_SAMPLE_INFO', '1'))}
+    LOG_QUEUE_SIZE = 10000
+    # POST /receipts/process answers kept for retries (src/idempotency_cache.py), keyed by the
+    # Idempotency-Key header or the raw body hash: entries and seconds they are kept (0 disables it)
+    IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('RECEIPT_IDEMPOTENCY_CACHE_SIZE', '100000'))
+    IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('RECEIPT_IDEMPOTENCY_TTL_SECONDS', '3600'))
+    # bytes of serialized GET /receipts/<id>[/points] responses kept (src/response_cache.py),
+    # 0 disables the cache
+    RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RECEIPT_RESPONSE_CACHE_BYTES',
+                                                  str(64 * 1024 * 1024)))
+
+    # directory of the durable receipt log and snapshot (src/persistence.py); unset = in-memory only
+    DATA_DIR = os.environ.get('RECEIPT_DATA_DIR')
+    # 'always' fsyncs before a receipt id is returned (concurrent writers share one fsync),
+    # 'interval' fsyncs every FSYNC_INTERVAL_MS in the background, 'never' leaves it to the OS
+    FSYNC_POLICY = os.environ.get('RECEIPT_FSYNC_POLICY', 'interval')
+    FSYNC_INTERVAL_MS = int(os.environ.get('RECEIPT_FSYNC_INTERVAL_MS', '50'))
+    LOG_SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+    # a background snapshot is written after this many logged receipts, 0 disables it
+    SNAPSHOT_EVERY = 1_000_000
 
 class STATUS_CODE:  # pylint: disable=invalid-name
     SUCCESS = 200
+    ACCEPTED = 202
+    NOT_MODIFIED = 304
     UNKNOWN_ERROR = 500
     INPUT_ERROR = 400
     NO_RECORD_FOUND = 404
+    SERVICE_UNAVAILABLE = 503
 
 DATE_FORMAT = '%Y-%m-%d'
 TIME_FORMAT = '%H:%M'
@@ -0,0 +1,177 @@
+"""
+Duplicate detection on retailer + purchase date-time with compact keys.
+
+An identifier is one int: the interned retailer id shifted above the purchase minute
+(minutes since 0001-01-01), instead of a (retailer, formatted date-time) tuple built with
+strftime. A BloomFilter in front of the index answers most "not a duplicate" checks
+without touching the index, or the database for on-disk storages.
+"""
+import math
+import sys
+
+from src.config import Config
+from src.model.receipt import MINUTES_PER_DAY, datetime_to_minutes
+
+# identifier keys pack the retailer pool index above the purchase minute
+RETAILER_KEY_SHIFT = 33
+MASK32 = (1 << 32) - 1
+BIT_MASKS = tuple(1 << bit for bit in range(8))
+BLOOM_SALT = 0x9E3779B97F4A7C15
+# set slot plus int object of a key in DuplicateIndex.keys
+KEY_BYTES = 64
+
+
+def identifier_key(retailer_id, minutes):
+    return (retailer_id << RETAILER_KEY_SHIFT) | minutes
+
+
+def identifier_hash(retailer, purchase_date_time):
+    """Process-local int identifier for BloomFilter keys when retailers are not interned."""
+    return hash((retailer, datetime_to_minutes(purchase_date_time)))
+
+
+class StringPool:
+    """
+    Interns repeated strings (retailers, item descriptions) as small integer indexes.
+    """
+    def __init__(self):
+        self.strings = []
+        self.index = {}
+
+    def add(self, value):
+        position = self.index.get(value)
+        if position is None:
+            position = len(self.strings)
+            self.index[value] = position
+            self.strings.append(value)
+        return position
+
+    def get(self, value):
+        return self.index.get(value)
+
+    def load(self, strings):
+        self.strings = strings
+        self.index = {value: position for position, value in enumerate(strings)}
+
+    def __getitem__(self, position):
+        return self.strings[position]
+
+    def clear(self):
+        self.strings.clear()
+        self.index.clear()
+
+
+class BloomFilter:
+    """
+    Bloom filter over int keys: no false negatives, about error_rate false positives at capacity
+    keys (more past it). Probes are double hashed from the key's tuple hash, which mixes the key
+    in C; at most MAX_PROBES of them, paying a few bits per key for fewer Python-level probes.
+    """
+    MAX_PROBES = 4
+
+    def __init__(self, capacity, error_rate=None):
+        error_rate = error_rate or Config.DUPLICATE_BLOOM_ERROR_RATE
+        capacity = max(capacity, 1)
+        optimal_bits = -capacity * math.log(error_rate) / math.log(2) ** 2
+        self.probe_count = max(1, min(self.MAX_PROBES,
+                                      round(optimal_bits / capacity * math.log(2))))
+        # bits giving error_rate with probe_count probes: (1 - e^(-k n / m))^k = p
+        bits_per_key = -self.probe_count / math.log(1 - error_rate ** (1 / self.probe_count))
+        self.bit_count = max(64, math.ceil(capacity * bits_per_key))
+        self.bits = bytearray((self.bit_count + 7) // 8)
+        self._probes = range(self.probe_count)
+
+    def add(self, key):
+        mixed = hash((key, BLOOM_SALT))
+        position, step = mixed & MASK32, ((mixed >> 32) & MASK32) | 1
+        bits, bit_count = self.bits, self.bit_count
+        for _ in self._probes:
+            bit = position % bit_count
+            bits[bit >> 3] |= BIT_MASKS[bit & 7]
+            position += step
+
+    def __contains__(self, key):
+        mixed = hash((key, BLOOM_SALT))
+        position, step = mixed & MASK32, ((mixed >> 32) & MASK32) | 1
+        bits, bit_count = self.bits, self.bit_count
+        for _ in self._probes:
+            bit = position % bit_count
+            if not bits[bit >> 3] & BIT_MASKS[bit & 7]:
+                return False
+            position += step
+        return True
+
+    def clear(self):
+        self.bits = bytearray(len(self.bits))
+
+    @property
+    def size_bytes(self):
+        return len(self.bits)
+
+
+class DuplicateIndex:
+    """
+    Identifier keys of the stored receipts. retailers is the StringPool the retailer ids come from,
+    shared with the storage when it interns retailers anyway (CompactReceiptStorage).
+    With bloom_capacity the keys are kept behind a BloomFilter of that capacity.
+    """
+    def __init__(self, retailers=None, bloom_capacity=0):
+        self._owns_retailers = retailers is None
+        self.retailers = StringPool() if retailers is None else retailers
+        self.keys = set()
+        self.bloom = BloomFilter(bloom_capacity) if bloom_capacity else None
+
+    def key(self, retailer, purchase_date_time):
+        """Key of an identifier, None for a retailer never added (so not a duplicate)."""
+        retailer_id = self.retailers.index.get(retailer)
+        if retailer_id is None:
+            return None
+        # identifier_key(retailer_id, datetime_to_minutes(...)) inlined, it runs per receipt
+        return (retailer_id << RETAILER_KEY_SHIFT) | (
+            purchase_date_time.toordinal() * MINUTES_PER_DAY
+            + purchase_date_time.hour * 60 + purchase_date_time.minute)
+
+    def contains(self, retailer, purchase_date_time):
+        key = self.key(retailer, purchase_date_time)
+        return key is not None and self.contains_key(key)
+
+    def contains_key(self, key):
+        if self.bloom is not None and key not in self.bloom:
+            return False
+        return key in self.keys
+
+    def add(self, retailer, purchase_date_time):
+        key = identifier_key(self.retailers.add(retailer), datetime_to_minutes(purchase_date_time))
+        self.add_key(key)
+        return key
+
+    def add_key(self, key):
+        self.keys.add(key)
+        if self.bloom is not None:
+            self.bloom.add(key)
+
+    def discard(self, retailer, purchase_date_time):
+        # a Bloom filter can not forget a key: it stays a (checked) false positive
+        self.keys.discard(self.key(retailer, purchase_date_time))
+
+    def load_keys(self, keys):
+        self.keys = set(keys)
+        if self.bloom is not None:
+            self.bloom.clear()
+            for key in self.keys:
+                self.bloom.add(key)
+
+    def clear(self):
+        """Drops the keys, and the retailer pool unless it was passed in (it is its owner's)."""
+        self.keys.clear()
+        if self._owns_retailers:
+            self.retailers.clear()
+        if self.bloom is not None:
+            self.bloom.clear()
+
+    def approximate_bytes(self):
+        return (sys.getsizeof(self.keys) + KEY_BYTES * len(self.keys)
+                + (self.bloom.size_bytes if self.bloom is not None else 0))
+
+    def __len__(self):
+        return len(self.keys)
@@ -5,3 +5,21 @@ class ReceiptNotFound(Exception):
 
 class ReceiptIsDuplicate(Exception):
     pass
+
+class ReceiptLogCorrupted(Exception):
+    pass
+
+class ReceiptValidationError(ValueError):
+    """Receipt input does not follow request_schema (reported as an input error)."""
+
+class ReceiptStorageFull(Exception):
+    """A fixed-size storage (the shared memory store) has no room for another receipt."""
+
+class IngestQueueFull(Exception):
+    """The asynchronous ingestion queue has no room left (reported as 503)."""
+
+class ReceiptPending(Exception):
+    """The receipt was accepted but is not stored yet."""
+    def __init__(self, receipt_id):
+        self.message = f"Receipt id={receipt_id} is still being processed"
+        super().__init__(self.message)
@@ -0,0 +1,72 @@
+"""
+Replies to retried POST /receipts/process requests: the id a request was answered with is kept
+under its Idempotency-Key header, or the hash of its raw body without one, so a retry within
+the window gets the same response back without being parsed, scored or duplicate checked.
+Entries live for Config.IDEMPOTENCY_TTL_SECONDS, past Config.IDEMPOTENCY_CACHE_SIZE of them the
+oldest are evicted.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from src.config import Config
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+
+
+def request_key(body, idempotency_key=None):
+    """Cache key of a request: its Idempotency-Key if it has one, else the digest of body."""
+    if idempotency_key:
+        return 'key', idempotency_key
+    return 'body', hashlib.blake2b(body, digest_size=16).digest()
+
+
+class IdempotencyCache:
+    """
+    Bounded map of request key -> (receipt id, status code) with a TTL per entry; entries are
+    evicted oldest first, so expired ones go first. max_entries=0 disables it.
+    """
+    def __init__(self, max_entries=None, ttl_seconds=None, clock=time.monotonic):
+        self.max_entries = Config.IDEMPOTENCY_CACHE_SIZE if max_entries is None else max_entries
+        self.ttl = Config.IDEMPOTENCY_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.clock = clock
+        # key -> (expiry, receipt id, status code), in insertion order: the oldest expire first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key):
+        """(receipt id, status code) the request of key was answered with, None if unknown."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key, receipt_id, status_code):
+        if not self.enabled:
+            return
+        now = self.clock()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (now + self.ttl, receipt_id, status_code)
+            while self._entries:
+                oldest_key, oldest = next(iter(self._entries.items()))
+                if len(self._entries) <= self.max_entries and oldest[0] > now:
+                    break
+                del self._entries[oldest_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,158 @@
+"""
+Asynchronous ingestion: receipts are validated and given their id on the request thread,
+then scored and stored by worker threads in batches (one store_receipts call, so one log
+append and fsync, per batch: group commit).
+
+Duplicate semantics are those of the synchronous path. submit rejects a receipt whose
+identifier is stored or already queued, so the client gets its 400 right away; a receipt that
+loses a race with a write outside the queue (e.g. a batch request) is rejected when its batch
+is stored, and check reports that rejection for its id.
+"""
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from src import metrics
+from src.config import Config
+from src.model.points_calculator import PointsCalculator
+from src.model.receipt import Receipt
+from src.exceptions import IngestQueueFull, ReceiptPending
+
+
+class IngestPipeline:
+    """
+    Bounded queue of validated receipts in front of storage, drained by worker threads.
+    submit returns the id of an accepted receipt (IngestQueueFull when the queue is full),
+    check tells whether an id is stored yet, waiting up to wait_ms for a queued one.
+    """
+    def __init__(self, storage, queue_size=None, workers=None, batch_size=None, wait_ms=None,
+                 rejected_size=None):
+        self.storage = storage
+        self.queue = queue.Queue(queue_size or Config.INGEST_QUEUE_SIZE)
+        self.batch_size = batch_size or Config.INGEST_BATCH_SIZE
+        self.wait = (Config.INGEST_WAIT_MS if wait_ms is None else wait_ms) / 1000
+        self.rejected_size = rejected_size or Config.INGEST_REJECTED_SIZE
+
+        # queued receipt id -> identifier, identifiers of queued receipts
+        self.pending = {}
+        self._queued_identifiers = set()
+        # receipt id -> exception of the last rejected receipts
+        self.rejected = OrderedDict()
+        self._lock = threading.Lock()
+        self._committed = threading.Condition(self._lock)
+        # batches are stored one at a time: engines without an atomic check-and-insert
+        # (ReceiptStorage) stay correct with several workers
+        self._store_lock = threading.Lock()
+        self._workers = []
+        self.start(Config.INGEST_WORKERS if workers is None else workers)
+
+    def start(self, workers):
+        for _ in range(workers):
+            worker = threading.Thread(target=self._run, daemon=True,
+                                      name=f'receipt-ingest-{len(self._workers)}')
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, input_data):
+        """Validates input_data and queues it, returns its receipt id."""
+        receipt = Receipt.parse_input(input_data)
+        identifier = (receipt.retailer, receipt.purchase_date_time)
+        with self._lock:
+            if identifier in self._queued_identifiers or self.storage.is_duplicate(receipt):
+                metrics.DUPLICATES.inc()
+                raise self.storage.duplicate_error(receipt.identifier_tuple())
+            try:
+                self.queue.put_nowait(receipt)
+            except queue.Full:
+                raise IngestQueueFull(
+                    f'Ingestion queue is full ({self.queue.maxsize} receipts)') from None
+            self._queued_identifiers.add(identifier)
+            self.pending[receipt.receipt_id] = identifier
+        return receipt.receipt_id
+
+    def check(self, receipt_id):
+        """
+        Returns once receipt_id is not queued (stored, or never submitted here), raises
+        ReceiptPending if it is still queued after the wait, or the exception it was rejected with.
+        """
+        if receipt_id not in self.pending and receipt_id not in self.rejected:
+            return
+        deadline = time.monotonic() + self.wait
+        with self._committed:
+            while receipt_id in self.pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ReceiptPending(receipt_id)
+                self._committed.wait(remaining)
+            error = self.rejected.get(receipt_id)
+        if error is not None:
+            raise error
+
+    def _run(self):
+        while True:
+            receipt = self.queue.get()
+            if receipt is None:
+                return
+            batch = [receipt]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    receipt = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if receipt is None:
+                    stop = True
+                    break
+                batch.append(receipt)
+            self._commit(batch)
+            if stop:
+                return
+
+    def _commit(self, batch):
+        try:
+            started = metrics.clock()
+            # the compiled rules, with their retailer memo warm across batches, score batches of
+            # batch_size receipts at least as fast as calculate_points_batch (benchmarks.suite)
+            points = [PointsCalculator.calculate_points(receipt) for receipt in batch]
+            metrics.observe_stage(metrics.STAGE_POINTS, started)
+            for receipt, receipt_points in zip(batch, points):
+                receipt.points = receipt_points
+            with self._store_lock:
+                outcomes = self.storage.store_receipts(batch)
+        except Exception as e:  # pylint: disable=broad-except
+            outcomes = [e] * len(batch)
+
+        with self._committed:
+            for receipt, outcome in zip(batch, outcomes):
+                self._queued_identifiers.discard(self.pending.pop(receipt.receipt_id))
+                if isinstance(outcome, Exception):
+                    self.rejected[receipt.receipt_id] = outcome
+                    if len(self.rejected) > self.rejected_size:
+                        self.rejected.popitem(last=False)
+            self._committed.notify_all()
+
+    def clear_rejected(self):
+        with self._lock:
+            self.rejected.clear()
+
+    def close(self):
+        """
+        Stops the workers once they stored what is queued; receipts still queued then (with no
+        workers running) are stored on the calling thread. Registered to run at exit by the app.
+        """
+        for _ in self._workers:
+            self.queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        left = []
+        while True:
+            try:
+                receipt = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if receipt is not None:
+                left.append(receipt)
+        for start in range(0, len(left), self.batch_size):
+            self._commit(left[start:start + self.batch_size])
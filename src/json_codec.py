@@ -0,0 +1,95 @@
+"""
+JSON encoding and decoding of the HTTP layer: orjson when it is installed, the stdlib json module
+otherwise (Config.JSON_CODEC picks one explicitly).
+
+Both codecs write the same bytes: laid out like Flask's jsonify (compact, sorted keys) but with
+non-ASCII text as UTF-8 (what orjson writes, it has no ASCII-only mode), and datetimes encoded
+natively in the receipt format (DT_FORMAT), so stored records are serialized as they are.
+JSONProvider plugs the codec into Flask: responses, request.get_json and app.json.
+"""
+import datetime
+import json
+
+from flask.json.provider import JSONProvider as FlaskJSONProvider
+
+from src.config import Config
+from src.model.receipt import Receipt
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the stdlib codec is used without it
+    orjson = None
+
+
+def encode_default(value):
+    """Encoding of the non-JSON types of stored records and responses."""
+    if isinstance(value, datetime.datetime):
+        return Receipt.format_receipt_date(value)
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+class StdlibJSONCodec:
+    name = 'stdlib'
+
+    def __init__(self):
+        self._encode = json.JSONEncoder(separators=(',', ':'), sort_keys=True, ensure_ascii=False,
+                                        default=encode_default).encode
+
+    def dumps(self, obj):
+        """Encoded obj as UTF-8 bytes."""
+        return self._encode(obj).encode()
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+
+class OrjsonJSONCodec:
+    name = 'orjson'
+    # datetimes go through encode_default, orjson would write them in ISO 8601
+    OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+    def dumps(self, obj):
+        return orjson.dumps(obj, default=encode_default, option=self.OPTIONS)
+
+    @staticmethod
+    def loads(data):
+        return orjson.loads(data)
+
+
+JSON_CODECS = {'stdlib': StdlibJSONCodec, 'orjson': OrjsonJSONCodec}
+
+
+def create_codec(name=None):
+    """Codec named name (or Config.JSON_CODEC); 'auto' is orjson when installed."""
+    name = name or Config.JSON_CODEC
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'stdlib'
+    if name not in JSON_CODECS:
+        raise ValueError(f"Unknown JSON codec '{name}', "
+                         f"expected 'auto' or one of {sorted(JSON_CODECS)}")
+    if name == 'orjson' and orjson is None:
+        raise ValueError("JSON codec 'orjson' needs the orjson package")
+    return JSON_CODECS[name]()
+
+
+codec = create_codec()
+dumps = codec.dumps
+loads = codec.loads
+
+
+class JSONProvider(FlaskJSONProvider):
+    """Flask JSON provider on the module codec, responses end with a newline like jsonify's."""
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj) + b'\n', mimetype=self.mimetype)
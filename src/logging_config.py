@@ -0,0 +1,129 @@
+"""
+Logging of the receipt service: request threads only put records on a queue, a background
+thread formats them (one JSON object per line by default) and writes them out.
+
+    configure_logging()           # Config.LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_EVERY, LOG_QUEUE_SIZE
+
+High volume events are sampled per level: with LOG_SAMPLE_EVERY = {'INFO': 100}, 1 in 100
+records of each INFO message (e.g. 'Processed receipt id=%s') is kept, counted per message
+template. Messages are logged with %-style arguments, so a record that is filtered out by
+level or sampling never builds its message. A full queue drops records (counted in dropped)
+rather than blocking the request.
+"""
+import atexit
+import datetime
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+from src import json_codec
+from src.config import Config
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_handler = None
+_listener = None
+_settings = {}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message and exception if any."""
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                    .isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json_codec.dumps(entry).decode()
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps 1 in every n records of a level, n from sample_every ({level name: n})."""
+    def __init__(self, sample_every):
+        super().__init__()
+        self.sample_every = {logging.getLevelName(level): every
+                             for level, every in sample_every.items() if every > 1}
+        self._counters = {}
+
+    def filter(self, record):
+        every = self.sample_every.get(record.levelno)
+        if every is None:
+            return True
+        key = (record.levelno, record.msg)
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters.setdefault(key, itertools.count())
+        # next() on itertools.count is atomic, threads need no lock
+        return next(counter) % every == 0
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks or formats: records go to the queue as they are."""
+    def __init__(self, record_queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # formatted by the listener thread, log arguments must not be mutated after the call
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(level=None, log_format=None, sample_every=None, queue_size=None,
+                      stream=None):
+    """
+    Routes the root logger through a DroppingQueueHandler to a listener thread writing to stream
+    (stderr by default). Calling it again replaces the previous configuration.
+    """
+    global _handler, _listener  # pylint: disable=global-statement
+    stop_logging()
+    _settings.update(level=level, log_format=log_format, sample_every=sample_every,
+                     queue_size=queue_size, stream=stream)
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JSONFormatter() if (log_format or Config.LOG_FORMAT) == 'json'
+                        else logging.Formatter(TEXT_FORMAT))
+    _handler = DroppingQueueHandler(queue.Queue(queue_size or Config.LOG_QUEUE_SIZE))
+    _handler.addFilter(SamplingFilter(Config.LOG_SAMPLE_EVERY if sample_every is None
+                                      else sample_every))
+    _listener = logging.handlers.QueueListener(_handler.queue, output)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(level or Config.LOG_LEVEL)
+    return _handler
+
+
+def stop_logging():
+    """Writes out the queued records and stops the listener thread."""
+    global _listener  # pylint: disable=global-statement
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_in_child():
+    # the listener thread does not survive fork (pre-forked gunicorn workers)
+    global _listener  # pylint: disable=global-statement
+    if _listener is not None:
+        _listener = None
+        configure_logging(**_settings)
+
+
+atexit.register(stop_logging)
+os.register_at_fork(after_in_child=_restart_in_child)
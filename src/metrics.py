@@ -0,0 +1,268 @@
+"""
+In-process metrics in Prometheus text format (served at /metrics): fixed-bucket latency
+histograms, counters and gauges read at scrape time.
+
+Stages are timed inline:
+    started = metrics.clock()
+    ...
+    metrics.observe_stage(metrics.STAGE_POINTS, started)
+
+With Config.METRICS_ENABLED off (or set_enabled(False)) every call returns right away,
+nothing is recorded and /metrics is not served.
+"""
+import bisect
+import sys
+import threading
+import time
+import weakref
+from abc import ABC, abstractmethod
+
+from src.config import Config
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# upper bounds in seconds, from the ~microsecond stages up to slow requests
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+STAGE_PARSE = 'parse'
+STAGE_POINTS = 'points'
+STAGE_DUPLICATE_CHECK = 'duplicate_check'
+STAGE_STORE = 'store'
+STAGE_SERIALIZE = 'serialize'
+
+enabled = Config.METRICS_ENABLED
+
+
+def set_enabled(value):
+    global enabled  # pylint: disable=global-statement
+    enabled = value
+
+
+def clock():
+    return time.perf_counter() if enabled else 0.0
+
+
+def _format_labels(label_names, label_values, extra=''):
+    pairs = [f'{name}="{value}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _PerThreadMetric(ABC):
+    """
+    Every thread updates its own values dict, so recording takes no lock
+    (a lock costs more than the update itself); scrapes merge the dicts of all threads.
+    When a thread goes away its values are merged into those of the finished threads.
+    """
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._local = threading.local()
+        # id(values) -> values of a live thread
+        self._thread_values = {}
+        # merged values of the finished threads
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    @abstractmethod
+    def _merge(values):
+        """Merges a list of values of one label values."""
+
+    def _values(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._thread_values[id(values)] = values
+            weakref.finalize(threading.current_thread(), self._retire, values)
+            return values
+
+    def _retire(self, values):
+        """Folds the values of a finished thread into the retired ones."""
+        with self._lock:
+            if self._thread_values.pop(id(values), None) is None:
+                return
+            retired = self._retired
+            for label_values, value in values.items():
+                retired[label_values] = (value if label_values not in retired
+                                         else self._merge([retired[label_values], value]))
+
+    def _merged(self):
+        """label values -> values of every thread merged"""
+        with self._lock:
+            thread_values = [dict(self._retired), *self._thread_values.values()]
+        merged = {}
+        for values in thread_values:
+            for label_values, value in list(values.items()):
+                merged.setdefault(label_values, []).append(value)
+        return {label_values: self._merge(values) for label_values, values in merged.items()}
+
+    def reset(self):
+        with self._lock:
+            self._retired.clear()
+            for values in self._thread_values.values():
+                values.clear()
+
+
+class Counter(_PerThreadMetric):
+    _merge = staticmethod(sum)
+
+    def inc(self, *label_values, amount=1):
+        if not enabled:
+            return
+        values = self._values()
+        values[label_values] = values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._merged().get(label_values, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(self._merged().items()):
+            lines.append(f'{self.name}{_format_labels(self.label_names, label_values)} {value}')
+        return lines
+
+
+class Histogram(_PerThreadMetric):
+    """Cumulative histogram over fixed upper bounds (buckets), one series per label values."""
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = buckets
+
+    def observe(self, value, *label_values):
+        if not enabled:
+            return
+        values = self._values()
+        # [count per bucket..., count above the last bucket, sum]
+        series = values.get(label_values)
+        if series is None:
+            series = values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @staticmethod
+    def _merge(values):
+        return [sum(column) for column in zip(*values)]
+
+    def _series(self):
+        return self._merged()
+
+    def count(self, *label_values):
+        series = self._series().get(label_values)
+        return sum(series[:-1]) if series else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for label_values, series in sorted(self._series().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                labels = _format_labels(self.label_names, label_values, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f'{self.name}_sum{labels} {_format_value(series[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """Value read by calling read() at scrape time."""
+    TYPE = 'gauge'
+
+    def __init__(self, name, documentation, read):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def render(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.TYPE}',
+                f'{self.name} {_format_value(self.read())}']
+
+    def reset(self):
+        pass
+
+
+class ReadCounter(Gauge):
+    """Counter kept by someone else (e.g. a storage), read at scrape time."""
+    TYPE = 'counter'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        for metric in self.metrics.values():
+            metric.reset()
+
+
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'receipt_stage_seconds', 'Time spent per receipt processing stage.', ('stage',)))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'receipt_request_seconds', 'Request latency per route.', ('route',)))
+RESPONSES = REGISTRY.register(Counter(
+    'receipt_responses_total', 'Responses per route and status code.', ('route', 'status')))
+PROCESSED = REGISTRY.register(Counter(
+    'receipts_processed_total', 'Receipts stored.'))
+DUPLICATES = REGISTRY.register(Counter(
+    'receipts_duplicates_total', 'Receipts rejected as duplicates.'))
+REPLAYS = REGISTRY.register(Counter(
+    'receipts_idempotent_replays_total', 'Retried requests answered from the idempotency cache.'))
+
+
+def observe_stage(stage, started):
+    if enabled:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage)
+
+
+def observe_request(route, status, started):
+    if enabled:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route)
+        RESPONSES.inc(route, str(status))
+
+
+def register_storage(storage):
+    """
+    Gauges of the served storage: receipt count and approximate bytes, plus the counters
+    a storage lists in COUNTERS (attribute name -> documentation), e.g. cache hits.
+    """
+    REGISTRY.register(Gauge('receipt_storage_receipts', 'Receipts in storage.',
+                            lambda: len(storage)))
+    REGISTRY.register(Gauge('receipt_storage_bytes', 'Approximate size of the stored receipts.',
+                            storage.approximate_bytes))
+    for name, documentation in getattr(storage, 'COUNTERS', {}).items():
+        REGISTRY.register(ReadCounter(f'receipt_storage_{name}_total', documentation,
+                                      lambda name=name: getattr(storage, name)))
+
+
+def deep_sizeof(value):
+    """
+    sys.getsizeof of value plus its nested dict values, lists and tuples
+    (dict keys are left out, records share them).
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_sizeof(item) for item in value.values())
+    elif isinstance(value, (list, tuple)):
+        size += sum(deep_sizeof(item) for item in value)
+    return size
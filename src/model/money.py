@@ -0,0 +1,24 @@
+"""
+Money is fixed-point: totals and prices are integer cents from parsing through storage
+and scoring, so no rule ever sees a binary float. Amounts are only turned back into
+decimal numbers for the JSON responses.
+"""
+from decimal import Decimal, InvalidOperation
+
+CENTS_PER_UNIT = 100
+
+
+def to_cents(amount):
+    """Integer cents of a decimal amount ('12.34', 12.34), rounded half-even to the cent."""
+    try:
+        return round(Decimal(str(amount)) * CENTS_PER_UNIT)
+    except (InvalidOperation, ValueError, OverflowError) as e:
+        raise ValueError(f"Invalid amount: {amount!r}") from e
+
+
+def cents_to_amount(cents):
+    """
+    Decimal amount of cents for JSON output. The correctly rounded cents / 100 is the double
+    closest to the decimal amount, so it serializes as exactly that amount ('10.78', '2.5').
+    """
+    return cents / CENTS_PER_UNIT
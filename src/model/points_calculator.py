@@ -1,56 +1,214 @@
-import math
+import functools
+import itertools
+from operator import attrgetter, itemgetter
+
+from src.config import Config
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional: calculate_points_batch falls back to the scalar rules
+    np = None
+
+
+# a point per started 5.00 of price: ceil(0.2 * price) == ceil(price_cents / 500)
+ITEM_POINTS_PRICE_CENTS = 500
+# 1 for the alphanumeric ASCII codes, as str.isalnum has them
+ALNUM_ASCII = None if np is None else np.array([chr(code).isalnum() for code in range(128)],
+                                               dtype=np.int64)
+
+
+def _alnum_counts(strings):
+    """Alphanumeric characters of every string, counted over their joined bytes at once."""
+    joined = ''.join(strings)
+    if not joined.isascii():
+        return [sum(1 for char in string if char.isalnum()) for string in strings]
+    counted = np.zeros(len(joined) + 1, dtype=np.int64)
+    np.cumsum(ALNUM_ASCII[np.frombuffer(joined.encode('ascii'), dtype=np.uint8)], out=counted[1:])
+    lengths = np.fromiter(map(len, strings), dtype=np.int64, count=len(strings))
+    ends = np.cumsum(lengths)
+    return (counted[ends] - counted[ends - lengths]).tolist()
+
+
+class ReceiptColumns:  # pylint: disable=too-few-public-methods
+    """
+    Columnar view of a batch of receipts used by the vectorized ('batch_method') rules.
+    Item columns are flattened, item_owner maps every item to the index of its receipt.
+    Money columns are int64 cents. Fields are gathered with map over the whole batch, and
+    string rules are computed once per distinct retailer and item description.
+    """
+    def __init__(self, receipts):
+        size = len(receipts)
+        self.size = size
+        self.totals = np.fromiter(map(attrgetter('total'), receipts), dtype=np.int64, count=size)
+        retailers = list(map(attrgetter('retailer'), receipts))
+        distinct = list(set(retailers))
+        alnum = dict(zip(distinct, _alnum_counts(distinct)))
+        self.retailer_alnum = np.fromiter(map(alnum.__getitem__, retailers),
+                                          dtype=np.int64, count=size)
+        item_lists = list(map(attrgetter('items'), receipts))
+        self.item_counts = np.fromiter(map(len, item_lists), dtype=np.int64, count=size)
+        date_times = list(map(attrgetter('purchase_date_time'), receipts))
+        self.days = np.fromiter(map(attrgetter('day'), date_times), dtype=np.int64, count=size)
+        self.hours = np.fromiter(map(attrgetter('hour'), date_times), dtype=np.int64, count=size)
+
+        items = list(itertools.chain.from_iterable(item_lists))
+        self.item_prices = np.fromiter(map(itemgetter('price'), items),
+                                       dtype=np.int64, count=len(items))
+        descriptions = list(map(itemgetter('shortDescription'), items))
+        lengths = {description: len(description.strip()) for description in set(descriptions)}
+        self.item_description_lengths = np.fromiter(map(lengths.__getitem__, descriptions),
+                                                    dtype=np.int64, count=len(items))
+        self.item_owner = np.repeat(np.arange(size), self.item_counts)
+
+
+def _items_names_in3_batch(columns):
+    in3 = columns.item_description_lengths % 3 == 0
+    item_points = -(-columns.item_prices[in3] // ITEM_POINTS_PRICE_CENTS)
+    # sums of whole numbers stay exact in float64, so the cast back is lossless
+    return np.bincount(columns.item_owner[in3], weights=item_points,
+                       minlength=columns.size).astype(np.int64)
+
+
+class CompiledRules:  # pylint: disable=too-few-public-methods
+    """
+    A rule set compiled once into a single fused scoring function:
+    each receipt field is read once and the rule methods are summed in one expression,
+    without the per-rule getattr, dict writes and temporary dict of parse_rules.
+    Rules marked 'memo' (pure functions of their field) get a bounded LRU cache.
+    """
+    def __init__(self, rules, memo_size=None):
+        memo_size = Config.POINTS_RULE_MEMO_SIZE if memo_size is None else memo_size
+        self.rules = dict(rules)
+        self.methods = {
+            rule: functools.lru_cache(maxsize=memo_size)(info['method'])
+            if info.get('memo') and memo_size else info['method']
+            for rule, info in self.rules.items()
+        }
+        self.score = self._fuse()
+
+    def _fuse(self):
+        fields = list(dict.fromkeys(info['field'] for info in self.rules.values()))
+        namespace = {f'rule_{position}': method
+                     for position, method in enumerate(self.methods.values())}
+        terms = [f'rule_{position}({info["field"]})'
+                 for position, info in enumerate(self.rules.values())]
+        source = '\n'.join(
+            ['def score(receipt):']
+            + [f'    {field} = receipt.{field}' for field in fields]
+            + [f'    return {" + ".join(terms) or "0"}'])
+        exec(compile(source, '<points rules>', 'exec'), namespace)  # pylint: disable=exec-used
+        return namespace['score']
+
+    def memo_info(self):
+        """lru_cache statistics of the memoized rules."""
+        return {rule: method.cache_info() for rule, method in self.methods.items()
+                if hasattr(method, 'cache_info')}
+
 
 class PointsCalculator:
     """
     This class contains the logic for calculating points based on the rules.
     It uses a dictionary of rules for flexibility.
+    A rule may also provide 'batch_method', a NumPy version of 'method' over ReceiptColumns,
+    and 'memo' when 'method' is pure and worth caching per field value.
+    Money fields (total, item prices) are integer cents, so the rules are exact integer math.
+    The rules are compiled (CompiledRules) at import and by register_rules,
+    so they are changed at runtime through register_rules / reset_rules, not by editing rules.
     """
     # simplified version of points calculator
     rules = {
             "retailer_alnum": {
                 'field': 'retailer',
                 'method': lambda retailer: sum(1 for char in retailer if char.isalnum()),
+                'batch_method': lambda columns: columns.retailer_alnum,
+                'memo': True,
             },
             "total_round_dollar": {
                 'field': 'total',
-                'method': lambda total: 50 if total % 1 == 0 else 0,
+                'method': lambda total: 50 if total % 100 == 0 else 0,
+                'batch_method': lambda columns: np.where(columns.totals % 100 == 0, 50, 0),
             },
             "total_in_quarters": {
                 'field': 'total',
-                'method': lambda total: 25 if total * 100 % 25 == 0 else 0,
+                'method': lambda total: 25 if total % 25 == 0 else 0,
+                'batch_method': lambda columns: np.where(columns.totals % 25 == 0, 25, 0),
             },
             "each_pair_of_items_5c": {
                 'field': 'items',
                 'method': lambda items: 5 * (len(items) // 2),
+                'batch_method': lambda columns: 5 * (columns.item_counts // 2),
             },
             "items_names_in3": {
                 'field': 'items',
-                'method': lambda items: sum([math.ceil(0.2 * item["price"]) for item in items
+                'method': lambda items: sum([-(-item["price"] // ITEM_POINTS_PRICE_CENTS)
+                                    for item in items
                                     if len(item["shortDescription"].strip()) % 3 == 0
                                     ]),
+                'batch_method': _items_names_in3_batch,
             },
             "odd_day": {
                 'field': 'purchase_date_time',
                 'method': lambda purchase_date_time: 6 if purchase_date_time.day % 2 else 0,
+                'batch_method': lambda columns: np.where(columns.days % 2 == 1, 6, 0),
             },
             "special_time": {
                 'field': 'purchase_date_time',
                 'method': lambda purchase_date_time:
                   10 if 14 <= purchase_date_time.hour < 16 else 0,
+                'batch_method': lambda columns:
+                  np.where((columns.hours >= 14) & (columns.hours < 16), 10, 0),
             },
         }
 
+    default_rules = rules
+    compiled = CompiledRules(rules)
+
     @staticmethod
     def parse_rules(receipt):
-        rule_values = {}
+        """Points per rule, for breakdowns; scoring goes through the fused calculate_points."""
+        compiled = PointsCalculator.compiled
+        return {rule: compiled.methods[rule](getattr(receipt, info['field']))
+                for rule, info in compiled.rules.items()}
 
-        for rule, info in PointsCalculator.rules.items():
-            value = getattr(receipt, info['field'])
-            rule_values[rule] = info['method'](value)
+    # calculate_points(receipt) is the compiled score function itself, rebound by register_rules
+    calculate_points = staticmethod(compiled.score)
 
-        return rule_values
+    @classmethod
+    def register_rules(cls, rules, replace=False):
+        """
+        Adds rules (overriding same-named ones), or with replace=True swaps in a new rule set,
+        and recompiles. Receipts scored concurrently see either the old or the new rule set.
+        """
+        compiled = CompiledRules(rules if replace else {**cls.rules, **rules})
+        cls.compiled = compiled
+        cls.rules = compiled.rules
+        cls.calculate_points = staticmethod(compiled.score)
+
+    @classmethod
+    def reset_rules(cls):
+        """Reloads the built-in rule set (clears the rule memos)."""
+        cls.register_rules(cls.default_rules, replace=True)
 
     @staticmethod
-    def calculate_points(receipt):
-        parse_point_rules = PointsCalculator.parse_rules(receipt)
-        return sum(parse_point_rules.values())
+    def calculate_points_batch(receipts):
+        """
+        Scores many receipts at once, returns a list of points aligned with receipts.
+        Rules with a 'batch_method' run vectorized over ReceiptColumns, the rest per receipt.
+        Without numpy every receipt goes through calculate_points.
+        """
+        receipts = list(receipts)
+        if np is None or not receipts:
+            return [PointsCalculator.calculate_points(receipt) for receipt in receipts]
+
+        compiled = PointsCalculator.compiled
+        columns = ReceiptColumns(receipts)
+        points = np.zeros(len(receipts), dtype=np.int64)
+        for rule, info in compiled.rules.items():
+            if 'batch_method' in info:
+                points += info['batch_method'](columns)
+            else:
+                method = compiled.methods[rule]
+                points += np.fromiter((method(getattr(r, info['field'])) for r in receipts),
+                                      dtype=np.int64, count=len(receipts))
+
+        return points.tolist()
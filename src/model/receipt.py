@@ -1,16 +1,38 @@
 import datetime
-import uuid
+import functools
 
+from src import metrics
 from src.config import DT_FORMAT
+from src.model.money import to_cents, cents_to_amount
 from src.model.points_calculator import PointsCalculator
+from src.model.receipt_parser import parse_receipt_input
+from src.model.receipt_ids import id_generator, format_receipt_id, parse_receipt_id
 
 RECEIPT_ID_NAME = 'id'
+MINUTES_PER_DAY = 24 * 60
+
+
+def datetime_to_minutes(dt):
+    """Minutes since 0001-01-01, fits purchase date-times (minute precision) into one int."""
+    return dt.toordinal() * MINUTES_PER_DAY + dt.hour * 60 + dt.minute
+
+
+def minutes_to_datetime(minutes):
+    days, minute_of_day = divmod(minutes, MINUTES_PER_DAY)
+    return datetime.datetime.fromordinal(days) + datetime.timedelta(minutes=minute_of_day)
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _format_date_time(dt, fmt):
+    # receipts cluster around the same minutes, strftime is the expensive part
+    return dt.strftime(fmt)
 
 
 class Receipt:
     """
     The Receipt class represents a receipt object.
     It handles parsing date/time, item details, and calculates points using the PointsCalculator.
+    total and item prices are integer cents (src/model/money.py).
     """
     def __init__(self, **kwargs):
         # simplified version of Receipt with items as a dictionary
@@ -25,15 +47,83 @@ class Receipt:
                     ]):
             raise ValueError("Invalid Receipt")
 
-        self.receipt_id = str(uuid.uuid4())
+        self._id_int = id_generator.new_id()
         self.purchase_date_time = self._parse_datetime(self.purchase_date, self.purchase_time)
+        self._check_purchase_date_time()
+        self.total = to_cents(self.total)
+        self.items = self._parse_items(self.items)
+
+        self.points = PointsCalculator.calculate_points(self)
+
+    @classmethod
+    def from_input(cls, input_data, id_int=None):
+        """
+        Builds a Receipt from request input, validating it against request_schema
+        while parsing (ReceiptValidationError for schema violations).
+        """
+        receipt = cls.parse_input(input_data, id_int)
+        started = metrics.clock()
+        receipt.points = PointsCalculator.calculate_points(receipt)
+        metrics.observe_stage(metrics.STAGE_POINTS, started)
+        return receipt
+
+    @classmethod
+    def parse_input(cls, input_data, id_int=None):
+        """
+        from_input without scoring: a validated Receipt with its id (id_int, or a new one from
+        src/model/receipt_ids.py) and no points yet.
+        """
+        started = metrics.clock()
+        receipt = cls.__new__(cls)
+        (receipt.retailer, receipt.purchase_date, receipt.purchase_time,
+         receipt.purchase_date_time, receipt.total, receipt.items) = parse_receipt_input(input_data)
+        if len(receipt.items) <= 1:
+            raise ValueError("Invalid Receipt")
+
+        receipt._id_int = id_generator.new_id() if id_int is None else id_int
+        receipt._check_purchase_date_time()
+        metrics.observe_stage(metrics.STAGE_PARSE, started)
+        return receipt
+
+    @property
+    def receipt_id(self):
+        """UUID string of the id, rendered on first use."""
+        receipt_id = self.__dict__.get('_receipt_id')
+        if receipt_id is None:
+            receipt_id = self._receipt_id = format_receipt_id(self._id_int)
+        return receipt_id
+
+    @receipt_id.setter
+    def receipt_id(self, value):
+        self._receipt_id = value
+        self._id_int = None
+
+    @property
+    def id_int(self):
+        """The id as a 128-bit int, the key of storages indexing compact ids."""
+        id_int = self._id_int
+        if id_int is None:
+            id_int = self._id_int = parse_receipt_id(self._receipt_id)
+        return id_int
+
+    def _check_purchase_date_time(self):
         if self.purchase_date_time > datetime.datetime.now():
             # TODO date validations; how far back can it go (settings?)
             raise ValueError("Purchase date cannot be in the future")
-        self.total = float(self.total)
-        self.items = self._parse_items(self.items)
 
-        self.points = PointsCalculator.calculate_points(self)
+    @classmethod
+    def from_record(cls, record):
+        """Rebuilds an already processed Receipt from its to_dict() record, without re-scoring."""
+        receipt = cls.__new__(cls)
+        receipt.receipt_id = record[RECEIPT_ID_NAME]
+        receipt.retailer = record["retailer"]
+        receipt.purchase_date_time = record["purchaseDateTime"]
+        receipt.purchase_date, receipt.purchase_time = \
+            cls.format_receipt_date(receipt.purchase_date_time).split(' ')
+        receipt.total = record["total"]
+        receipt.items = record["items"]
+        receipt.points = record["points"]
+        return receipt
 
     @staticmethod
     def _parse_datetime(date_str, time_str):
@@ -45,13 +135,26 @@ class Receipt:
         return [
             {
                 "shortDescription": item["shortDescription"].strip(),
-                "price": float(item["price"])
+                "price": to_cents(item["price"])
             }
             for item in items
         ]
 
     def identifier_tuple(self):
-        return (self.retailer, self.purchase_date_time.strftime(DT_FORMAT))
+        """
+        (retailer, formatted purchase date-time), built once per receipt. Duplicate checks use
+        the compact keys of src/duplicate_index.py, this is for messages and SQL lookups.
+        """
+        identifier = self.__dict__.get('_identifier')
+        if identifier is None:
+            identifier = self._identifier = (
+                self.retailer, _format_date_time(self.purchase_date_time, DT_FORMAT))
+        return identifier
+
+    @staticmethod
+    def record_identifier(record):
+        """identifier_tuple of a stored to_dict() record."""
+        return (record["retailer"], _format_date_time(record["purchaseDateTime"], DT_FORMAT))
 
     def to_dict(self):
         """Convert the Receipt object to a dictionary format for storage."""
@@ -64,9 +167,22 @@ class Receipt:
             "points": self.points,
         }
 
+    @staticmethod
+    def record_response(record):
+        """
+        Response copy of a stored record with decimal amounts. purchaseDateTime stays a datetime,
+        src/json_codec.py encodes it in DT_FORMAT.
+        """
+        response = record.copy()
+        response["total"] = cents_to_amount(record["total"])
+        response["items"] = [{"shortDescription": item["shortDescription"],
+                              "price": cents_to_amount(item["price"])}
+                             for item in record["items"]]
+        return response
+
     @staticmethod
     def format_receipt_date(dt, fmt=DT_FORMAT):
         """
         Formats receipt purchase_date_time,  uses default format is no format is specified
         """
-        return dt.strftime(fmt)
+        return _format_date_time(dt, fmt)
@@ -0,0 +1,181 @@
+"""
+Receipt ids: 128-bit ints in UUID layout, rendered as UUID strings at the API boundary.
+
+Config.RECEIPT_ID_GENERATOR picks the generator:
+*   'uuid7': time-ordered (RFC 9562 UUIDv7), 48-bit Unix milliseconds then a 74-bit counter that
+    starts at a random value every millisecond and grows by random steps, so ids are monotonic
+    within a process and close ids are still hard to guess,
+*   'uuid4': random.
+Both draw their random bits for RECEIPT_ID_BATCH ids at a time (one os.urandom call) and hand
+ids out of that batch; new_ids gives bulk ingestion a run of them at once. A uuid7 batch older
+than RECEIPT_ID_MAX_AGE_MS is dropped for a new one, so ids carry the time they are handed out.
+"""
+import os
+import threading
+import time
+import uuid
+import weakref
+from abc import ABC, abstractmethod
+
+from src.config import Config
+
+VERSION_SHIFT = 76
+VARIANT_SHIFT = 62
+VERSION_MASK = 0xF << VERSION_SHIFT
+VARIANT_MASK = 0x3 << VARIANT_SHIFT
+RFC_4122_VARIANT = 0x2 << VARIANT_SHIFT
+COUNTER_BITS = 74
+RAND_B_BITS = 62
+RAND_B_MASK = (1 << RAND_B_BITS) - 1
+# a new millisecond's counter starts below half its range, leaving room for the steps
+COUNTER_SEED_BITS = COUNTER_BITS - 1
+# counter steps are 1 + a random 32-bit int
+STEP_BYTES = 4
+
+
+def format_receipt_id(id_int):
+    """UUID string of a 128-bit id, without the cost of building a uuid.UUID."""
+    hex_id = f'{id_int:032x}'
+    return f'{hex_id[:8]}-{hex_id[8:12]}-{hex_id[12:16]}-{hex_id[16:20]}-{hex_id[20:]}'
+
+
+def parse_receipt_id(receipt_id):
+    """128-bit int of a UUID string (any form uuid.UUID reads), None if it is not one."""
+    try:
+        if len(receipt_id) == 36 and receipt_id[8] == receipt_id[13] == receipt_id[18] \
+                == receipt_id[23] == '-':
+            hex_id = receipt_id.replace('-', '')
+            if len(hex_id) == 32:
+                return int(hex_id, 16)
+        return uuid.UUID(receipt_id).int
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+# generators of the process, reset in forked children (bulk import workers, gunicorn workers)
+_generators = weakref.WeakSet()
+
+
+class _BatchedIdGenerator(ABC):
+    """Hands out ids generated batch_size at a time, in generation order."""
+    name = None
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or Config.RECEIPT_ID_BATCH
+        # reversed: pop() hands out the next id, atomically, without taking the lock
+        self._pool = []
+        self._lock = threading.Lock()
+        _generators.add(self)
+
+    def _reset(self):
+        """Forgets the ids drawn before a fork, the parent hands them out."""
+        self._pool = []
+        self._lock = threading.Lock()
+
+    def _fresh(self):
+        """Whether the ids of the pool may still be handed out."""
+        return True
+
+    def new_id(self):
+        while True:
+            if self._fresh():
+                try:
+                    return self._pool.pop()
+                except IndexError:
+                    pass
+            with self._lock:
+                if not self._pool or not self._fresh():
+                    self._pool = self._generate(self.batch_size)[::-1]
+
+    def new_ids(self, count):
+        """count ids in one call, for a batch of receipts: the rest of the batch, then new ones."""
+        ids = []
+        while len(ids) < count and self._fresh():
+            try:
+                ids.append(self._pool.pop())
+            except IndexError:
+                break
+        if len(ids) < count:
+            with self._lock:
+                ids.extend(self._generate(count - len(ids)))
+        return ids
+
+    @abstractmethod
+    def _generate(self, count):
+        """count new ids, in order; called under self._lock."""
+
+
+class UUID4IdGenerator(_BatchedIdGenerator):
+    name = 'uuid4'
+
+    def _generate(self, count):
+        data = os.urandom(16 * count)
+        return [(int.from_bytes(data[start:start + 16], 'big') & ~(VERSION_MASK | VARIANT_MASK))
+                | (4 << VERSION_SHIFT) | RFC_4122_VARIANT
+                for start in range(0, len(data), 16)]
+
+
+class UUID7IdGenerator(_BatchedIdGenerator):
+    name = 'uuid7'
+
+    def __init__(self, batch_size=None, clock=time.time_ns, max_age_ms=None):
+        super().__init__(batch_size)
+        self.clock = clock
+        self.max_age_ms = Config.RECEIPT_ID_MAX_AGE_MS if max_age_ms is None else max_age_ms
+        self._millis = 0
+        self._counter = 0
+
+    def _reset(self):
+        super()._reset()
+        # a random counter seed for the child, not the parent's counter
+        self._millis = 0
+
+    def _fresh(self):
+        # ids dropped with a stale pool are all below the ones generated next: still monotonic
+        return self.clock() // 1_000_000 - self._millis <= self.max_age_ms
+
+    def _seed(self):
+        return int.from_bytes(os.urandom(10), 'big') >> (80 - COUNTER_SEED_BITS)
+
+    def _generate(self, count):
+        # called under self._lock
+        millis = self.clock() // 1_000_000
+        if millis > self._millis:
+            self._millis, counter = millis, self._seed()
+        else:
+            # same millisecond, or the clock went back: keep counting from the last id
+            counter = self._counter
+        steps = os.urandom(STEP_BYTES * count)
+        ids = []
+        for start in range(0, len(steps), STEP_BYTES):
+            counter += 1 + int.from_bytes(steps[start:start + STEP_BYTES], 'big')
+            if counter >> COUNTER_BITS:
+                # counter exhausted: move to the next millisecond, ahead of the clock
+                self._millis += 1
+                counter = self._seed()
+            ids.append((self._millis << 80) | (7 << VERSION_SHIFT)
+                       | ((counter >> RAND_B_BITS) << 64) | RFC_4122_VARIANT
+                       | (counter & RAND_B_MASK))
+        self._counter = counter
+        return ids
+
+
+def _reset_after_fork():
+    for generator in list(_generators):
+        generator._reset()  # pylint: disable=protected-access
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+ID_GENERATORS = {'uuid7': UUID7IdGenerator, 'uuid4': UUID4IdGenerator}
+
+
+def create_id_generator(name=None, batch_size=None):
+    name = name or Config.RECEIPT_ID_GENERATOR
+    if name not in ID_GENERATORS:
+        raise ValueError(f"Unknown receipt id generator '{name}', expected one of "
+                         f"{sorted(ID_GENERATORS)}")
+    return ID_GENERATORS[name](batch_size)
+
+
+id_generator = create_id_generator()
@@ -0,0 +1,112 @@
+"""
+Single-pass validation and parsing of receipt input.
+
+parse_receipt_input checks request_schema (src/validation_schema.py) and produces the parsed
+Receipt fields while walking the input once. Date, time and money strings are checked and
+converted by hand instead of through regexes, strptime and float (money to integer cents); only
+the free-text patterns (retailer, shortDescription) use a precompiled regex.
+Errors are raised as ReceiptValidationError with jsonschema-style messages. Acceptance is exactly
+the schema's: like jsonschema's re.search, '$' also matches before a trailing newline.
+"""
+import datetime
+import re
+
+from src.exceptions import ReceiptValidationError
+from src.validation_schema import request_schema
+
+_properties = request_schema['properties']
+_item_schema = _properties['items']['items']
+REQUIRED_FIELDS = request_schema['required']
+REQUIRED_ITEM_FIELDS = _item_schema['required']
+_retailer_match = re.compile(_properties['retailer']['pattern']).match
+_description_match = re.compile(_item_schema['properties']['shortDescription']['pattern']).match
+
+
+def _error(message, path):
+    return ReceiptValidationError(f"{message} on instance{path}")
+
+
+def _pattern_error(value, field, path):
+    return _error(f"{value!r} does not match {field['pattern']!r}", path)
+
+
+def _string(data, name, path):
+    value = data[name]
+    if not isinstance(value, str):
+        raise _error(f"{value!r} is not of type 'string'", f"{path}[{name!r}]")
+    return value
+
+
+def _check_required(data, required, path):
+    for name in required:
+        if name not in data:
+            raise _error(f"{name!r} is a required property", path)
+
+
+def parse_money(value, field, path):
+    """Amount in cents of a '^\\d+\\.\\d{2}$' string."""
+    amount = value[:-1] if value.endswith('\n') else value
+    dot = len(amount) - 3
+    whole, cents = amount[:dot], amount[dot + 1:]
+    if dot < 1 or amount[dot] != '.' or not whole.isdecimal() or not cents.isdecimal():
+        raise _pattern_error(value, field, path)
+    return int(whole) * 100 + int(cents)
+
+
+def parse_date_time(date, time, path):
+    """datetime of '^\\d{4}-\\d{2}-\\d{2}$' date and '^\\d{2}:\\d{2}$' time strings."""
+    day = date[:-1] if date.endswith('\n') else date
+    if not (len(day) == 10 and day[4] == '-' and day[7] == '-' and day[:4].isdecimal()
+            and day[5:7].isdecimal() and day[8:].isdecimal()):
+        raise _pattern_error(date, _properties['purchaseDate'], f"{path}['purchaseDate']")
+    minute = time[:-1] if time.endswith('\n') else time
+    if not (len(minute) == 5 and minute[2] == ':' and minute[:2].isdecimal()
+            and minute[3:].isdecimal()):
+        raise _pattern_error(time, _properties['purchaseTime'], f"{path}['purchaseTime']")
+    # out of range values (month 13, 25:00) match the schema; they fail here with a plain ValueError
+    return datetime.datetime(int(day[:4]), int(day[5:7]), int(day[8:]),
+                             int(minute[:2]), int(minute[3:]))
+
+
+def parse_item(item, path):
+    if not isinstance(item, dict):
+        raise _error(f"{item!r} is not of type 'object'", path)
+    _check_required(item, REQUIRED_ITEM_FIELDS, path)
+    description = _string(item, 'shortDescription', path)
+    if not _description_match(description):
+        raise _pattern_error(description, _item_schema['properties']['shortDescription'],
+                             f"{path}['shortDescription']")
+    price = _string(item, 'price', path)
+    cents = parse_money(price, _item_schema['properties']['price'], f"{path}['price']")
+    return {"shortDescription": description.strip(), "price": cents}
+
+
+def parse_receipt_input(data, path=''):
+    """
+    Validates receipt input against request_schema and parses it in one pass.
+    Returns (retailer, purchase_date, purchase_time, purchase_date_time, total, items)
+    with the total and the item prices in integer cents.
+    """
+    if not isinstance(data, dict):
+        raise _error(f"{data!r} is not of type 'object'", path)
+    _check_required(data, REQUIRED_FIELDS, path)
+
+    retailer = _string(data, 'retailer', path)
+    if not _retailer_match(retailer):
+        raise _pattern_error(retailer, _properties['retailer'], f"{path}['retailer']")
+    purchase_date = _string(data, 'purchaseDate', path)
+    purchase_time = _string(data, 'purchaseTime', path)
+    total = _string(data, 'total', path)
+    total_cents = parse_money(total, _properties['total'], f"{path}['total']")
+
+    items = data['items']
+    if not isinstance(items, list):
+        raise _error(f"{items!r} is not of type 'array'", f"{path}['items']")
+    if not items:
+        raise _error("[] should be non-empty", f"{path}['items']")
+    parsed_items = [parse_item(item, f"{path}['items'][{position}]")
+                    for position, item in enumerate(items)]
+
+    purchase_date_time = parse_date_time(purchase_date, purchase_time, path)
+    return (retailer, purchase_date, purchase_time, purchase_date_time,
+            total_cents, parsed_items)
@@ -0,0 +1,484 @@
+"""
+Durable receipt persistence: an append-only segmented log plus compact binary snapshots.
+
+Stored receipts are appended to the current log segment as length + crc32 framed binary
+records. A snapshot is a columnar image (SnapshotTable) of every receipt up to a segment
+boundary, so on startup the storage is rebuilt by memory-mapping the snapshot, bulk-copying
+its columns and replaying only the segments written after it.
+"""
+import mmap
+import os
+import struct
+import threading
+import uuid
+import zlib
+from array import array
+
+from src.config import Config
+from src.exceptions import ReceiptLogCorrupted
+from src.model.receipt import RECEIPT_ID_NAME, datetime_to_minutes, minutes_to_datetime
+from src.model.receipt_ids import format_receipt_id
+
+FSYNC_ALWAYS = 'always'
+FSYNC_INTERVAL = 'interval'
+FSYNC_NEVER = 'never'
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER)
+
+# payload length, crc32 of the payload
+FRAME = struct.Struct('<II')
+# receipt id, purchase minutes, total (cents), points, retailer length, item count
+RECORD = struct.Struct('<16sqqqII')
+# price (cents), description length
+ITEM = struct.Struct('<qI')
+# magic, version, receipt count, first log segment not covered by the snapshot
+SNAPSHOT_HEADER = struct.Struct('<8sIQQ')
+# byte length of the snapshot section that follows
+SECTION = struct.Struct('<Q')
+SNAPSHOT_MAGIC = b'RCPTSNAP'
+SNAPSHOT_VERSION = 3
+SNAPSHOT_NAME = 'snapshot.bin'
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.log'
+WRITE_BUFFER_BYTES = 1024 * 1024
+
+
+def encode_record(record):
+    """Framed binary form of a stored receipt record."""
+    retailer = record['retailer'].encode()
+    parts = [RECORD.pack(uuid.UUID(record[RECEIPT_ID_NAME]).bytes,
+                         datetime_to_minutes(record['purchaseDateTime']),
+                         record['total'], record['points'],
+                         len(retailer), len(record['items'])),
+             retailer]
+    for item in record['items']:
+        description = item['shortDescription'].encode()
+        parts.append(ITEM.pack(item['price'], len(description)))
+        parts.append(description)
+    payload = b''.join(parts)
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+class RecordDecoder:
+    """
+    Decodes record payloads. Repeated retailers, descriptions and purchase minutes
+    are decoded once and shared, which keeps bulk recovery fast and the result small.
+    """
+    CACHE_LIMIT = 1 << 20
+
+    def __init__(self):
+        self.strings = {}
+        self.date_times = {}
+
+    def _string(self, raw):
+        value = self.strings.get(raw)
+        if value is None:
+            if len(self.strings) >= self.CACHE_LIMIT:
+                self.strings.clear()
+            value = self.strings[raw] = raw.decode()
+        return value
+
+    def _date_time(self, minutes):
+        value = self.date_times.get(minutes)
+        if value is None:
+            if len(self.date_times) >= self.CACHE_LIMIT:
+                self.date_times.clear()
+            value = self.date_times[minutes] = minutes_to_datetime(minutes)
+        return value
+
+    def decode(self, buffer, offset):
+        """Decodes the record payload starting at offset of buffer (bytes or mmap)."""
+        receipt_id, minutes, total, points, retailer_length, item_count = \
+            RECORD.unpack_from(buffer, offset)
+        offset += RECORD.size
+        retailer = self._string(buffer[offset:offset + retailer_length])
+        offset += retailer_length
+        items = []
+        for _ in range(item_count):
+            price, description_length = ITEM.unpack_from(buffer, offset)
+            offset += ITEM.size
+            description = self._string(buffer[offset:offset + description_length])
+            items.append({"shortDescription": description, "price": price})
+            offset += description_length
+        return {
+            RECEIPT_ID_NAME: format_receipt_id(int.from_bytes(receipt_id, 'big')),
+            "retailer": retailer,
+            "purchaseDateTime": self._date_time(minutes),
+            "total": total,
+            "items": items,
+            "points": points,
+        }
+
+
+def decode_record(buffer, offset):
+    """Decodes the record payload starting at offset of buffer (bytes or mmap)."""
+    return RecordDecoder().decode(buffer, offset)
+
+
+def iter_frames(buffer, offset=0, verify=True):
+    """
+    Yields (record, end offset) for consecutive frames of buffer.
+    Stops at the first torn or (when verify) checksum-mismatching frame.
+    """
+    decode = RecordDecoder().decode
+    size = len(buffer)
+    while offset + FRAME.size <= size:
+        length, crc = FRAME.unpack_from(buffer, offset)
+        start, end = offset + FRAME.size, offset + FRAME.size + length
+        if end > size or (verify and zlib.crc32(buffer[start:end]) != crc):
+            return
+        yield decode(buffer, start), end
+        offset = end
+
+
+class SnapshotTable:
+    """
+    Columnar image of stored receipts and the layout of snapshot files.
+    Column names match CompactReceiptStorage, items of row r are
+    item_* [item_offset[r]:item_offset[r + 1]], retailer/item_description index the string pools.
+    Columns are written in native byte order.
+    """
+    # column order of snapshot files
+    COLUMNS = ('id_high', 'id_low', 'retailer', 'purchase_minutes', 'total', 'points',
+               'item_offset', 'item_description', 'item_price')
+
+    def __init__(self, first_segment=0):
+        self.first_segment = first_segment
+        self.id_high = array('Q')
+        self.id_low = array('Q')
+        self.retailer = array('I')
+        self.purchase_minutes = array('q')
+        self.total = array('q')
+        self.points = array('q')
+        self.item_offset = array('Q')
+        self.item_description = array('I')
+        self.item_price = array('q')
+        self.retailers = []
+        self.descriptions = []
+
+    def __len__(self):
+        return len(self.points)
+
+    @classmethod
+    def from_records(cls, records):
+        table = cls()
+        table.item_offset.append(0)
+        retailers, descriptions = {}, {}
+        for record in records:
+            id_int = uuid.UUID(record[RECEIPT_ID_NAME]).int
+            table.id_high.append(id_int >> 64)
+            table.id_low.append(id_int & 0xFFFFFFFFFFFFFFFF)
+            table.retailer.append(cls._pooled(record['retailer'], retailers, table.retailers))
+            table.purchase_minutes.append(datetime_to_minutes(record['purchaseDateTime']))
+            table.total.append(record['total'])
+            table.points.append(record['points'])
+            for item in record['items']:
+                table.item_description.append(
+                    cls._pooled(item['shortDescription'], descriptions, table.descriptions))
+                table.item_price.append(item['price'])
+            table.item_offset.append(len(table.item_price))
+        return table
+
+    @staticmethod
+    def _pooled(value, index, pool):
+        position = index.get(value)
+        if position is None:
+            position = index[value] = len(pool)
+            pool.append(value)
+        return position
+
+    def records(self):
+        """Yields the table rows as stored receipt records."""
+        date_times = {}
+        for row, minutes in enumerate(self.purchase_minutes):
+            date_time = date_times.get(minutes)
+            if date_time is None:
+                date_time = date_times[minutes] = minutes_to_datetime(minutes)
+            start, end = self.item_offset[row], self.item_offset[row + 1]
+            yield {
+                RECEIPT_ID_NAME: format_receipt_id((self.id_high[row] << 64) | self.id_low[row]),
+                "retailer": self.retailers[self.retailer[row]],
+                "purchaseDateTime": date_time,
+                "total": self.total[row],
+                "items": [
+                    {"shortDescription": self.descriptions[description], "price": price}
+                    for description, price in zip(self.item_description[start:end],
+                                                  self.item_price[start:end])
+                ],
+                "points": self.points[row],
+            }
+
+    def write(self, file):
+        file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(self),
+                                        self.first_segment))
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            file.write(SECTION.pack(len(column) * column.itemsize))
+            column.tofile(file)
+        for pool in (self.retailers, self.descriptions):
+            encoded = [value.encode() for value in pool]
+            lengths = array('Q', map(len, encoded))
+            file.write(SECTION.pack(len(lengths) * lengths.itemsize))
+            lengths.tofile(file)
+            blob = b''.join(encoded)
+            file.write(SECTION.pack(len(blob)))
+            file.write(blob)
+
+    @classmethod
+    def read(cls, buffer, path):
+        """Reads a table from buffer (the memory-mapped snapshot file at path)."""
+        magic, version, count, first_segment = SNAPSHOT_HEADER.unpack_from(buffer, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ReceiptLogCorrupted(f'Unknown snapshot format in {path}')
+        table = cls(first_segment)
+        offset = SNAPSHOT_HEADER.size
+        # sections are copied straight out of the mapping, without intermediate bytes objects
+        view = memoryview(buffer)
+
+        def section():
+            nonlocal offset
+            (length,) = SECTION.unpack_from(buffer, offset)
+            start, offset = offset + SECTION.size, offset + SECTION.size + length
+            if offset > len(buffer):
+                raise ReceiptLogCorrupted(f'Snapshot {path} is truncated')
+            return view[start:offset]
+
+        try:
+            for name in cls.COLUMNS:
+                getattr(table, name).frombytes(section())
+            for pool in (table.retailers, table.descriptions):
+                lengths = array('Q')
+                lengths.frombytes(section())
+                blob = section()
+                start = 0
+                for length in lengths:
+                    pool.append(str(blob[start:start + length], 'utf-8'))
+                    start += length
+                blob.release()
+        finally:
+            view.release()
+
+        if len(table) != count or len(table.item_offset) != count + 1:
+            raise ReceiptLogCorrupted(f'Snapshot {path} holds {len(table)} of {count} receipts')
+        return table
+
+
+class ReceiptLog:
+    """
+    Write-ahead log of stored receipts with group commit and periodic snapshots.
+    fsync_policy: 'always' fsyncs before append returns (concurrent appends share one fsync),
+    'interval' fsyncs every fsync_interval_ms from a background thread,
+    'never' only hands the data to the OS.
+    """
+    def __init__(self, directory, fsync_policy=None, fsync_interval_ms=None,
+                 segment_max_bytes=None, snapshot_every=None):
+        self.fsync_policy = fsync_policy or Config.FSYNC_POLICY
+        if self.fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{self.fsync_policy}', "
+                             f"expected one of {FSYNC_POLICIES}")
+        self.fsync_interval = (fsync_interval_ms or Config.FSYNC_INTERVAL_MS) / 1000
+        self.segment_max_bytes = segment_max_bytes or Config.LOG_SEGMENT_MAX_BYTES
+        self.snapshot_every = Config.SNAPSHOT_EVERY if snapshot_every is None else snapshot_every
+
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        segments = self.segment_numbers()
+        self._segment = segments[-1] if segments else 0
+        self._file = None
+
+        self._write_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._written = 0
+        self._synced = 0
+        self._appended_since_snapshot = 0
+        self._snapshot_running = False
+        self._snapshot_lock = threading.Lock()
+
+        self._stop = threading.Event()
+        self._flusher = None
+        if self.fsync_policy == FSYNC_INTERVAL:
+            self._flusher = threading.Thread(target=self._flush_periodically,
+                                             name='receipt-log-fsync', daemon=True)
+            self._flusher.start()
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.directory, SNAPSHOT_NAME)
+
+    def segment_path(self, number):
+        return os.path.join(self.directory, f'{SEGMENT_PREFIX}{number:010d}{SEGMENT_SUFFIX}')
+
+    def segment_numbers(self):
+        return sorted(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                      for name in os.listdir(self.directory)
+                      if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+
+    # recovery
+
+    def recover(self):
+        """
+        Returns (SnapshotTable or None, iterator over the receipt records logged after it).
+        Iterating the log tail truncates away a torn write at the end of the last segment.
+        """
+        table = self.read_snapshot()
+        return table, self._replay(table.first_segment if table is not None else 0)
+
+    def read_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return None
+        with open(self.snapshot_path, 'rb') as snapshot, \
+                mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return SnapshotTable.read(buffer, self.snapshot_path)
+
+    def _replay(self, first_segment):
+        segments = [number for number in self.segment_numbers() if number >= first_segment]
+        for number in segments:
+            path = self.segment_path(number)
+            size = os.path.getsize(path)
+            valid_end = 0
+            if size:
+                with open(path, 'rb') as segment, \
+                        mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    for record, valid_end in iter_frames(buffer):
+                        yield record
+            if valid_end < size:
+                if number != segments[-1]:
+                    raise ReceiptLogCorrupted(f'Corrupted log segment {path} at byte {valid_end}')
+                os.truncate(path, valid_end)
+
+    # appending
+
+    def append(self, record):
+        self.append_many([record])
+
+    def append_many(self, records):
+        data = b''.join(encode_record(record) for record in records)
+        with self._write_lock:
+            if self._file is None:
+                self._open_segment()
+            elif self._file.tell() >= self.segment_max_bytes:
+                self._rotate()
+            self._file.write(data)
+            # handed to the OS right away, so a process crash loses nothing already acknowledged
+            self._file.flush()
+            self._written += 1
+            position = self._written
+            self._appended_since_snapshot += len(records)
+
+        if self.fsync_policy == FSYNC_ALWAYS:
+            self._sync(position)
+
+    def _open_segment(self):
+        path = self.segment_path(self._segment)
+        created = not os.path.exists(path)
+        self._file = open(  # pylint: disable=consider-using-with
+            path, 'ab', buffering=WRITE_BUFFER_BYTES)
+        if created:
+            self._fsync_directory()
+
+    def _close_segment(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+    def _rotate(self):
+        self._close_segment()
+        self._segment += 1
+        self._open_segment()
+
+    def rotate(self):
+        """Starts a new segment, returns its number."""
+        with self._write_lock:
+            self._rotate()
+            return self._segment
+
+    def _sync(self, position):
+        """Group commit: one fsync covers every append written before it started."""
+        with self._sync_lock:
+            if self._synced >= position:
+                return
+            with self._write_lock:
+                target = self._written
+                if self._file is None:
+                    self._synced = target
+                    return
+                descriptor = os.dup(self._file.fileno())
+            try:
+                os.fsync(descriptor)
+            finally:
+                os.close(descriptor)
+            self._synced = target
+
+    def _flush_periodically(self):
+        while not self._stop.wait(self.fsync_interval):
+            self._sync(self._written)
+
+    def _fsync_directory(self):
+        descriptor = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+    # snapshots
+
+    def claim_snapshot(self):
+        """True (once) when enough receipts were appended since the last snapshot."""
+        with self._write_lock:
+            if (not self.snapshot_every or self._snapshot_running
+                    or self._appended_since_snapshot < self.snapshot_every):
+                return False
+            self._snapshot_running = True
+            self._appended_since_snapshot = 0
+            return True
+
+    def release_snapshot(self):
+        with self._write_lock:
+            self._snapshot_running = False
+
+    def snapshot(self, read_table):
+        """
+        Rotates the log and snapshots read_table(), called after the rotation so it sees every
+        receipt logged to the segments the snapshot replaces. Returns the number of receipts.
+        """
+        with self._snapshot_lock:
+            first_segment = self.rotate()
+            table = read_table()
+            table.first_segment = first_segment
+            self.write_snapshot(table)
+            return len(table)
+
+    def write_snapshot(self, table):
+        """Atomically replaces the snapshot, then deletes the log segments it covers."""
+        temporary_path = self.snapshot_path + '.tmp'
+        with open(temporary_path, 'wb', buffering=WRITE_BUFFER_BYTES) as snapshot:
+            table.write(snapshot)
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(temporary_path, self.snapshot_path)
+        self._fsync_directory()
+
+        for number in self.segment_numbers():
+            if number < table.first_segment:
+                os.remove(self.segment_path(number))
+
+    # lifecycle
+
+    def reset(self):
+        """Drops every logged receipt and the snapshot, waiting for a running snapshot first."""
+        with self._snapshot_lock, self._write_lock:
+            self._close_segment()
+            for number in self.segment_numbers():
+                os.remove(self.segment_path(number))
+            if os.path.exists(self.snapshot_path):
+                os.remove(self.snapshot_path)
+            self._segment = 0
+            self._appended_since_snapshot = 0
+
+    def close(self):
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        with self._write_lock:
+            self._close_segment()
@@ -1,25 +1,47 @@
 """
 This is the main application file.
 It defines the Flask app, routes, and error handling.
-It uses flask_expects_json for request validation.
+Receipts are validated against request_schema while they are parsed (src/model/receipt_parser.py).
 """
+import atexit
+import datetime
 import logging
-from flask import Flask, request, jsonify
-from flask_expects_json import expects_json
+from flask import Flask, Response, request, jsonify, abort, g
+from werkzeug.exceptions import BadRequest
 
+from src import json_codec, metrics
 from src.config import Config, STATUS_CODE
-from src.receipt_storage import ReceiptStorage
-from src.validation_schema import request_schema
-from src.exceptions import ReceiptNotFound, ReceiptIsDuplicate
+from src.storage_factory import create_receipt_storage
+from src.logging_config import configure_logging
+from src.response_cache import ResponseCache, etag_matches
+from src.receipt_export import EXPORT_FORMATS, export_chunks
+from src.idempotency_cache import IdempotencyCache, IDEMPOTENCY_KEY_HEADER, request_key
+from src.ingest_pipeline import IngestPipeline
+from src.model.money import cents_to_amount
+from src.model.receipt import Receipt
+from src.exceptions import (ReceiptNotFound, ReceiptIsDuplicate, ReceiptValidationError,
+                            IngestQueueFull, ReceiptPending)
 
 app = Flask(__name__)
+app.json = json_codec.JSONProvider(app)
 
-# AK Note: simplified logging: for prod process should be saved in log file
-logging.basicConfig(level=logging.DEBUG,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger(__name__)
 
-receipt_storage = ReceiptStorage()
+receipt_storage = create_receipt_storage()
+metrics.register_storage(receipt_storage)
+response_cache = ResponseCache()
+receipt_storage.add_clear_listener(response_cache.clear)
+idempotency_cache = IdempotencyCache()
+receipt_storage.add_clear_listener(idempotency_cache.clear)
+# asynchronous /receipts/process (Config.INGEST_ASYNC), None when receipts are stored in the request
+ingest = IngestPipeline(receipt_storage) if Config.INGEST_ASYNC else None
+if ingest is not None:
+    receipt_storage.add_clear_listener(ingest.clear_rejected)
+    # receipts answered 202 but still queued are stored before the process exits
+    atexit.register(ingest.close)
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
 
 
 @app.errorhandler(STATUS_CODE.INPUT_ERROR)
@@ -27,55 +49,384 @@ def handle_invalid_json(error):
     return jsonify({'message': f'Input Error {str(error)}'}), STATUS_CODE.INPUT_ERROR
 
 
+@app.before_request
+def start_request_clock():
+    g.started = metrics.clock()
+
+
+@app.after_request
+def observe_request(response):
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.observe_request(route, response.status_code, g.started)
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    if not metrics.enabled:
+        return jsonify({'message': 'Metrics are disabled'}), STATUS_CODE.NO_RECORD_FOUND
+    return Response(metrics.REGISTRY.render(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+
+def _idempotency_key():
+    """Key of the request in idempotency_cache, None with the cache disabled."""
+    if not idempotency_cache.enabled:
+        return None
+    idempotency_key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+    return request_key(None if idempotency_key else request.get_data(), idempotency_key)
+
+
 @app.route('/receipts/process', methods=['POST'])
-@expects_json(request_schema)  # verifies json, otherwise returns status_code = 400
 def process_receipt():
+    # a retry is answered before its body is parsed
+    key = _idempotency_key()
+    if key is not None:
+        replay = idempotency_cache.get(key)
+        if replay is not None:
+            metrics.REPLAYS.inc()
+            receipt_id, status_code = replay
+            return jsonify({'id': receipt_id}), status_code
+
+    input_data = request.get_json()  # 415 for other content types, 400 for malformed JSON
+    if input_data is None:
+        abort(STATUS_CODE.INPUT_ERROR, 'Failed to decode JSON object')
+    if ingest is not None:
+        return process_receipt_async(input_data, key)
     try:
-        receipt_id, _ = receipt_storage.process_receipt(request.get_json())
+        receipt_id, _ = receipt_storage.process_receipt(input_data)
         logger.info('Processed receipt id=%s', receipt_id)
+        if key is not None:
+            idempotency_cache.put(key, receipt_id, STATUS_CODE.SUCCESS)
 
-        return jsonify({'id': receipt_id}), STATUS_CODE.SUCCESS
+        started = metrics.clock()
+        response = jsonify({'id': receipt_id})
+        metrics.observe_stage(metrics.STAGE_SERIALIZE, started)
+        return response, STATUS_CODE.SUCCESS
+    except ReceiptValidationError as e:
+        return handle_invalid_json(BadRequest(str(e)))
     except ReceiptIsDuplicate as e:
-        message = str(e)
-        logger.error(str(e))
-        return jsonify({'message': message}), STATUS_CODE.INPUT_ERROR
+        logger.error('%s', e)
+        return jsonify({'message': str(e)}), STATUS_CODE.INPUT_ERROR
     except Exception as e:  # pylint: disable=broad-except
         message = f'An error occurred during receipt processing - {str(e)}'
         logger.error(message)
         return jsonify({'message': message}), STATUS_CODE.UNKNOWN_ERROR
 
 
+def process_receipt_async(input_data, key):
+    """202 with the id of a validated receipt queued for scoring and storage."""
+    try:
+        receipt_id = ingest.submit(input_data)
+        logger.info('Queued receipt id=%s', receipt_id)
+        if key is not None:
+            idempotency_cache.put(key, receipt_id, STATUS_CODE.ACCEPTED)
+        return jsonify({'id': receipt_id}), STATUS_CODE.ACCEPTED
+    except ReceiptValidationError as e:
+        return handle_invalid_json(BadRequest(str(e)))
+    except ReceiptIsDuplicate as e:
+        logger.error('%s', e)
+        return jsonify({'message': str(e)}), STATUS_CODE.INPUT_ERROR
+    except IngestQueueFull as e:
+        logger.error('%s', e)
+        return (jsonify({'message': str(e)}), STATUS_CODE.SERVICE_UNAVAILABLE,
+                {'Retry-After': '1'})
+    except Exception as e:  # pylint: disable=broad-except
+        message = f'An error occurred during receipt processing - {str(e)}'
+        logger.error(message)
+        return jsonify({'message': message}), STATUS_CODE.UNKNOWN_ERROR
+
+
+def queued_receipt_response(receipt_id):
+    """
+    None once receipt_id is not queued for asynchronous ingestion, otherwise the response
+    for it: 202 pending, or the error it was rejected with.
+    """
+    if ingest is None:
+        return None
+    try:
+        ingest.check(receipt_id)
+    except ReceiptPending:
+        return jsonify({'id': receipt_id, 'status': 'pending'}), STATUS_CODE.ACCEPTED
+    except ReceiptIsDuplicate as e:
+        return jsonify({'message': str(e)}), STATUS_CODE.INPUT_ERROR
+    except Exception as e:  # pylint: disable=broad-except
+        return (jsonify({'message': f'An error occurred during receipt processing - {str(e)}'}),
+                STATUS_CODE.UNKNOWN_ERROR)
+    return None
+
+
+def _read_batch_items():
+    """
+    Reads the batch body: a JSON array of receipts or NDJSON (one receipt per line).
+    NDJSON lines that are not valid JSON are returned as ValueError items.
+    """
+    if request.mimetype in NDJSON_MIMETYPES:
+        items = []
+        for line in request.get_data().splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json_codec.loads(line))
+            except ValueError as e:
+                items.append(e)
+        return items
+
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        abort(STATUS_CODE.INPUT_ERROR, 'Expected a JSON array of receipts')
+    return items
+
+
+def _batch_error(message, status_code):
+    return {'message': message, 'status': status_code}
+
+
+@app.route('/receipts/process/batch', methods=['POST'])
+def process_receipts_batch():
+    items = _read_batch_items()
+    if not items:
+        abort(STATUS_CODE.INPUT_ERROR, 'Batch contains no receipts')
+    if len(items) > Config.BATCH_MAX_SIZE:
+        abort(STATUS_CODE.INPUT_ERROR,
+              f'Batch contains {len(items)} receipts, maximum is {Config.BATCH_MAX_SIZE}')
+
+    results = [None] * len(items)
+    valid_positions = []
+    for position, item in enumerate(items):
+        if isinstance(item, ValueError):
+            results[position] = _batch_error(f'Input Error {str(item)}', STATUS_CODE.INPUT_ERROR)
+            continue
+        valid_positions.append(position)
+
+    try:
+        processed = receipt_storage.process_receipts([items[pos] for pos in valid_positions])
+    except Exception as e:  # pylint: disable=broad-except
+        message = f'An error occurred during batch receipt processing - {str(e)}'
+        logger.error(message)
+        return jsonify({'message': message}), STATUS_CODE.UNKNOWN_ERROR
+
+    for position, outcome in zip(valid_positions, processed):
+        if isinstance(outcome, ReceiptValidationError):
+            results[position] = _batch_error(f'Input Error {str(outcome)}', STATUS_CODE.INPUT_ERROR)
+        elif isinstance(outcome, ReceiptIsDuplicate):
+            results[position] = _batch_error(str(outcome), STATUS_CODE.INPUT_ERROR)
+        elif isinstance(outcome, Exception):
+            results[position] = _batch_error(
+                f'An error occurred during receipt processing - {str(outcome)}',
+                STATUS_CODE.UNKNOWN_ERROR)
+        else:
+            results[position] = {'id': outcome}
+
+    logger.info('Processed receipt batch of %d items', len(items))
+    return jsonify({'results': results}), STATUS_CODE.SUCCESS
+
+
+def _query_datetime(name):
+    """
+    Optional ISO date (YYYY-MM-DD) or date-time (YYYY-MM-DDTHH:MM) query argument. Purchase
+    date-times have no time zone, so neither may the argument.
+    """
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        parsed = None
+    if parsed is None or parsed.tzinfo is not None:
+        abort(STATUS_CODE.INPUT_ERROR,
+              f"Invalid {name} '{value}', expected YYYY-MM-DD or YYYY-MM-DDTHH:MM")
+    return parsed
+
+
+def _query_limit():
+    limit = request.args.get('limit', Config.QUERY_LIMIT, type=int)
+    if not 1 <= limit <= Config.QUERY_MAX_LIMIT:
+        abort(STATUS_CODE.INPUT_ERROR, f'limit must be between 1 and {Config.QUERY_MAX_LIMIT}')
+    return limit
+
+
+def _totals_response(totals):
+    count, total, points = totals
+    return {'count': count, 'total': cents_to_amount(total), 'points': points}
+
+
+@app.route('/receipts/search', methods=['GET'])
+def search_receipts():
+    """
+    Receipts purchased in [start, end), of retailer if given, ordered by purchase date-time.
+    next is the after argument of the following page (null on the last one).
+    """
+    limit = _query_limit()
+    try:
+        receipt_ids = receipt_storage.query_receipt_ids(
+            request.args.get('retailer'), _query_datetime('start'), _query_datetime('end'),
+            request.args.get('after'), limit)
+    except ReceiptNotFound:
+        abort(STATUS_CODE.INPUT_ERROR, f"Unknown after receipt id '{request.args.get('after')}'")
+    # ids dropped by a bounded storage since they were indexed are left out
+    receipts = [Receipt.record_response(record)
+                for record in receipt_storage.get_many(receipt_ids).values()]
+    next_after = receipt_ids[-1] if len(receipt_ids) == limit else None
+    return jsonify({'receipts': receipts, 'next': next_after}), STATUS_CODE.SUCCESS
+
+
+def _query_count(name, default=None):
+    """Optional non-negative int query argument."""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    if not value.isdigit():
+        abort(STATUS_CODE.INPUT_ERROR, f"Invalid {name} '{value}', expected a non-negative integer")
+    return int(value)
+
+
+@app.route('/receipts/export', methods=['GET'])
+def export_receipts():
+    """
+    Stored receipts purchased in [start, end), of retailer if given, streamed in storage order as
+    NDJSON (format=ndjson, the default) or CSV (format=csv). Every receipt has a cursor: passed as
+    cursor, the export resumes after that receipt. limit stops the export after limit receipts.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        abort(STATUS_CODE.INPUT_ERROR,
+              f"Unknown format '{export_format}', expected one of {sorted(EXPORT_FORMATS)}")
+    cursor, limit = _query_count('cursor', 0), _query_count('limit')
+    if cursor and not receipt_storage.resumable_export:
+        abort(STATUS_CODE.INPUT_ERROR, "Exports of this storage can not be resumed from a cursor")
+    rows = receipt_storage.export_records(cursor, request.args.get('retailer'),
+                                          _query_datetime('start'), _query_datetime('end'))
+    logger.info('Exporting receipts as %s from cursor %d', export_format, cursor)
+    return Response(export_chunks(rows, export_format, limit),
+                    mimetype=EXPORT_FORMATS[export_format][0])
+
+
+@app.route('/receipts/stats/retailers', methods=['GET'])
+def retailer_stats():
+    """Receipt count, total and points per retailer, of the days in [start, end) if given."""
+    totals = receipt_storage.retailer_totals(_query_datetime('start'), _query_datetime('end'))
+    return jsonify({'retailers': [dict(retailer=retailer, **_totals_response(totals[retailer]))
+                                  for retailer in sorted(totals)]}), STATUS_CODE.SUCCESS
+
+
+@app.route('/receipts/stats/days', methods=['GET'])
+def day_stats():
+    """Receipt count, total and points per purchase day in [start, end), of retailer if given."""
+    days = receipt_storage.day_totals(request.args.get('retailer'),
+                                      _query_datetime('start'), _query_datetime('end'))
+    return jsonify({'days': [dict(date=day.isoformat(), **_totals_response(totals))
+                             for day, *totals in days]}), STATUS_CODE.SUCCESS
+
+
+def _read_batch_ids():
+    """receipt ids of a batchGet body: {"ids": [...]} of at most Config.BATCH_GET_MAX_SIZE ids."""
+    body = request.get_json(silent=True)
+    receipt_ids = body.get('ids') if isinstance(body, dict) else None
+    if not isinstance(receipt_ids, list) or not all(isinstance(receipt_id, str)
+                                                    for receipt_id in receipt_ids):
+        abort(STATUS_CODE.INPUT_ERROR, 'Expected a JSON object with an "ids" array of receipt ids')
+    if len(receipt_ids) > Config.BATCH_GET_MAX_SIZE:
+        abort(STATUS_CODE.INPUT_ERROR,
+              f'Batch contains {len(receipt_ids)} ids, maximum is {Config.BATCH_GET_MAX_SIZE}')
+    return receipt_ids
+
+
+def _batch_get_response(receipt_ids, found, response):
+    """
+    response with the notFound ids (those not in found), in request order. With asynchronous
+    ingestion the ids still queued are listed in pending rather than notFound.
+    """
+    missing = [receipt_id for receipt_id in dict.fromkeys(receipt_ids) if receipt_id not in found]
+    if ingest is not None:
+        response['pending'] = [receipt_id for receipt_id in missing if receipt_id in ingest.pending]
+        missing = [receipt_id for receipt_id in missing if receipt_id not in ingest.pending]
+    response['notFound'] = missing
+    return jsonify(response), STATUS_CODE.SUCCESS
+
+
+@app.route('/receipts/points:batchGet', methods=['POST'])
+def batch_get_points():
+    """
+    Points of up to Config.BATCH_GET_MAX_SIZE ids, in request order:
+    {"points": [{"id": id, "points": n}, ...], "notFound": [...]}. A list rather than an id to
+    points object, which the JSON codec writes with sorted keys.
+    """
+    receipt_ids = _read_batch_ids()
+    try:
+        points = receipt_storage.get_many_points(receipt_ids)
+    except Exception as e:  # pylint: disable=broad-except
+        logger.error('An unexpected error occurred while retrieving points of %d receipts - %s',
+                     len(receipt_ids), e)
+        return jsonify({'message': 'An unexpected error occurred.'}), STATUS_CODE.UNKNOWN_ERROR
+    return _batch_get_response(receipt_ids, points, {
+        'points': [{'id': receipt_id, 'points': receipt_points}
+                   for receipt_id, receipt_points in points.items()]})
+
+
+@app.route('/receipts:batchGet', methods=['POST'])
+def batch_get_receipts():
+    """Receipts of up to Config.BATCH_GET_MAX_SIZE ids: {"receipts": [...], "notFound": [...]}."""
+    receipt_ids = _read_batch_ids()
+    try:
+        records = receipt_storage.get_many(receipt_ids)
+    except Exception as e:  # pylint: disable=broad-except
+        logger.error('An unexpected error occurred while retrieving %d receipts - %s',
+                     len(receipt_ids), e)
+        return jsonify({'message': 'An unexpected error occurred.'}), STATUS_CODE.UNKNOWN_ERROR
+    return _batch_get_response(receipt_ids, records, {
+        'receipts': [Receipt.record_response(record) for record in records.values()]})
+
+
+def cached_json_response(cached):
+    """200 with the cached body, or 304 when the client's If-None-Match has its ETag."""
+    if etag_matches(request.headers.get('If-None-Match'), cached.etag):
+        response = Response(status=STATUS_CODE.NOT_MODIFIED)
+    else:
+        response = Response(cached.body, content_type=app.json.mimetype)
+    response.headers['ETag'] = cached.etag
+    return response
+
+
 @app.route('/receipts/<receipt_id>/points', methods=['GET'])
 def get_points(receipt_id):
+    key = ('points', receipt_id)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached_json_response(cached)
+    queued = queued_receipt_response(receipt_id)
+    if queued is not None:
+        return queued
     try:
         receipt_points = receipt_storage.get_receipt_points(receipt_id)
-        return jsonify({'points': receipt_points}), STATUS_CODE.SUCCESS
+        return cached_json_response(response_cache.put(key, {'points': receipt_points}))
     except ReceiptNotFound as e:
         logger.error(e.message)
         return jsonify({'message': e.message}), STATUS_CODE.NO_RECORD_FOUND
     except Exception as e:  # pylint: disable=broad-except
-        message = (
-            f'An unexpected error occurred while retrieving points'
-            f' for receipt ID={receipt_id} - {str(e)}'
-        )
-        logger.error(message)
+        logger.error('An unexpected error occurred while retrieving points'
+                     ' for receipt ID=%s - %s', receipt_id, e)
         return jsonify({'message': 'An unexpected error occurred.'}), STATUS_CODE.UNKNOWN_ERROR
 
 
 @app.route('/receipts/<receipt_id>', methods=['GET'])
 def view_receipt(receipt_id):
+    key = ('receipt', receipt_id)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached_json_response(cached)
+    queued = queued_receipt_response(receipt_id)
+    if queued is not None:
+        return queued
     try:
         receipt = receipt_storage.get_receipt_dict(receipt_id)
-        return jsonify({'receipt': receipt}), STATUS_CODE.SUCCESS
+        return cached_json_response(response_cache.put(key, {'receipt': receipt}))
     except ReceiptNotFound as e:
         logger.error(e.message)
         return jsonify({'message': e.message}), STATUS_CODE.NO_RECORD_FOUND
     except Exception as e:  # pylint: disable=broad-except
-        message = (
-            f'An unexpected error occurred while retrieving receipt ID={receipt_id} - {str(e)}'
-        )
-
-        logger.error(message)
+        logger.error('An unexpected error occurred while retrieving receipt ID=%s - %s',
+                     receipt_id, e)
         return jsonify({'message': 'An unexpected error occurred.'}), STATUS_CODE.UNKNOWN_ERROR
 
 
@@ -0,0 +1,243 @@
+"""
+ASGI version of the receipt service, served by any ASGI server, e.g.
+    uvicorn src.receipt_asgi:app --host 0.0.0.0 --port 5000
+It exposes the core routes of src/receipt_app.py (POST /receipts/process, the receipt and
+points reads and /metrics) with the same request/response contracts and status codes, without
+a web framework dependency. Batch ingestion, search, stats, export and batchGet are served by
+the Flask app only.
+Storage calls go through AsyncReceiptStorage, so disk-backed engines don't block the event loop.
+"""
+import logging
+import re
+
+from src import json_codec, metrics
+from src.config import STATUS_CODE
+from src.async_receipt_storage import AsyncReceiptStorage
+from src.storage_factory import create_receipt_storage
+from src.logging_config import configure_logging
+from src.response_cache import ResponseCache, etag_matches, serialize
+from src.idempotency_cache import IdempotencyCache, IDEMPOTENCY_KEY_HEADER, request_key
+from src.exceptions import ReceiptNotFound, ReceiptIsDuplicate, ReceiptValidationError
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+BAD_REQUEST = '400 Bad Request: '
+INVALID_JSON_MESSAGE = ('The browser (or proxy) sent a request that this server '
+                        'could not understand.')
+JSON_MIMETYPE = 'application/json'
+UNSUPPORTED_MEDIA_TYPE = 415
+METHOD_NOT_ALLOWED = 405
+
+POINTS_PATH = re.compile(r'^/receipts/([^/]+)/points$')
+RECEIPT_PATH = re.compile(r'^/receipts/([^/]+)$')
+PROCESS_ROUTE = '/receipts/process'
+POINTS_ROUTE = '/receipts/<receipt_id>/points'
+RECEIPT_ROUTE = '/receipts/<receipt_id>'
+METRICS_ROUTE = '/metrics'
+
+
+class Response:  # pylint: disable=too-few-public-methods
+    def __init__(self, body, status_code=STATUS_CODE.SUCCESS, content_type=JSON_MIMETYPE,
+                 headers=()):
+        self.body = body
+        self.status_code = status_code
+        self.content_type = content_type
+        self.headers = headers
+
+    async def send(self, send, head=False):
+        """Sends the response, headers only (with the body's content-length) for a HEAD request."""
+        headers = [(b'content-length', str(len(self.body)).encode())]
+        if self.content_type is not None:
+            headers.append((b'content-type', self.content_type.encode()))
+        headers.extend(self.headers)
+        await send({'type': 'http.response.start', 'status': self.status_code,
+                    'headers': headers})
+        await send({'type': 'http.response.body', 'body': b'' if head else self.body})
+
+
+class JSONResponse(Response):  # pylint: disable=too-few-public-methods
+    def __init__(self, content, status_code=STATUS_CODE.SUCCESS):
+        super().__init__(serialize(content), status_code)
+
+
+def cached_json_response(cached, if_none_match):
+    """200 with the cached body, or 304 when if_none_match has its ETag."""
+    headers = [(b'etag', cached.etag.encode())]
+    if etag_matches(if_none_match, cached.etag):
+        return Response(b'', STATUS_CODE.NOT_MODIFIED, content_type=None, headers=headers)
+    return Response(cached.body, headers=headers)
+
+
+def input_error(description):
+    return JSONResponse({'message': f'Input Error {BAD_REQUEST}{description}'},
+                        STATUS_CODE.INPUT_ERROR)
+
+
+class ReceiptASGIApp:
+    """
+    Routes:
+        POST /receipts/process
+        GET  /receipts/<receipt_id>/points
+        GET  /receipts/<receipt_id>
+        GET  /metrics
+    """
+    def __init__(self, storage=None):
+        self.storage = AsyncReceiptStorage(storage if storage is not None
+                                           else create_receipt_storage())
+        metrics.register_storage(self.storage.storage)
+        self.response_cache = ResponseCache()
+        self.storage.storage.add_clear_listener(self.response_cache.clear)
+        self.idempotency_cache = IdempotencyCache()
+        self.storage.storage.add_clear_listener(self.idempotency_cache.clear)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        started = metrics.clock()
+        route, response = await self._dispatch(scope, receive)
+        await response.send(send, head=scope['method'] == 'HEAD')
+        metrics.observe_request(route, response.status_code, started)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.storage.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _dispatch(self, scope, receive):
+        """Returns (route, response), route named as in the Flask app for the metrics labels."""
+        method, path = scope['method'], scope['path']
+        if path == PROCESS_ROUTE and method == 'POST':
+            return PROCESS_ROUTE, await self.process_receipt(scope, receive)
+        if path == METRICS_ROUTE and method in ('GET', 'HEAD'):
+            return METRICS_ROUTE, self.get_metrics()
+
+        for pattern, route, handler in ((POINTS_PATH, POINTS_ROUTE, self.get_points),
+                                        (RECEIPT_PATH, RECEIPT_ROUTE, self.view_receipt)):
+            match = pattern.match(path)
+            if match:
+                if method not in ('GET', 'HEAD'):
+                    return route, JSONResponse({'message': 'Method Not Allowed'},
+                                               METHOD_NOT_ALLOWED)
+                return route, await handler(match.group(1),
+                                            self._header(scope, b'if-none-match'))
+
+        if path in (PROCESS_ROUTE, METRICS_ROUTE):
+            return path, JSONResponse({'message': 'Method Not Allowed'}, METHOD_NOT_ALLOWED)
+        return 'unmatched', JSONResponse({'message': 'Not Found'}, STATUS_CODE.NO_RECORD_FOUND)
+
+    @staticmethod
+    def get_metrics():
+        if not metrics.enabled:
+            return JSONResponse({'message': 'Metrics are disabled'}, STATUS_CODE.NO_RECORD_FOUND)
+        return Response(metrics.REGISTRY.render().encode(),
+                        content_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+    @staticmethod
+    async def _read_body(receive):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    @staticmethod
+    def _header(scope, header_name):
+        for name, value in scope['headers']:
+            if name == header_name:
+                return value.decode('latin-1')
+        return ''
+
+    def _mimetype(self, scope):
+        return self._header(scope, b'content-type').split(';')[0].strip().lower()
+
+    async def process_receipt(self, scope, receive):
+        # a retry is answered before its body is parsed
+        body = key = None
+        if self.idempotency_cache.enabled:
+            idempotency_key = self._header(scope, IDEMPOTENCY_KEY_HEADER.lower().encode())
+            if not idempotency_key:
+                body = await self._read_body(receive)
+            key = request_key(body, idempotency_key)
+            replay = self.idempotency_cache.get(key)
+            if replay is not None:
+                metrics.REPLAYS.inc()
+                receipt_id, status_code = replay
+                return JSONResponse({'id': receipt_id}, status_code)
+
+        mimetype = self._mimetype(scope)
+        if mimetype != JSON_MIMETYPE and not mimetype.endswith('+json'):
+            return JSONResponse({'message': 'Did not attempt to load JSON data because the request'
+                                            ' Content-Type was not \'application/json\'.'},
+                                UNSUPPORTED_MEDIA_TYPE)
+        try:
+            data = json_codec.loads(body if body is not None else await self._read_body(receive))
+        except ValueError:
+            return input_error(INVALID_JSON_MESSAGE)
+        if data is None:
+            return input_error('Failed to decode JSON object')
+
+        try:
+            receipt_id, _ = await self.storage.process_receipt(data)
+            logger.info('Processed receipt id=%s', receipt_id)
+            if key is not None:
+                self.idempotency_cache.put(key, receipt_id, STATUS_CODE.SUCCESS)
+            return JSONResponse({'id': receipt_id})
+        except ReceiptValidationError as e:
+            return input_error(str(e))
+        except ReceiptIsDuplicate as e:
+            logger.error('%s', e)
+            return JSONResponse({'message': str(e)}, STATUS_CODE.INPUT_ERROR)
+        except Exception as e:  # pylint: disable=broad-except
+            message = f'An error occurred during receipt processing - {str(e)}'
+            logger.error(message)
+            return JSONResponse({'message': message}, STATUS_CODE.UNKNOWN_ERROR)
+
+    async def get_points(self, receipt_id, if_none_match=''):
+        key = ('points', receipt_id)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            return cached_json_response(cached, if_none_match)
+        try:
+            receipt_points = await self.storage.get_receipt_points(receipt_id)
+            return cached_json_response(self.response_cache.put(key, {'points': receipt_points}),
+                                        if_none_match)
+        except ReceiptNotFound as e:
+            logger.error(e.message)
+            return JSONResponse({'message': e.message}, STATUS_CODE.NO_RECORD_FOUND)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error('An unexpected error occurred while retrieving points'
+                         ' for receipt ID=%s - %s', receipt_id, e)
+            return JSONResponse({'message': 'An unexpected error occurred.'},
+                                STATUS_CODE.UNKNOWN_ERROR)
+
+    async def view_receipt(self, receipt_id, if_none_match=''):
+        key = ('receipt', receipt_id)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            return cached_json_response(cached, if_none_match)
+        try:
+            receipt = await self.storage.get_receipt_dict(receipt_id)
+            return cached_json_response(self.response_cache.put(key, {'receipt': receipt}),
+                                        if_none_match)
+        except ReceiptNotFound as e:
+            logger.error(e.message)
+            return JSONResponse({'message': e.message}, STATUS_CODE.NO_RECORD_FOUND)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error('An unexpected error occurred while retrieving receipt ID=%s - %s',
+                         receipt_id, e)
+            return JSONResponse({'message': 'An unexpected error occurred.'},
+                                STATUS_CODE.UNKNOWN_ERROR)
+
+
+app = ReceiptASGIApp()
@@ -0,0 +1,64 @@
+"""
+GET /receipts/export: stored receipts streamed as NDJSON or CSV, Config.EXPORT_CHUNK receipts
+per response chunk. Receipts come from a walk of the storage (BaseReceiptStorage.export_records)
+that holds no lock between receipts, so ingestion goes on during an export and memory stays flat
+however many receipts are exported. Every row carries the cursor that resumes the export after it.
+"""
+import csv
+import io
+import itertools
+
+from src import json_codec
+from src.config import Config
+from src.model.receipt import Receipt, RECEIPT_ID_NAME
+
+CSV_COLUMNS = ('cursor', RECEIPT_ID_NAME, 'retailer', 'purchaseDateTime', 'total', 'points',
+               'items')
+
+
+def ndjson_chunk(rows):
+    """One JSON object per (position, record) row: the receipt as GET /receipts/<id> has it."""
+    lines = []
+    for position, record in rows:
+        response = Receipt.record_response(record)
+        response['cursor'] = position
+        lines.append(json_codec.dumps(response))
+    lines.append(b'')
+    return b'\n'.join(lines)
+
+
+def csv_chunk(rows):
+    """One CSV line per (position, record) row, items as a JSON array."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    for position, record in rows:
+        response = Receipt.record_response(record)
+        writer.writerow((position, response[RECEIPT_ID_NAME], response['retailer'],
+                         Receipt.format_receipt_date(response['purchaseDateTime']),
+                         response['total'], response['points'],
+                         json_codec.dumps(response['items']).decode()))
+    return buffer.getvalue().encode()
+
+
+# format: (mimetype, first chunk, chunk encoder)
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', b'', ndjson_chunk),
+    'csv': ('text/csv', ','.join(CSV_COLUMNS).encode() + b'\n', csv_chunk),
+}
+
+
+def export_chunks(rows, export_format, limit=None, chunk_size=None):
+    """
+    Encoded chunks of export_format of the (position, record) rows, the first limit of them
+    if given; only one chunk of rows is held at a time.
+    """
+    _, header, encode_chunk = EXPORT_FORMATS[export_format]
+    chunk_size = chunk_size or Config.EXPORT_CHUNK
+    if header:
+        yield header
+    rows = iter(rows) if limit is None else itertools.islice(rows, limit)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield encode_chunk(chunk)
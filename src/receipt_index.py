@@ -0,0 +1,217 @@
+"""
+Secondary indexes of stored receipts: by retailer and by purchase date-time, with running
+aggregates (receipt count, total cents, points) per day, per retailer and per retailer and day.
+
+Receipts are posted as (purchase minutes, receipt id) entries to day buckets, one set of
+buckets for all receipts and one per retailer. A bucket is sorted when it is first read after
+an out of order insert, so a query only touches the days of its range and the entries it returns.
+The scan_* functions answer the same queries with a full scan of stored records.
+"""
+import bisect
+import datetime
+import heapq
+import threading
+
+from src.model.receipt import MINUTES_PER_DAY, RECEIPT_ID_NAME, datetime_to_minutes
+
+# upper bound of an unbounded range, of purchase minutes or of day ordinals
+UNBOUNDED = 1 << 62
+
+
+def minutes_range(start, end):
+    """[start, end) datetimes as purchase minutes, None being unbounded."""
+    return (0 if start is None else datetime_to_minutes(start),
+            UNBOUNDED if end is None else datetime_to_minutes(end))
+
+
+def day_range(start, end):
+    """[start, end) as day ordinals (the days of datetimes or dates), None being unbounded."""
+    return (0 if start is None else start.toordinal(),
+            UNBOUNDED if end is None else end.toordinal())
+
+
+class TimeIndex:
+    """Day buckets of (minutes, receipt id) entries with per-day and overall aggregates."""
+    def __init__(self):
+        self.buckets = {}
+        # days whose bucket got an entry out of order since it was last sorted
+        self.unsorted = set()
+        self.days = []
+        # day ordinal -> [count, total cents, points]
+        self.day_totals = {}
+        self.totals = [0, 0, 0]
+
+    def add(self, entry, total, points):
+        day = entry[0] // MINUTES_PER_DAY
+        bucket = self.buckets.get(day)
+        if bucket is None:
+            bucket = self.buckets[day] = []
+            self.day_totals[day] = [0, 0, 0]
+            bisect.insort(self.days, day)
+        elif entry < bucket[-1]:
+            self.unsorted.add(day)
+        bucket.append(entry)
+        day_totals, totals = self.day_totals[day], self.totals
+        day_totals[0] += 1
+        day_totals[1] += total
+        day_totals[2] += points
+        totals[0] += 1
+        totals[1] += total
+        totals[2] += points
+
+    def _bucket(self, day):
+        bucket = self.buckets[day]
+        if day in self.unsorted:
+            bucket.sort()
+            self.unsorted.discard(day)
+        return bucket
+
+    def entries(self, start, end, after, limit):
+        """Up to limit entries with start <= minutes < end and past the after entry, in order."""
+        if after is not None:
+            start = max(start, after[0])
+        result = []
+        position = bisect.bisect_left(self.days, start // MINUTES_PER_DAY)
+        while position < len(self.days) and len(result) < limit:
+            day = self.days[position]
+            if day * MINUTES_PER_DAY >= end:
+                break
+            bucket = self._bucket(day)
+            low = bisect.bisect_left(bucket, (start,))
+            if after is not None:
+                low = max(low, bisect.bisect_right(bucket, after))
+            high = min(bisect.bisect_left(bucket, (end,)), low + limit - len(result))
+            result.extend(bucket[low:high])
+            position += 1
+        return result
+
+    def range_totals(self, first_day, end_day):
+        """[count, total, points] summed over the days in [first_day, end_day)."""
+        if first_day <= 0 and end_day >= UNBOUNDED:
+            return list(self.totals)
+        totals = [0, 0, 0]
+        for day in self.days[bisect.bisect_left(self.days, first_day):
+                             bisect.bisect_left(self.days, end_day)]:
+            day_totals = self.day_totals[day]
+            totals[0] += day_totals[0]
+            totals[1] += day_totals[1]
+            totals[2] += day_totals[2]
+        return totals
+
+    def daily_totals(self, first_day, end_day):
+        return [(datetime.date.fromordinal(day), *self.day_totals[day])
+                for day in self.days[bisect.bisect_left(self.days, first_day):
+                                     bisect.bisect_left(self.days, end_day)]]
+
+
+class ReceiptIndex:
+    """
+    Secondary indexes of a storage, updated by BaseReceiptStorage as receipts are stored.
+    Queries return receipt ids ordered by purchase date-time, then id; totals are
+    (count, total cents, points) tuples.
+    """
+    def __init__(self):
+        self.all = TimeIndex()
+        self.retailers = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_records(cls, records):
+        index = cls()
+        for record in records:
+            index.add_record(record)
+        return index
+
+    def add(self, receipt_id, retailer, purchase_date_time, total, points):
+        entry = (datetime_to_minutes(purchase_date_time), receipt_id)
+        with self._lock:
+            self.all.add(entry, total, points)
+            by_retailer = self.retailers.get(retailer)
+            if by_retailer is None:
+                by_retailer = self.retailers[retailer] = TimeIndex()
+            by_retailer.add(entry, total, points)
+
+    def add_receipt(self, receipt):
+        self.add(receipt.receipt_id, receipt.retailer, receipt.purchase_date_time,
+                 receipt.total, receipt.points)
+
+    def add_record(self, record):
+        self.add(record[RECEIPT_ID_NAME], record["retailer"], record["purchaseDateTime"],
+                 record["total"], record["points"])
+
+    def receipt_ids(self, retailer=None, start=None, end=None, after=None, limit=100):
+        """
+        Ids of receipts purchased in [start, end) (of retailer if given), after is the
+        (purchase date-time, receipt id) of the last receipt of the previous page.
+        """
+        start, end = minutes_range(start, end)
+        after = None if after is None else (datetime_to_minutes(after[0]), after[1])
+        with self._lock:
+            index = self.all if retailer is None else self.retailers.get(retailer)
+            if index is None:
+                return []
+            return [receipt_id for _, receipt_id in index.entries(start, end, after, limit)]
+
+    def retailer_totals(self, start=None, end=None):
+        """{retailer: totals} of the receipts purchased on the days of [start, end)."""
+        first_day, end_day = day_range(start, end)
+        with self._lock:
+            totals = {retailer: tuple(index.range_totals(first_day, end_day))
+                      for retailer, index in self.retailers.items()}
+        return {retailer: value for retailer, value in totals.items() if value[0]}
+
+    def day_totals(self, retailer=None, start=None, end=None):
+        """[(date, count, total, points)] of the days in [start, end) with receipts."""
+        first_day, end_day = day_range(start, end)
+        with self._lock:
+            index = self.all if retailer is None else self.retailers.get(retailer)
+            return [] if index is None else index.daily_totals(first_day, end_day)
+
+    def clear(self):
+        with self._lock:
+            self.all = TimeIndex()
+            self.retailers = {}
+
+    def __len__(self):
+        return self.all.totals[0]
+
+
+def scan_receipt_ids(records, retailer=None, start=None, end=None, after=None, limit=100):
+    """ReceiptIndex.receipt_ids answered by a full scan of records."""
+    start, end = minutes_range(start, end)
+    after = (-1, '') if after is None else (datetime_to_minutes(after[0]), after[1])
+    entries = []
+    for record in records:
+        if retailer is not None and record["retailer"] != retailer:
+            continue
+        entry = (datetime_to_minutes(record["purchaseDateTime"]), record[RECEIPT_ID_NAME])
+        if start <= entry[0] < end and entry > after:
+            entries.append(entry)
+    return [receipt_id for _, receipt_id in heapq.nsmallest(limit, entries)]
+
+
+def _scan_totals(records, key, retailer, start, end):
+    first_day, end_day = day_range(start, end)
+    totals = {}
+    for record in records:
+        day = record["purchaseDateTime"].toordinal()
+        if not first_day <= day < end_day or (retailer is not None
+                                              and record["retailer"] != retailer):
+            continue
+        group = totals.setdefault(key(record, day), [0, 0, 0])
+        group[0] += 1
+        group[1] += record["total"]
+        group[2] += record["points"]
+    return totals
+
+
+def scan_retailer_totals(records, start=None, end=None):
+    """ReceiptIndex.retailer_totals answered by a full scan of records."""
+    totals = _scan_totals(records, lambda record, day: record["retailer"], None, start, end)
+    return {retailer: tuple(value) for retailer, value in totals.items()}
+
+
+def scan_day_totals(records, retailer=None, start=None, end=None):
+    """ReceiptIndex.day_totals answered by a full scan of records."""
+    totals = _scan_totals(records, lambda record, day: day, retailer, start, end)
+    return [(datetime.date.fromordinal(day), *totals[day]) for day in sorted(totals)]
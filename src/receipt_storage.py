@@ -1,30 +1,355 @@
-from src.model.receipt import Receipt
+import itertools
+import sys
+import threading
+from abc import ABC, abstractmethod
+
+from src import metrics
+from src.model.receipt import Receipt, RECEIPT_ID_NAME
+from src.model.receipt_ids import id_generator
+from src.persistence import SnapshotTable
+from src.receipt_index import ReceiptIndex, scan_receipt_ids, scan_retailer_totals, scan_day_totals
+from src.duplicate_index import DuplicateIndex
 from src.exceptions import ReceiptNotFound, ReceiptIsDuplicate
 
-class ReceiptStorage:
+
+# records approximate_bytes extrapolates from
+APPROXIMATE_BYTES_SAMPLE = 100
+
+
+class BaseReceiptStorage(ABC):
+    """
+    Storage interface: receipt processing, batching and persistence logic shared by
+    every storage engine. Engines implement the storage primitives
+    (_store, is_duplicate, get_receipt, ...).
+    """
+    # optional durable ReceiptLog (src/persistence.py), stored receipts are appended to it
+    log = None
+    clear_listeners = ()
+    # optional ReceiptIndex (src/receipt_index.py) kept up to date as receipts are stored,
+    # queries fall back to a full scan without it
+    index = None
+    # False for engines written by several processes (an in-process index would miss receipts),
+    # for memory-bounded ones (the index would keep growing past the budget) and for engines
+    # answering the queries themselves (sqlite)
+    indexable = True
+    # True for engines doing disk I/O, async callers run them in a thread pool
+    blocking = False
+    # False for engines whose receipts move between export positions (reads and evictions
+    # reorder them): an export cursor would skip or repeat receipts, so none is accepted
+    resumable_export = True
+
+    @abstractmethod
+    def is_duplicate(self, receipt):
+        pass
+
+    @abstractmethod
+    def _store(self, receipt):
+        """
+        Stores a processed Receipt. Storages shared between threads or processes re-check
+        duplicates atomically here and raise ReceiptIsDuplicate.
+        """
+
+    @abstractmethod
+    def _store_record(self, record):
+        """Stores an already processed to_dict() record as is (used by restore)."""
+
+    @abstractmethod
+    def get_receipt(self, receipt_id):
+        pass
+
+    @abstractmethod
+    def get_receipt_points(self, receipt_id):
+        pass
+
+    @abstractmethod
+    def is_in(self, receipt_id):
+        pass
+
+    @abstractmethod
+    def iter_receipts(self):
+        """Yields stored receipt records; receipts stored meanwhile may or may not be included."""
+
+    @abstractmethod
+    def _clear(self):
+        pass
+
+    @abstractmethod
+    def __len__(self):
+        pass
+
+    @staticmethod
+    def duplicate_error(identifier):
+        return ReceiptIsDuplicate(f'Provided receipt is duplicate: {str(identifier)}')
+
+    def _store_many(self, receipts):
+        """
+        Stores receipts, returns a list aligned with receipts holding None for stored ones
+        and the ReceiptIsDuplicate raised by _store for the ones that lost a race.
+        """
+        outcomes = []
+        for receipt in receipts:
+            try:
+                self._store(receipt)
+                outcomes.append(None)
+            except ReceiptIsDuplicate as e:
+                outcomes.append(e)
+        return outcomes
+
+    def process_receipt(self, input_data):
+        receipt = Receipt.from_input(input_data)
+        started = metrics.clock()
+        is_duplicate = self.is_duplicate(receipt)
+        metrics.observe_stage(metrics.STAGE_DUPLICATE_CHECK, started)
+        if is_duplicate:
+            metrics.DUPLICATES.inc()
+            raise self.duplicate_error(receipt.identifier_tuple())
+
+        started = metrics.clock()
+        self._store(receipt)
+        if self.index is not None:
+            self.index.add_receipt(receipt)
+        record = self.get_receipt(receipt.receipt_id)
+        if self.log is not None:
+            # logged once stored (so only the winner of a duplicate race is logged),
+            # but before the id is handed back to the client
+            self.log.append(record)
+            self._snapshot_if_due()
+        metrics.observe_stage(metrics.STAGE_STORE, started)
+        metrics.PROCESSED.inc()
+        return receipt.receipt_id, record
+
+    def process_receipts(self, input_items):
+        """
+        Batch version of process_receipt: parses, scores and stores receipts in one pass.
+        Returns a list aligned with input_items holding either the new receipt_id
+        or the exception raised for that item (duplicates inside the batch included).
+        """
+        results = []
+        receipts = []
+        positions = []
+        # one run of ids for the batch
+        id_ints = id_generator.new_ids(len(input_items))
+        for input_data, id_int in zip(input_items, id_ints):
+            try:
+                receipts.append(Receipt.from_input(input_data, id_int))
+            except Exception as e:  # pylint: disable=broad-except
+                results.append(e)
+                continue
+            positions.append(len(results))
+            results.append(None)
+
+        for position, outcome in zip(positions, self.store_receipts(receipts)):
+            results[position] = outcome
+        return results
+
+    def store_receipts(self, receipts):
+        """
+        Stores already parsed and scored receipts, logging the stored ones in one append.
+        Returns a list aligned with receipts holding either the receipt_id
+        or the ReceiptIsDuplicate of that receipt (duplicates inside the batch included).
+        """
+        results = []
+        new_receipts = []
+        new_positions = []
+        batch_identifiers = set()
+        for receipt in receipts:
+            # minute precision datetimes identify receipts like their formatted form
+            identifier = (receipt.retailer, receipt.purchase_date_time)
+            if identifier in batch_identifiers or self.is_duplicate(receipt):
+                results.append(self.duplicate_error(receipt.identifier_tuple()))
+                continue
+
+            batch_identifiers.add(identifier)
+            new_receipts.append(receipt)
+            new_positions.append(len(results))
+            results.append(receipt.receipt_id)
+
+        stored_ids = []
+        for position, receipt, error in zip(new_positions, new_receipts,
+                                            self._store_many(new_receipts)):
+            if error is not None:
+                results[position] = error
+            else:
+                stored_ids.append(results[position])
+                if self.index is not None:
+                    self.index.add_receipt(receipt)
+
+        if self.log is not None and stored_ids:
+            self.log.append_many([self.get_receipt(receipt_id) for receipt_id in stored_ids])
+            self._snapshot_if_due()
+        metrics.PROCESSED.inc(amount=len(stored_ids))
+        metrics.DUPLICATES.inc(amount=len(receipts) - len(stored_ids))
+        return results
+
+    def get_receipt_dict(self, receipt_id):
+        # a new dictionary, the stored record is not modified
+        return Receipt.record_response(self.get_receipt(receipt_id))
+
+    def get_many(self, receipt_ids):
+        """{receipt id: record} of the stored receipts among receipt_ids, in receipt_ids order."""
+        records = {}
+        for receipt_id in receipt_ids:
+            if receipt_id not in records:
+                try:
+                    records[receipt_id] = self.get_receipt(receipt_id)
+                except ReceiptNotFound:
+                    pass
+        return records
+
+    def get_many_points(self, receipt_ids):
+        """{receipt id: points} of the stored receipts among receipt_ids, in receipt_ids order."""
+        points = {}
+        for receipt_id in receipt_ids:
+            if receipt_id not in points:
+                try:
+                    points[receipt_id] = self.get_receipt_points(receipt_id)
+                except ReceiptNotFound:
+                    pass
+        return points
+
+    def approximate_bytes(self):
+        """Memory taken by the stored receipts, extrapolated from a sample of records."""
+        count = len(self)
+        sample = list(itertools.islice(self.iter_receipts(), APPROXIMATE_BYTES_SAMPLE))
+        if not sample:
+            return 0
+        return count * sum(metrics.deep_sizeof(record) for record in sample) // len(sample)
+
+    def restore(self, records):
+        """Loads records (e.g. replayed from the log) without re-scoring, skipping known ids."""
+        for record in records:
+            if not self.is_in(record[RECEIPT_ID_NAME]):
+                self._store_record(record)
+                if self.index is not None:
+                    self.index.add_record(record)
+
+    def restore_table(self, table):
+        """Loads a SnapshotTable, see restore."""
+        self.restore(table.records())
+
+    def snapshot_table(self):
+        return SnapshotTable.from_records(self.iter_receipts())
+
+    def recover(self, log):
+        """
+        Rebuilds the storage from log (snapshot + log tail), then logs every new receipt to it.
+        """
+        table, tail = log.recover()
+        if table is not None:
+            self.restore_table(table)
+        self.restore(tail)
+        self.log = log
+
+    def snapshot(self):
+        """
+        Writes a snapshot of the whole storage to the log and drops the log segments it covers.
+        """
+        return self.log.snapshot(self.snapshot_table)
+
+    def _snapshot_if_due(self):
+        if self.log.claim_snapshot():
+            threading.Thread(target=self._run_snapshot, name='receipt-snapshot',
+                             daemon=True).start()
+
+    def _run_snapshot(self):
+        try:
+            self.snapshot()
+        finally:
+            self.log.release_snapshot()
+
+    def enable_index(self):
+        """Indexes the stored receipts in a ReceiptIndex, kept up to date from then on."""
+        self.index = ReceiptIndex.from_records(self.iter_receipts())
+
+    def query_receipt_ids(self, retailer=None, start=None, end=None, after=None, limit=100):
+        """
+        Ids of receipts purchased in [start, end) (datetimes, None = unbounded), of retailer if
+        given, ordered by purchase date-time then id. after is the id of the last receipt of
+        the previous page (ReceiptNotFound if unknown).
+        """
+        if after is not None:
+            record = self.get_receipt(after)
+            after = (record["purchaseDateTime"], record[RECEIPT_ID_NAME])
+        if self.index is not None:
+            return self.index.receipt_ids(retailer, start, end, after, limit)
+        return scan_receipt_ids(self.iter_receipts(), retailer, start, end, after, limit)
+
+    def iter_positions(self, cursor=0):
+        """
+        (position, record) of the stored records past position cursor, in storage order; the
+        position of a record resumes the walk after it. Receipts stored meanwhile may or may
+        not be included. Engines override it to seek to cursor instead of walking up to it.
+        """
+        return zip(itertools.count(cursor + 1),
+                   itertools.islice(self.iter_receipts(), cursor, None))
+
+    def export_records(self, cursor=0, retailer=None, start=None, end=None):
+        """
+        (position, record) of the receipts past position cursor purchased in [start, end)
+        (datetimes, None = unbounded), of retailer if given, in storage order (see iter_positions).
+        """
+        for position, record in self.iter_positions(cursor):
+            if retailer is not None and record["retailer"] != retailer:
+                continue
+            purchase_date_time = record["purchaseDateTime"]
+            if (start is not None and purchase_date_time < start) \
+                    or (end is not None and purchase_date_time >= end):
+                continue
+            yield position, record
+
+    def retailer_totals(self, start=None, end=None):
+        """
+        {retailer: (count, total cents, points)} of receipts purchased on days in [start, end).
+        """
+        if self.index is not None:
+            return self.index.retailer_totals(start, end)
+        return scan_retailer_totals(self.iter_receipts(), start, end)
+
+    def day_totals(self, retailer=None, start=None, end=None):
+        """
+        [(date, count, total cents, points)] of the days in [start, end), of retailer if given.
+        """
+        if self.index is not None:
+            return self.index.day_totals(retailer, start, end)
+        return scan_day_totals(self.iter_receipts(), retailer, start, end)
+
+    def add_clear_listener(self, listener):
+        """listener() is called after every clear(), e.g. to drop what was cached about receipts."""
+        self.clear_listeners = (*self.clear_listeners, listener)
+
+    def clear(self):
+        self._clear()
+        if self.index is not None:
+            self.index.clear()
+        if self.log is not None:
+            self.log.reset()
+        for listener in self.clear_listeners:
+            listener()
+
+
+class ReceiptStorage(BaseReceiptStorage):
     """
      manages in-memory storage of receipts. It includes logic to prevent duplicate entries.
     """
     def __init__(self):
         self.receipt_storage = {}
+        # the stored records in insertion order, so walks can seek to a position and
+        # do not copy the dict
+        self.records = []
         # to check for duplication on retailer+purchase_date_time
         # simulates another unique index on the table
-        self.receipt_identifier = {}
+        self.receipt_identifier = DuplicateIndex()
 
     def is_duplicate(self, receipt):
-        return receipt.identifier_tuple() in self.receipt_identifier
+        return self.receipt_identifier.contains(receipt.retailer, receipt.purchase_date_time)
 
-    def process_receipt(self, input_data):
-        receipt = Receipt(**input_data)
-        if self.is_duplicate(receipt):
-            raise ReceiptIsDuplicate(
-                f'Provided receipt is duplicate: {str(receipt.identifier_tuple())}'
-                )
+    def _store(self, receipt):
+        self._store_record(receipt.to_dict())
 
-        receipt_id = receipt.receipt_id
-        self.receipt_storage[receipt_id] = receipt.to_dict()
-        self.receipt_identifier[receipt.identifier_tuple()] = receipt_id
-        return receipt_id, self.get_receipt(receipt_id)
+    def _store_record(self, record):
+        self.receipt_storage[record[RECEIPT_ID_NAME]] = record
+        self.records.append(record)
+        self.receipt_identifier.add(record["retailer"], record["purchaseDateTime"])
 
     def get_receipt(self, receipt_id):
         if receipt_id in self.receipt_storage:
@@ -32,24 +357,51 @@ class ReceiptStorage:
 
         raise ReceiptNotFound(receipt_id)
 
-    def get_receipt_dict(self, receipt_id):
-        receipt = self.get_receipt(receipt_id)
-        # Create a new dictionary to avoid modifying the original
-        receipt_copy = receipt.copy()
-        receipt_copy['purchaseDateTime'] = Receipt.format_receipt_date(receipt['purchaseDateTime'])
-        return receipt_copy
-
     def get_receipt_points(self, receipt_id):
         if receipt_id in self.receipt_storage:
             return self.receipt_storage[receipt_id]["points"]
 
         raise ReceiptNotFound(receipt_id)
 
+    def get_many(self, receipt_ids):
+        stored = self.receipt_storage
+        return {receipt_id: stored[receipt_id] for receipt_id in receipt_ids
+                if receipt_id in stored}
+
+    def get_many_points(self, receipt_ids):
+        stored = self.receipt_storage
+        return {receipt_id: stored[receipt_id]["points"] for receipt_id in receipt_ids
+                if receipt_id in stored}
+
+    def iter_receipts(self):
+        for _, record in self.iter_positions():
+            yield record
+
+    def iter_positions(self, cursor=0):
+        # records is append-only: stop at the receipts stored when the walk started
+        records, end = self.records, len(self.records)
+        for position in range(cursor, end):
+            try:
+                record = records[position]
+            except IndexError:  # cleared meanwhile
+                return
+            yield position + 1, record
+
+    def approximate_bytes(self):
+        sample = list(itertools.islice(self.receipt_storage.values(), APPROXIMATE_BYTES_SAMPLE))
+        if not sample:
+            return 0
+        records = len(self.receipt_storage) * sum(
+            metrics.deep_sizeof(record) for record in sample) // len(sample)
+        return (records + sys.getsizeof(self.receipt_storage) + sys.getsizeof(self.records)
+                + self.receipt_identifier.approximate_bytes())
+
     def is_in(self, receipt_id):
         return receipt_id in self.receipt_storage
 
-    def clear(self):
+    def _clear(self):
         self.receipt_storage.clear()
+        self.records.clear()
         self.receipt_identifier.clear()
 
     def __len__(self):
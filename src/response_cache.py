@@ -0,0 +1,101 @@
+"""
+Cache of serialized GET responses for stored receipts.
+Stored receipts never change, so a response body is produced once (same bytes as jsonify),
+kept in an LRU bounded by Config.RESPONSE_CACHE_MAX_BYTES and served with a strong ETag.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from src import json_codec
+from src.config import Config
+
+# per entry bookkeeping beyond the body: key tuple, receipt id, ETag string, LRU link
+ENTRY_OVERHEAD_BYTES = 256
+
+
+def serialize(content):
+    """JSON body laid out like Flask's jsonify: compact, sorted keys, trailing newline."""
+    return json_codec.dumps(content) + b'\n'
+
+
+def strong_etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """True when an If-None-Match header value lists etag (weak comparison, as RFC 9110 asks)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class CachedResponse:  # pylint: disable=too-few-public-methods
+    __slots__ = ('body', 'etag')
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = strong_etag(body)
+
+
+class ResponseCache:
+    """
+    LRU of CachedResponse keyed by (route, receipt_id), bounded by the bytes of the bodies.
+    max_bytes=0 disables it: every response is serialized, nothing is kept.
+    """
+    def __init__(self, max_bytes=None):
+        self.max_bytes = Config.RESPONSE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            response = self._entries.get(key)
+            if response is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return response
+
+    def put(self, key, content):
+        """Serializes content, caches it under key; returns the CachedResponse."""
+        response = CachedResponse(serialize(content))
+        size = len(response.body) + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return response
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous.body) + ENTRY_OVERHEAD_BYTES
+            self._entries[key] = response
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body) + ENTRY_OVERHEAD_BYTES
+                self.evictions += 1
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,302 @@
+"""
+Storage shared by pre-forked worker processes (e.g. gunicorn workers): fixed-layout open
+addressing hash tables and the encoded receipt records live in one memory-mapped file,
+on /dev/shm (shared memory) by default.
+
+File layout: HEADER, the id table (receipt id -> points, record offset), the identifier table
+(retailer + purchase minute -> record offset) and the record area of persistence.encode_record
+frames, appended in insert order.
+
+Cross-process insert atomicity: inserts hold an exclusive lockf on the file (plus a thread
+lock, as lockf locks belong to the whole process), under which the duplicate check is repeated,
+the record is appended and both table slots are written. A slot is published by writing its
+record offset last, after the fields it guards, and readers read the offset first, so lock-free
+readers see a receipt either completely or not at all (stores to the shared pages become
+visible in program order on x86-64; weaker memory models would need a fence there).
+Slots are never removed (only clear() zeroes the tables), so a probe stops at the first empty
+slot. A worker killed inside an insert leaves the lock released; at worst its receipt is
+readable by id (an id never returned to a client) without its identifier, the retried
+receipt is then stored again under a new id.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+from src.config import Config
+from src.model.receipt import Receipt, datetime_to_minutes
+from src.persistence import FRAME, RECORD, RecordDecoder, encode_record
+from src.receipt_storage import BaseReceiptStorage
+from src.exceptions import ReceiptNotFound, ReceiptStorageFull
+
+# magic, version, slot count (per table), record area bytes, receipt count, record area used
+HEADER = struct.Struct('<8sIIQQQ')
+HEADER_BYTES = 64
+SHARED_MAGIC = b'RCPTSHM1'
+SHARED_VERSION = 1
+# receipt id, points, record offset + 1 (0 = empty slot)
+ID_SLOT = struct.Struct('<16sqQ')
+# purchase minutes, crc32 of the retailer, record offset + 1 (0 = empty slot)
+IDENTIFIER_SLOT = struct.Struct('<qQQ')
+# offset of the record offset in both slot layouts
+ID_POSITION = 24
+IDENTIFIER_POSITION = 16
+POSITION = struct.Struct('<Q')
+# header fields rewritten by inserts: receipt count, record area used
+COUNTERS = struct.Struct('<QQ')
+COUNTERS_OFFSET = 24
+CLEAR_CHUNK = 1024 * 1024
+
+# one process-wide lock in front of the file lock, re-created in forked children
+# (a fork taken while another thread held it would leave it locked forever)
+_insert_lock = threading.Lock()
+
+
+def _reset_insert_lock():
+    global _insert_lock  # pylint: disable=global-statement
+    _insert_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_insert_lock)
+
+
+def slot_count_for(capacity):
+    """Power of two table size keeping the load factor at or under one half."""
+    return 1 << max(4, (2 * capacity - 1).bit_length())
+
+
+class SharedReceiptStorage(BaseReceiptStorage):
+    """
+    Receipts in a memory-mapped file every worker process maps, see the module docstring.
+    The first process creates the file (capacity receipts, record_bytes average encoded
+    bytes each), later ones attach to it with the layout it was created with.
+    Past its capacity or record area, inserts raise ReceiptStorageFull.
+    """
+    # other workers store receipts too, queries scan the shared records
+    indexable = False
+
+    def __init__(self, path=None, capacity=None, record_bytes=None):
+        self.path = path or Config.SHARED_STORE_PATH
+        capacity = capacity or Config.SHARED_STORE_CAPACITY
+        record_bytes = record_bytes or Config.SHARED_STORE_RECORD_BYTES
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self._fd, HEADER.size, 0)
+            if len(header) == HEADER.size and HEADER.unpack(header)[0] == SHARED_MAGIC:
+                _, version, slot_count, data_bytes, _, _ = HEADER.unpack(header)
+                if version != SHARED_VERSION:
+                    raise ValueError(f"Shared store {self.path} has version {version}, "
+                                     f"expected {SHARED_VERSION}")
+            else:
+                slot_count = slot_count_for(capacity)
+                data_bytes = capacity * record_bytes
+                self._create(slot_count, data_bytes)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+        self.slot_count = slot_count
+        self.capacity = slot_count // 2
+        self.data_bytes = data_bytes
+        self.ids_start = HEADER_BYTES
+        self.identifiers_start = self.ids_start + slot_count * ID_SLOT.size
+        self.data_start = self.identifiers_start + slot_count * IDENTIFIER_SLOT.size
+        self.buffer = mmap.mmap(self._fd, self.data_start + data_bytes)
+        self._mask = slot_count - 1
+        self._decoder = RecordDecoder()
+
+    def _create(self, slot_count, data_bytes):
+        size = (HEADER_BYTES + slot_count * (ID_SLOT.size + IDENTIFIER_SLOT.size) + data_bytes)
+        os.ftruncate(self._fd, 0)
+        os.ftruncate(self._fd, size)
+        # reserve the pages now: a full /dev/shm fails here instead of SIGBUS on a later write
+        os.posix_fallocate(self._fd, 0, size)
+        os.pwrite(self._fd, HEADER.pack(SHARED_MAGIC, SHARED_VERSION, slot_count,
+                                        data_bytes, 0, 0), 0)
+
+    # lookups (lock-free)
+
+    def _id_slot(self, id_bytes):
+        """(slot offset, record offset + 1) of id_bytes, or of the empty slot ending its probe."""
+        buffer, start, mask = self.buffer, self.ids_start, self._mask
+        # the last bytes of a UUID are random for both version 4 and version 7 ids
+        # (byte 8 holds the fixed variant bits, so it must not land in the low bits)
+        slot = int.from_bytes(id_bytes[8:], 'big') & mask
+        while True:
+            offset = start + slot * ID_SLOT.size
+            position, = POSITION.unpack_from(buffer, offset + ID_POSITION)
+            if not position or buffer[offset:offset + 16] == id_bytes:
+                return offset, position
+            slot = (slot + 1) & mask
+
+    def _identifier_slot(self, retailer, minutes):
+        """(slot offset, record offset + 1) like _id_slot, retailer is the encoded retailer."""
+        buffer, start, mask = self.buffer, self.identifiers_start, self._mask
+        crc = zlib.crc32(retailer)
+        slot = (crc * 0x9E3779B1 + minutes) & mask
+        while True:
+            offset = start + slot * IDENTIFIER_SLOT.size
+            # the record offset first: the fields it publishes are read after it
+            position, = POSITION.unpack_from(buffer, offset + IDENTIFIER_POSITION)
+            if not position:
+                return offset, 0
+            slot_minutes, slot_crc, _ = IDENTIFIER_SLOT.unpack_from(buffer, offset)
+            if slot_minutes == minutes and slot_crc == crc and \
+                    self._record_retailer(position) == retailer:
+                return offset, position
+            slot = (slot + 1) & mask
+
+    def _record_retailer(self, position):
+        payload = self.data_start + position - 1 + FRAME.size
+        retailer_length = RECORD.unpack_from(self.buffer, payload)[4]
+        return self.buffer[payload + RECORD.size:payload + RECORD.size + retailer_length]
+
+    @staticmethod
+    def _id_bytes(receipt_id):
+        try:
+            id_bytes = bytes.fromhex(receipt_id.replace('-', ''))
+        except (AttributeError, ValueError):
+            return None
+        return id_bytes if len(id_bytes) == 16 else None
+
+    def _find(self, receipt_id):
+        id_bytes = self._id_bytes(receipt_id)
+        if id_bytes is not None:
+            offset, position = self._id_slot(id_bytes)
+            if position:
+                return offset, position
+        raise ReceiptNotFound(receipt_id)
+
+    def is_duplicate(self, receipt):
+        return bool(self._identifier_slot(receipt.retailer.encode(),
+                                          datetime_to_minutes(receipt.purchase_date_time))[1])
+
+    def get_receipt(self, receipt_id):
+        _, position = self._find(receipt_id)
+        return self._decoder.decode(self.buffer, self.data_start + position - 1 + FRAME.size)
+
+    def get_receipt_points(self, receipt_id):
+        offset, _ = self._find(receipt_id)
+        return ID_SLOT.unpack_from(self.buffer, offset)[1]
+
+    def is_in(self, receipt_id):
+        id_bytes = self._id_bytes(receipt_id)
+        return id_bytes is not None and bool(self._id_slot(id_bytes)[1])
+
+    def iter_receipts(self):
+        for _, record in self.iter_positions():
+            yield record
+
+    def iter_positions(self, cursor=0):
+        # positions count records, the cursor is reached by hopping over frames without decoding
+        buffer, decode = self.buffer, self._decoder.decode
+        _, used = COUNTERS.unpack_from(buffer, COUNTERS_OFFSET)
+        offset, end = self.data_start, self.data_start + used
+        position = 0
+        while offset < end:
+            length, _ = FRAME.unpack_from(buffer, offset)
+            position += 1
+            if position > cursor:
+                yield position, decode(buffer, offset + FRAME.size)
+            offset += FRAME.size + length
+
+    def __len__(self):
+        return COUNTERS.unpack_from(self.buffer, COUNTERS_OFFSET)[0]
+
+    def approximate_bytes(self):
+        return len(self.buffer)
+
+    # inserts (under the insert lock)
+
+    def _locked(self):
+        return _FileLock(self._fd)
+
+    def _insert(self, record):
+        """Stores record unless its identifier is taken, returns whether it was stored."""
+        retailer = record["retailer"].encode()
+        minutes = datetime_to_minutes(record["purchaseDateTime"])
+        identifier_offset, position = self._identifier_slot(retailer, minutes)
+        if position:
+            return False
+
+        buffer = self.buffer
+        count, used = COUNTERS.unpack_from(buffer, COUNTERS_OFFSET)
+        frame = encode_record(record)
+        if count >= self.capacity or used + len(frame) > self.data_bytes:
+            raise ReceiptStorageFull(f'Shared store {self.path} is full: {count} receipts, '
+                                     f'{used} of {self.data_bytes} record bytes')
+        start = self.data_start + used
+        buffer[start:start + len(frame)] = frame
+        position = used + 1
+
+        # slot fields first, the record offset publishing them last
+        id_bytes = frame[FRAME.size:FRAME.size + 16]
+        id_offset, _ = self._id_slot(id_bytes)
+        ID_SLOT.pack_into(buffer, id_offset, id_bytes, record["points"], 0)
+        POSITION.pack_into(buffer, id_offset + ID_POSITION, position)
+        IDENTIFIER_SLOT.pack_into(buffer, identifier_offset, minutes, zlib.crc32(retailer), 0)
+        POSITION.pack_into(buffer, identifier_offset + IDENTIFIER_POSITION, position)
+        COUNTERS.pack_into(buffer, COUNTERS_OFFSET, count + 1, used + len(frame))
+        return True
+
+    def _store(self, receipt):
+        record = receipt.to_dict()
+        with self._locked():
+            stored = self._insert(record)
+        if not stored:
+            raise self.duplicate_error(receipt.identifier_tuple())
+
+    def _store_record(self, record):
+        with self._locked():
+            stored = self._insert(record)
+        if not stored:
+            raise self.duplicate_error(
+                (record["retailer"], Receipt.format_receipt_date(record["purchaseDateTime"])))
+
+    def _store_many(self, receipts):
+        """Stores a batch under one acquisition of the insert lock."""
+        records = [receipt.to_dict() for receipt in receipts]
+        with self._locked():
+            stored = [self._insert(record) for record in records]
+        return [None if ok else self.duplicate_error(receipt.identifier_tuple())
+                for receipt, ok in zip(receipts, stored)]
+
+    def recover(self, log):
+        # every worker would replay and append to the same log segments
+        raise ValueError('The shared storage backend does not support a receipt log '
+                         '(RECEIPT_DATA_DIR), its file already outlives worker restarts')
+
+    def _clear(self):
+        with self._locked():
+            zeros = bytes(CLEAR_CHUNK)
+            for offset in range(self.ids_start, self.data_start, CLEAR_CHUNK):
+                end = min(offset + CLEAR_CHUNK, self.data_start)
+                self.buffer[offset:end] = zeros[:end - offset]
+            COUNTERS.pack_into(self.buffer, COUNTERS_OFFSET, 0, 0)
+
+    def close(self):
+        self.buffer.close()
+        os.close(self._fd)
+
+
+class _FileLock:
+    """The process-wide insert lock plus an exclusive lockf on the shared file."""
+    def __init__(self, fd):
+        self.fd = fd
+        self.lock = _insert_lock
+
+    def __enter__(self):
+        self.lock.acquire()  # pylint: disable=consider-using-with
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        except BaseException:
+            self.lock.release()
+            raise
+
+    def __exit__(self, *exc_info):
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        finally:
+            self.lock.release()
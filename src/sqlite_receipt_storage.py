@@ -0,0 +1,331 @@
+import datetime
+import sqlite3
+import threading
+
+from src.config import Config
+from src.model.receipt import Receipt, RECEIPT_ID_NAME
+from src.receipt_storage import BaseReceiptStorage
+from src.duplicate_index import BloomFilter, identifier_hash
+from src.exceptions import ReceiptNotFound
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS receipts (
+        seq INTEGER PRIMARY KEY,
+        id TEXT NOT NULL UNIQUE,
+        retailer TEXT NOT NULL,
+        purchase_date_time TEXT NOT NULL,
+        total_cents INTEGER NOT NULL,
+        points INTEGER NOT NULL
+    )''',
+    # the duplicate check: retailer + purchase date-time is unique
+    '''CREATE UNIQUE INDEX IF NOT EXISTS receipts_identifier
+        ON receipts (retailer, purchase_date_time)''',
+    # search and statistics over all retailers (per retailer, receipts_identifier serves them)
+    '''CREATE INDEX IF NOT EXISTS receipts_purchase
+        ON receipts (purchase_date_time, id)''',
+    '''CREATE TABLE IF NOT EXISTS receipt_items (
+        receipt_seq INTEGER NOT NULL REFERENCES receipts (seq),
+        position INTEGER NOT NULL,
+        short_description TEXT NOT NULL,
+        price_cents INTEGER NOT NULL,
+        PRIMARY KEY (receipt_seq, position)
+    ) WITHOUT ROWID''',
+)
+INSERT_RECEIPT = ('INSERT INTO receipts '
+                  '(seq, id, retailer, purchase_date_time, total_cents, points) '
+                  'VALUES (?, ?, ?, ?, ?, ?)')
+INSERT_ITEM = ('INSERT INTO receipt_items '
+               '(receipt_seq, position, short_description, price_cents) VALUES (?, ?, ?, ?)')
+SELECT_DUPLICATE = 'SELECT 1 FROM receipts WHERE retailer = ? AND purchase_date_time = ?'
+SELECT_RECEIPT = ('SELECT seq, id, retailer, purchase_date_time, total_cents, points '
+                  'FROM receipts WHERE id = ?')
+SELECT_RECEIPTS_AFTER = ('SELECT seq, id, retailer, purchase_date_time, total_cents, points '
+                         'FROM receipts WHERE seq > ? ORDER BY seq LIMIT ?')
+SELECT_ITEMS = ('SELECT short_description, price_cents FROM receipt_items '
+                'WHERE receipt_seq = ? ORDER BY position')
+SELECT_ITEMS_BETWEEN = ('SELECT receipt_seq, short_description, price_cents '
+                        'FROM receipt_items WHERE receipt_seq BETWEEN ? AND ? '
+                        'ORDER BY receipt_seq, position')
+SELECT_POINTS = 'SELECT points FROM receipts WHERE id = ?'
+# get_many: {} is filled with the placeholders of up to MANY_CHUNK ids
+SELECT_RECEIPTS_IN = ('SELECT seq, id, retailer, purchase_date_time, total_cents, points '
+                      'FROM receipts WHERE id IN ({})')
+SELECT_ITEMS_IN = ('SELECT receipt_seq, short_description, price_cents FROM receipt_items '
+                   'WHERE receipt_seq IN ({}) ORDER BY receipt_seq, position')
+SELECT_POINTS_IN = 'SELECT id, points FROM receipts WHERE id IN ({})'
+# queries: {} is filled with the WHERE clause of the retailer and purchase range
+SELECT_IDS_ORDERED = 'SELECT id FROM receipts{} ORDER BY purchase_date_time, id LIMIT ?'
+SELECT_RETAILER_TOTALS = ('SELECT retailer, count(*), sum(total_cents), sum(points) '
+                          'FROM receipts{} GROUP BY retailer')
+SELECT_DAY_TOTALS = ('SELECT substr(purchase_date_time, 1, 10) AS day, count(*), '
+                     'sum(total_cents), sum(points) FROM receipts{} GROUP BY day ORDER BY day')
+SELECT_IDENTIFIERS = 'SELECT retailer, purchase_date_time FROM receipts'
+SELECT_MAX_SEQ = 'SELECT coalesce(max(seq), 0) FROM receipts'
+ITER_CHUNK = 1000
+# ids per IN (...) query, below SQLite's default limit of 999 parameters
+MANY_CHUNK = 500
+
+
+class SqliteReceiptStorage(BaseReceiptStorage):
+    """
+    SQLite (WAL mode) storage: one connection per thread, cached prepared statements,
+    duplicates rejected by the UNIQUE index on (retailer, purchase_date_time).
+    is_duplicate asks a BloomFilter of the stored identifiers first, so new receipts are
+    let through without a query. Receipts written by other processes are missing from it:
+    those duplicates get past is_duplicate and are rejected by the UNIQUE index on insert.
+    Search and statistics are SQL queries on the indexes of the table: not indexable, a
+    ReceiptIndex would hold in memory every receipt of a database that need not fit there.
+    """
+    blocking = True
+    indexable = False
+
+    def __init__(self, path=None, bloom_capacity=None):
+        self.path = path or Config.SQLITE_PATH
+        bloom_capacity = Config.DUPLICATE_BLOOM_CAPACITY if bloom_capacity is None \
+            else bloom_capacity
+        self.bloom = BloomFilter(bloom_capacity) if bloom_capacity else None
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        for statement in SCHEMA:
+            connection.execute(statement)
+        if self.bloom is not None:
+            for retailer, purchase_date_time in connection.execute(SELECT_IDENTIFIERS):
+                self.bloom.add(identifier_hash(
+                    retailer, datetime.datetime.fromisoformat(purchase_date_time)))
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # autocommit mode, transactions are opened explicitly
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False,
+                                         cached_statements=Config.SQLITE_CACHED_STATEMENTS)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(f'PRAGMA busy_timeout={Config.SQLITE_BUSY_TIMEOUT_MS}')
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    @staticmethod
+    def _receipt_row(seq, receipt):
+        return (seq, receipt.receipt_id, receipt.retailer,
+                Receipt.format_receipt_date(receipt.purchase_date_time),
+                receipt.total, receipt.points)
+
+    @staticmethod
+    def _item_rows(seq, items):
+        return [(seq, position, item["shortDescription"], item["price"])
+                for position, item in enumerate(items)]
+
+    def _add_to_bloom(self, retailer, purchase_date_time):
+        if self.bloom is not None:
+            self.bloom.add(identifier_hash(retailer, purchase_date_time))
+
+    def is_duplicate(self, receipt):
+        if self.bloom is not None and \
+                identifier_hash(receipt.retailer, receipt.purchase_date_time) not in self.bloom:
+            return False
+        return self._connection().execute(SELECT_DUPLICATE, receipt.identifier_tuple()) \
+            .fetchone() is not None
+
+    def _store(self, receipt):
+        self._store_record(receipt.to_dict())
+
+    def _store_record(self, record):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = connection.execute(INSERT_RECEIPT, (
+                None, record[RECEIPT_ID_NAME], record["retailer"],
+                Receipt.format_receipt_date(record["purchaseDateTime"]),
+                record["total"], record["points"]))
+            connection.executemany(INSERT_ITEM, self._item_rows(cursor.lastrowid, record["items"]))
+            # added under the write lock; a rolled back insert leaves a harmless false positive
+            self._add_to_bloom(record["retailer"], record["purchaseDateTime"])
+        except sqlite3.IntegrityError:
+            connection.execute('ROLLBACK')
+            raise self.duplicate_error(Receipt.record_identifier(record)) from None
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _store_many(self, receipts):
+        """One transaction and two executemany calls; falls back per receipt on a duplicate."""
+        if not receipts:
+            return []
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            # the write lock is held, so the next sequence numbers can be assigned up front
+            first_seq = connection.execute(SELECT_MAX_SEQ).fetchone()[0] + 1
+            connection.executemany(INSERT_RECEIPT, [
+                self._receipt_row(first_seq + offset, receipt)
+                for offset, receipt in enumerate(receipts)])
+            connection.executemany(INSERT_ITEM, [
+                row for offset, receipt in enumerate(receipts)
+                for row in self._item_rows(first_seq + offset, receipt.items)])
+            for receipt in receipts:
+                self._add_to_bloom(receipt.retailer, receipt.purchase_date_time)
+        except sqlite3.IntegrityError:
+            connection.execute('ROLLBACK')
+            return super()._store_many(receipts)
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return [None] * len(receipts)
+
+    def store_records(self, records):
+        """Stores already processed to_dict() records in one transaction (see _store_many)."""
+        return self._store_many([Receipt.from_record(record) for record in records])
+
+    @staticmethod
+    def _record(row, items):
+        _, receipt_id, retailer, purchase_date_time, total, points = row
+        return {
+            RECEIPT_ID_NAME: receipt_id,
+            "retailer": retailer,
+            # stored in DT_FORMAT, which fromisoformat reads much faster than strptime
+            "purchaseDateTime": datetime.datetime.fromisoformat(purchase_date_time),
+            "total": total,
+            "items": items,
+            "points": points,
+        }
+
+    def get_receipt(self, receipt_id):
+        connection = self._connection()
+        row = connection.execute(SELECT_RECEIPT, (receipt_id,)).fetchone()
+        if row is None:
+            raise ReceiptNotFound(receipt_id)
+        items = [{"shortDescription": description, "price": price}
+                 for description, price in connection.execute(SELECT_ITEMS, (row[0],))]
+        return self._record(row, items)
+
+    def get_receipt_points(self, receipt_id):
+        row = self._connection().execute(SELECT_POINTS, (receipt_id,)).fetchone()
+        if row is None:
+            raise ReceiptNotFound(receipt_id)
+        return row[0]
+
+    def _select_many(self, query, receipt_ids):
+        """Rows of query for the distinct receipt_ids, one IN (...) query per MANY_CHUNK of them."""
+        connection = self._connection()
+        receipt_ids = list(dict.fromkeys(receipt_ids))
+        rows = []
+        for start in range(0, len(receipt_ids), MANY_CHUNK):
+            chunk = receipt_ids[start:start + MANY_CHUNK]
+            rows.extend(connection.execute(query.format(','.join('?' * len(chunk))), chunk))
+        return rows
+
+    def get_many(self, receipt_ids):
+        rows = self._select_many(SELECT_RECEIPTS_IN, receipt_ids)
+        items = {}
+        connection = self._connection()
+        for start in range(0, len(rows), MANY_CHUNK):
+            seqs = [row[0] for row in rows[start:start + MANY_CHUNK]]
+            for seq, description, price in connection.execute(
+                    SELECT_ITEMS_IN.format(','.join('?' * len(seqs))), seqs):
+                items.setdefault(seq, []).append({"shortDescription": description, "price": price})
+        records = {row[1]: self._record(row, items.get(row[0], [])) for row in rows}
+        return {receipt_id: records[receipt_id] for receipt_id in receipt_ids
+                if receipt_id in records}
+
+    def get_many_points(self, receipt_ids):
+        points = dict(self._select_many(SELECT_POINTS_IN, receipt_ids))
+        return {receipt_id: points[receipt_id] for receipt_id in receipt_ids
+                if receipt_id in points}
+
+    def is_in(self, receipt_id):
+        return self._connection().execute(SELECT_POINTS, (receipt_id,)).fetchone() is not None
+
+    @staticmethod
+    def _where(retailer, start, end, after=None):
+        """(WHERE clause, parameters) of retailer, purchases in [start, end) and past after."""
+        conditions, parameters = [], []
+        if retailer is not None:
+            conditions.append('retailer = ?')
+            parameters.append(retailer)
+        if start is not None:
+            conditions.append('purchase_date_time >= ?')
+            parameters.append(Receipt.format_receipt_date(start))
+        if end is not None:
+            conditions.append('purchase_date_time < ?')
+            parameters.append(Receipt.format_receipt_date(end))
+        if after is not None:
+            conditions.append('(purchase_date_time, id) > (?, ?)')
+            parameters.extend(after)
+        return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), parameters
+
+    @staticmethod
+    def _day_start(value):
+        """Midnight of the day of a date or datetime, None being unbounded."""
+        return None if value is None else datetime.datetime.fromordinal(value.toordinal())
+
+    def query_receipt_ids(self, retailer=None, start=None, end=None, after=None, limit=100):
+        if after is not None:
+            record = self.get_receipt(after)
+            after = (Receipt.format_receipt_date(record["purchaseDateTime"]),
+                     record[RECEIPT_ID_NAME])
+        where, parameters = self._where(retailer, start, end, after)
+        return [receipt_id for receipt_id, in self._connection().execute(
+            SELECT_IDS_ORDERED.format(where), (*parameters, limit))]
+
+    def retailer_totals(self, start=None, end=None):
+        where, parameters = self._where(None, self._day_start(start), self._day_start(end))
+        return {retailer: tuple(totals) for retailer, *totals in self._connection().execute(
+            SELECT_RETAILER_TOTALS.format(where), parameters)}
+
+    def day_totals(self, retailer=None, start=None, end=None):
+        where, parameters = self._where(retailer, self._day_start(start), self._day_start(end))
+        return [(datetime.date.fromisoformat(day), *totals) for day, *totals in
+                self._connection().execute(SELECT_DAY_TOTALS.format(where), parameters)]
+
+    def iter_receipts(self):
+        for _, record in self.iter_positions():
+            yield record
+
+    def iter_positions(self, cursor=0):
+        # positions are sequence numbers, paged by: WAL readers never block the writers in between
+        connection = self._connection()
+        last_seq = cursor
+        while True:
+            rows = connection.execute(SELECT_RECEIPTS_AFTER, (last_seq, ITER_CHUNK)).fetchall()
+            if not rows:
+                return
+            items = {}
+            for seq, description, price in connection.execute(
+                    SELECT_ITEMS_BETWEEN, (rows[0][0], rows[-1][0])):
+                items.setdefault(seq, []).append({"shortDescription": description, "price": price})
+            for row in rows:
+                yield row[0], self._record(row, items.get(row[0], []))
+            last_seq = rows[-1][0]
+
+    def _clear(self):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        connection.execute('DELETE FROM receipt_items')
+        connection.execute('DELETE FROM receipts')
+        if self.bloom is not None:
+            self.bloom.clear()
+        connection.execute('COMMIT')
+
+    def close(self):
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def approximate_bytes(self):
+        """Size of the database file (the receipts live on disk, not in memory)."""
+        connection = self._connection()
+        page_count = connection.execute('PRAGMA page_count').fetchone()[0]
+        return page_count * connection.execute('PRAGMA page_size').fetchone()[0]
+
+    def __len__(self):
+        return self._connection().execute('SELECT count(*) FROM receipts').fetchone()[0]
@@ -0,0 +1,38 @@
+from src.config import Config
+from src.persistence import ReceiptLog
+from src.receipt_storage import ReceiptStorage
+from src.bounded_receipt_storage import BoundedReceiptStorage
+from src.compact_receipt_storage import CompactReceiptStorage
+from src.concurrent_receipt_storage import ConcurrentReceiptStorage
+from src.sqlite_receipt_storage import SqliteReceiptStorage
+from src.shared_receipt_storage import SharedReceiptStorage
+
+STORAGE_BACKENDS = {
+    'memory': ReceiptStorage,
+    'bounded': BoundedReceiptStorage,
+    'compact': CompactReceiptStorage,
+    'concurrent': ConcurrentReceiptStorage,
+    'sqlite': SqliteReceiptStorage,
+    'shared': SharedReceiptStorage,
+}
+
+
+def create_receipt_storage(backend=None, data_dir=None):
+    """
+    Creates the storage engine selected by Config.STORAGE_BACKEND (or backend).
+    With Config.DATA_DIR (or data_dir) set, receipts are recovered from and logged to that
+    directory.
+    With Config.SECONDARY_INDEXES the recovered receipts are indexed for the query endpoints.
+    """
+    backend = backend or Config.STORAGE_BACKEND
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend '{backend}', "
+                         f"expected one of {sorted(STORAGE_BACKENDS)}")
+    storage = STORAGE_BACKENDS[backend]()
+
+    data_dir = data_dir or Config.DATA_DIR
+    if data_dir:
+        storage.recover(ReceiptLog(data_dir))
+    if Config.SECONDARY_INDEXES and storage.indexable:
+        storage.enable_index()
+    return storage
@@ -0,0 +1,69 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from src.bulk_import import import_file, iter_ranges, main
+from src.compact_receipt_storage import CompactReceiptStorage
+from src.persistence import ReceiptLog, FSYNC_NEVER
+from src.receipt_storage import ReceiptStorage
+from src.test.persistence_test import receipt_at
+
+
+class BulkImportTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.path = os.path.join(self.directory.name, 'receipts.ndjson')
+        lines = [json.dumps(receipt_at(minute)) for minute in range(300)]
+        lines[10] = '{"retailer": '
+        lines[20] = json.dumps(dict(receipt_at(20), total="1.5"))
+        lines[30] = json.dumps(receipt_at(5))
+        lines[40] = ''
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lines))  # no trailing newline
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_ranges_cover_the_file_on_line_boundaries(self):
+        ranges = list(iter_ranges(self.path, chunk_bytes=1000))
+        self.assertGreater(len(ranges), 10)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], os.path.getsize(self.path))
+        with open(self.path, 'rb') as file:
+            data = file.read()
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, start)
+            self.assertEqual(data[end - 1:end], b'\n')
+
+    def check_import(self, storage, workers):
+        stats = import_file(self.path, storage, workers=workers, chunk_bytes=1000)
+        self.assertEqual((stats.rows, stats.stored, stats.rejected, stats.duplicates),
+                         (299, 296, 2, 1))
+        self.assertEqual(len(storage), 296)
+        self.assertEqual([message.split(' ')[0] for _, message in stats.rejects],
+                         ['Expecting', "'1.5'"])
+
+    def test_import_in_process(self):
+        self.check_import(ReceiptStorage(), workers=1)
+
+    def test_import_with_workers(self):
+        self.check_import(CompactReceiptStorage(), workers=3)
+
+    def test_import_to_snapshot(self):
+        data_dir = os.path.join(self.directory.name, 'data')
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            main([self.path, '--workers', '2', '--chunk-mb', '0.001', '--backend', 'compact',
+                  '--data-dir', data_dir])
+
+        log = ReceiptLog(data_dir, fsync_policy=FSYNC_NEVER)
+        storage = CompactReceiptStorage()
+        storage.recover(log)
+        log.close()
+        self.assertEqual(len(storage), 296)
+
+
+if __name__ == '__main__':
+    unittest.main()
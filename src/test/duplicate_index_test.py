@@ -0,0 +1,103 @@
+import datetime
+import os
+import random
+import tempfile
+import unittest
+
+from src.duplicate_index import BloomFilter, DuplicateIndex, StringPool
+from src.model.receipt import Receipt
+from src.sqlite_receipt_storage import SqliteReceiptStorage
+from src.test.receipt_storage_test import valid_receipt, minute_receipts
+
+PURCHASE = datetime.datetime(2022, 1, 2, 8, 13)
+
+
+class BloomFilterTests(unittest.TestCase):
+    def test_no_false_negatives_and_bounded_false_positives(self):
+        rnd = random.Random(16)
+        bloom = BloomFilter(20_000, error_rate=0.01)
+        added = {rnd.getrandbits(62) for _ in range(20_000)}
+        for key in added:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in added))
+
+        absent = [key for key in (rnd.getrandbits(62) for _ in range(20_000)) if key not in added]
+        false_positives = sum(key in bloom for key in absent) / len(absent)
+        self.assertLess(false_positives, 0.02)
+
+        bloom.clear()
+        self.assertFalse(any(key in bloom for key in added))
+
+
+class DuplicateIndexTests(unittest.TestCase):
+    def test_add_contains_discard(self):
+        for bloom_capacity in (0, 1000):
+            index = DuplicateIndex(bloom_capacity=bloom_capacity)
+            self.assertFalse(index.contains("Walgreens", PURCHASE))
+            key = index.add("Walgreens", PURCHASE)
+            self.assertEqual(index.key("Walgreens", PURCHASE), key)
+            self.assertTrue(index.contains("Walgreens", PURCHASE))
+            self.assertFalse(index.contains("Walgreens", PURCHASE + datetime.timedelta(minutes=1)))
+            self.assertFalse(index.contains("Target", PURCHASE))
+            index.discard("Walgreens", PURCHASE)
+            self.assertFalse(index.contains("Walgreens", PURCHASE))
+            self.assertEqual(len(index), 0)
+
+    def test_shared_pool_outlives_clear(self):
+        retailers = StringPool()
+        index = DuplicateIndex(retailers)
+        index.add("Walgreens", PURCHASE)
+        index.clear()
+        self.assertEqual(retailers.get("Walgreens"), 0)
+        own = DuplicateIndex()
+        own.add("Walgreens", PURCHASE)
+        own.clear()
+        self.assertIsNone(own.retailers.get("Walgreens"))
+
+    def test_load_keys(self):
+        index = DuplicateIndex(bloom_capacity=100)
+        key = index.add("Walgreens", PURCHASE)
+        index.load_keys([key])
+        self.assertTrue(index.contains("Walgreens", PURCHASE))
+
+    def test_identifier_tuple_built_once(self):
+        receipt = Receipt.from_input(valid_receipt)
+        self.assertIs(receipt.identifier_tuple(), receipt.identifier_tuple())
+        self.assertEqual(receipt.identifier_tuple(), ("Walgreens", "2022-01-02 08:13"))
+
+
+class SqliteBloomTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.path = os.path.join(self.directory.name, 'receipts.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_bloom_is_loaded_from_the_database(self):
+        storage = SqliteReceiptStorage(self.path, bloom_capacity=1000)
+        storage.process_receipts(minute_receipts(10))
+        storage.close()
+
+        reopened = SqliteReceiptStorage(self.path, bloom_capacity=1000)
+        receipts = [Receipt.from_input(data) for data in minute_receipts(12)]
+        self.assertEqual([reopened.is_duplicate(receipt) for receipt in receipts],
+                         [True] * 10 + [False] * 2)
+        reopened.clear()
+        self.assertFalse(reopened.is_duplicate(receipts[0]))
+        reopened.close()
+
+    def test_writes_from_another_storage_are_still_rejected(self):
+        first = SqliteReceiptStorage(self.path, bloom_capacity=1000)
+        second = SqliteReceiptStorage(self.path, bloom_capacity=1000)
+        first.process_receipt(valid_receipt)
+        # second's Bloom filter has not seen it: the UNIQUE index rejects it on insert
+        outcome, = second.process_receipts([valid_receipt])
+        self.assertIn('duplicate', str(outcome))
+        self.assertEqual(len(second), 1)
+        first.close()
+        second.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+
+from src.idempotency_cache import IdempotencyCache, request_key
+
+
+class IdempotencyCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.cache = IdempotencyCache(max_entries=2, ttl_seconds=60, clock=lambda: self.now)
+
+    def test_request_key(self):
+        self.assertEqual(request_key(b'{"total":"1.00"}'), request_key(b'{"total":"1.00"}'))
+        self.assertNotEqual(request_key(b'{"total":"1.00"}'), request_key(b'{"total":"1.0"}'))
+        self.assertEqual(request_key(b'{}', 'retry-1'), request_key(b'[]', 'retry-1'))
+
+    def test_entries_expire_after_the_window(self):
+        self.cache.put('a', 'id-a', 200)
+        self.now += 59
+        self.assertEqual(self.cache.get('a'), ('id-a', 200))
+        self.now += 1
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.put('b', 'id-b', 202)
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_bounded(self):
+        for key in 'abc':
+            self.cache.put(key, f'id-{key}', 200)
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.get('c'), ('id-c', 200))
+
+    def test_disabled(self):
+        cache = IdempotencyCache(max_entries=0)
+        cache.put('a', 'id-a', 200)
+        self.assertFalse(cache.enabled)
+        self.assertIsNone(cache.get('a'))
+
+
+if __name__ == "__main__":
+    unittest.main()
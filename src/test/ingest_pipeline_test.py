@@ -0,0 +1,112 @@
+import unittest
+from unittest.mock import patch
+
+from src import receipt_app
+from src.config import STATUS_CODE
+from src.ingest_pipeline import IngestPipeline
+from src.receipt_storage import ReceiptStorage
+from src.exceptions import IngestQueueFull, ReceiptIsDuplicate, ReceiptPending
+from src.test.receipt_storage_test import valid_receipt, minute_receipts
+
+
+class IngestPipelineTests(unittest.TestCase):
+    def setUp(self):
+        self.storage = ReceiptStorage()
+
+    def test_queued_receipts_are_stored_in_batches(self):
+        pipeline = IngestPipeline(self.storage, workers=0, batch_size=64, wait_ms=0)
+        receipt_ids = [pipeline.submit(input_data) for input_data in minute_receipts(100)]
+        with self.assertRaises(ReceiptPending):
+            pipeline.check(receipt_ids[0])
+        self.assertEqual(len(self.storage), 0)
+
+        with patch.object(self.storage, 'store_receipts',
+                          wraps=self.storage.store_receipts) as store_receipts:
+            pipeline.start(1)
+            pipeline.close()
+        self.assertEqual([len(call.args[0]) for call in store_receipts.call_args_list], [64, 36])
+        for receipt_id in receipt_ids:
+            pipeline.check(receipt_id)
+            self.assertEqual(self.storage.get_receipt_points(receipt_id), 15)
+
+    def test_close_stores_the_queued_receipts(self):
+        pipeline = IngestPipeline(self.storage, workers=0, batch_size=16)
+        receipt_ids = [pipeline.submit(input_data) for input_data in minute_receipts(40)]
+        pipeline.close()
+        self.assertEqual(len(self.storage), 40)
+        for receipt_id in receipt_ids:
+            pipeline.check(receipt_id)
+        self.assertEqual(pipeline.pending, {})
+
+    def test_check_waits_for_the_batch(self):
+        pipeline = IngestPipeline(self.storage, workers=1, wait_ms=5000)
+        receipt_id = pipeline.submit(valid_receipt)
+        pipeline.check(receipt_id)
+        self.assertEqual(self.storage.get_receipt_points(receipt_id), 15)
+        pipeline.close()
+
+    def test_duplicates_of_stored_and_queued_receipts(self):
+        pipeline = IngestPipeline(self.storage, workers=0)
+        self.storage.process_receipt(minute_receipts(2)[1])
+        pipeline.submit(valid_receipt)
+        with self.assertRaises(ReceiptIsDuplicate):
+            pipeline.submit(valid_receipt)
+        with self.assertRaises(ReceiptIsDuplicate):
+            pipeline.submit(minute_receipts(2)[1])
+
+    def test_receipt_losing_a_race_is_rejected(self):
+        pipeline = IngestPipeline(self.storage, workers=0, wait_ms=0)
+        receipt_id = pipeline.submit(valid_receipt)
+        # stored by the synchronous path while it was queued
+        self.storage.process_receipt(valid_receipt)
+        pipeline.start(1)
+        pipeline.close()
+        with self.assertRaises(ReceiptIsDuplicate):
+            pipeline.check(receipt_id)
+        self.assertEqual(len(self.storage), 1)
+
+    def test_full_queue(self):
+        pipeline = IngestPipeline(self.storage, queue_size=2, workers=0)
+        pipeline.submit(minute_receipts(1)[0])
+        pipeline.submit(minute_receipts(2)[1])
+        with self.assertRaises(IngestQueueFull):
+            pipeline.submit(minute_receipts(3)[2])
+
+
+class AsyncProcessRouteTests(unittest.TestCase):
+    def setUp(self):
+        self.app = receipt_app.app.test_client()
+        receipt_app.receipt_storage.clear()
+
+    def test_accepted_pending_and_stored(self):
+        pipeline = IngestPipeline(receipt_app.receipt_storage, queue_size=1, workers=0, wait_ms=0)
+        with patch.object(receipt_app, 'ingest', pipeline):
+            response = self.app.post('/receipts/process', json=valid_receipt)
+            self.assertEqual(response.status_code, STATUS_CODE.ACCEPTED)
+            receipt_id = response.json['id']
+            pending = self.app.get(f'/receipts/{receipt_id}/points')
+            self.assertEqual(pending.status_code, STATUS_CODE.ACCEPTED)
+            self.assertEqual(pending.json, {'id': receipt_id, 'status': 'pending'})
+            batch = self.app.post('/receipts/points:batchGet', json={'ids': [receipt_id, 'x']})
+            self.assertEqual(batch.json, {'points': [], 'pending': [receipt_id],
+                                          'notFound': ['x']})
+
+            retry = self.app.post('/receipts/process', json=valid_receipt)
+            self.assertEqual((retry.status_code, retry.json),
+                             (STATUS_CODE.ACCEPTED, {'id': receipt_id}))
+            duplicate = self.app.post('/receipts/process',
+                                      json=dict(valid_receipt, items=valid_receipt['items'][::-1]))
+            self.assertEqual(duplicate.status_code, STATUS_CODE.INPUT_ERROR)
+            full = self.app.post('/receipts/process', json=minute_receipts(1)[0])
+            self.assertEqual(full.status_code, STATUS_CODE.SERVICE_UNAVAILABLE)
+            self.assertEqual(full.headers['Retry-After'], '1')
+
+            pipeline.start(1)
+            pipeline.close()
+            self.assertEqual(self.app.get(f'/receipts/{receipt_id}/points').json, {'points': 15})
+            self.assertEqual(self.app.get(f'/receipts/{receipt_id}').status_code,
+                             STATUS_CODE.SUCCESS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import datetime
+import json
+import unittest
+
+from flask import Flask, request
+
+from src import json_codec
+from src.json_codec import JSONProvider, StdlibJSONCodec, OrjsonJSONCodec, create_codec
+
+record = {
+    "id": "7fb1377b-b223-49d9-a31a-5a02701dd310",
+    "retailer": "M&M Corner Market",
+    "purchaseDateTime": datetime.datetime(2022, 3, 20, 14, 33),
+    "total": 9.0,
+    "items": [{"shortDescription": "Gatorade", "price": 2.25}] * 4,
+    "points": 109,
+}
+expected = json.dumps(dict(record, purchaseDateTime="2022-03-20 14:33"),
+                      separators=(',', ':'), sort_keys=True).encode()
+
+
+class JSONCodecTests(unittest.TestCase):
+    def codecs(self):
+        codecs = [StdlibJSONCodec()]
+        if json_codec.orjson is not None:
+            codecs.append(OrjsonJSONCodec())
+        return codecs
+
+    def test_dumps_like_jsonify_with_receipt_date_times(self):
+        for codec in self.codecs():
+            with self.subTest(codec=codec.name):
+                self.assertEqual(codec.dumps(record), expected)
+                self.assertEqual(codec.dumps({'day': datetime.date(2022, 3, 20)}),
+                                 b'{"day":"2022-03-20"}')
+                with self.assertRaises(TypeError):
+                    codec.dumps({'points': {1, 2}})
+
+    def test_codecs_write_the_same_bytes(self):
+        text = {"retailer": "Café Müller", "items": [{"shortDescription": "Crème brûlée 🍮"}]}
+        encoded = [codec.dumps(text) for codec in self.codecs()]
+        self.assertEqual(encoded[0], json.dumps(text, separators=(',', ':'), sort_keys=True,
+                                                ensure_ascii=False).encode())
+        self.assertEqual(len(set(encoded)), 1)
+        self.assertIn('Café'.encode(), encoded[0])
+
+    def test_loads(self):
+        for codec in self.codecs():
+            with self.subTest(codec=codec.name):
+                self.assertEqual(codec.loads(b'{"total":"9.00","items":[]}'),
+                                 {'total': '9.00', 'items': []})
+                self.assertEqual(codec.loads('[1.5]'), [1.5])
+                with self.assertRaises(ValueError):
+                    codec.loads(b'{"total":')
+
+    def test_create_codec(self):
+        self.assertEqual(create_codec('stdlib').name, 'stdlib')
+        self.assertEqual(create_codec('auto').name,
+                         'stdlib' if json_codec.orjson is None else 'orjson')
+        with self.assertRaises(ValueError):
+            create_codec('simplejson')
+
+    def test_flask_provider(self):
+        app = Flask(__name__)
+        app.json = JSONProvider(app)
+        with app.app_context():
+            response = app.json.response({'receipt': record})
+        self.assertEqual(response.get_data(), b'{"receipt":' + expected + b'}\n')
+        self.assertEqual(response.mimetype, 'application/json')
+        with app.test_request_context(json={'total': '9.00'}):
+            self.assertEqual(request.get_json(), {'total': '9.00'})
+
+
+if __name__ == "__main__":
+    unittest.main()
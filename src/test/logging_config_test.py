@@ -0,0 +1,57 @@
+import io
+import json
+import logging
+import queue
+import unittest
+
+from src.logging_config import (JSONFormatter, SamplingFilter, DroppingQueueHandler,
+                                configure_logging, stop_logging)
+
+
+def make_record(message, *args, level=logging.INFO):
+    return logging.LogRecord('src.receipt_app', level, __file__, 1, message, args, None)
+
+
+class LoggingConfigTests(unittest.TestCase):
+    def tearDown(self):
+        configure_logging()
+
+    def test_json_formatter(self):
+        entry = json.loads(JSONFormatter().format(make_record('Processed receipt id=%s', 'abc')))
+        self.assertEqual((entry['level'], entry['logger'], entry['message']),
+                         ('INFO', 'src.receipt_app', 'Processed receipt id=abc'))
+        self.assertIn('T', entry['time'])
+
+    def test_sampling_per_level_and_message(self):
+        sampling = SamplingFilter({'INFO': 10, 'DEBUG': 1})
+        kept = [sampling.filter(make_record('Processed receipt id=%s', n)) for n in range(25)]
+        self.assertEqual(kept.count(True), 3)
+        self.assertTrue(sampling.filter(make_record('Processed receipt batch of %d items', 5)))
+        self.assertTrue(all(sampling.filter(make_record('Not found', level=logging.ERROR))
+                            for _ in range(5)))
+
+    def test_full_queue_drops_records(self):
+        handler = DroppingQueueHandler(queue.Queue(2))
+        for n in range(5):
+            handler.handle(make_record('Processed receipt id=%s', n))
+        self.assertEqual((handler.queue.qsize(), handler.dropped), (2, 3))
+        # not formatted on the logging thread
+        self.assertEqual(handler.queue.get().msg, 'Processed receipt id=%s')
+
+    def test_records_are_written_by_the_listener(self):
+        stream = io.StringIO()
+        configure_logging(level='INFO', log_format='json', sample_every={'INFO': 2},
+                          stream=stream)
+        logger = logging.getLogger('src.receipt_app')
+        for n in range(4):
+            logger.info('Processed receipt id=%s', n)
+        logger.debug('below the level')
+        logger.error('Receipt %s not found', 'abc')
+        stop_logging()
+        messages = [json.loads(line)['message'] for line in stream.getvalue().splitlines()]
+        self.assertEqual(messages, ['Processed receipt id=0', 'Processed receipt id=2',
+                                    'Receipt abc not found'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import gc
+import threading
+import unittest
+
+from src import metrics
+from src.receipt_app import app, receipt_storage
+from src.config import STATUS_CODE
+from src.test.receipt_app_test import valid_receipt
+
+
+class HistogramTests(unittest.TestCase):
+    def setUp(self):
+        metrics.set_enabled(True)
+
+    def test_render(self):
+        histogram = metrics.Histogram('test_seconds', 'Test.', ('stage',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value, 'parse')
+        self.assertEqual(histogram.count('parse'), 4)
+        self.assertEqual(histogram.render(), [
+            '# HELP test_seconds Test.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{stage="parse",le="0.1"} 2',
+            'test_seconds_bucket{stage="parse",le="1.0"} 3',
+            'test_seconds_bucket{stage="parse",le="+Inf"} 4',
+            'test_seconds_sum{stage="parse"} 2.65',
+            'test_seconds_count{stage="parse"} 4',
+        ])
+
+    def test_counter(self):
+        counter = metrics.Counter('test_total', 'Test.', ('status',))
+        counter.inc('404')
+        counter.inc('404', amount=2)
+        self.assertEqual(counter.render()[-1], 'test_total{status="404"} 3')
+
+    def test_finished_threads_are_merged(self):
+        counter = metrics.Counter('test_total', 'Test.', ('route',))
+        histogram = metrics.Histogram('test_seconds', 'Test.', buckets=(1.0,))
+        for _ in range(50):
+            thread = threading.Thread(target=lambda: (counter.inc('/a'), histogram.observe(0.5)))
+            thread.start()
+            thread.join()
+        del thread
+        gc.collect()
+        # the values of finished threads are folded in, not kept per thread
+        self.assertEqual(len(counter._thread_values), 0)  # pylint: disable=protected-access
+        self.assertEqual(counter.value('/a'), 50)
+        self.assertEqual(histogram.count(), 50)
+        counter.inc('/a')
+        self.assertEqual(counter.value('/a'), 51)
+        counter.reset()
+        self.assertEqual(counter.value('/a'), 0)
+
+
+class MetricsEndpointTests(unittest.TestCase):
+    def setUp(self):
+        self.app = app.test_client()
+        receipt_storage.clear()
+        metrics.set_enabled(True)
+        metrics.REGISTRY.reset()
+        # ASGI apps created by other tests register their own storage
+        metrics.register_storage(receipt_storage)
+
+    def tearDown(self):
+        metrics.set_enabled(True)
+
+    def test_stages_and_counters(self):
+        self.app.post('/receipts/process', json=valid_receipt)
+        self.app.post('/receipts/process',
+                      json=dict(valid_receipt, items=valid_receipt['items'][::-1]))
+        self.app.get('/receipts/unknown/points')
+
+        for stage in (metrics.STAGE_PARSE, metrics.STAGE_POINTS, metrics.STAGE_DUPLICATE_CHECK,
+                      metrics.STAGE_STORE, metrics.STAGE_SERIALIZE):
+            self.assertEqual(metrics.STAGE_SECONDS.count(stage),
+                             2 if stage in (metrics.STAGE_PARSE, metrics.STAGE_POINTS,
+                                            metrics.STAGE_DUPLICATE_CHECK) else 1, stage)
+        self.assertEqual(metrics.PROCESSED.value(), 1)
+        self.assertEqual(metrics.DUPLICATES.value(), 1)
+
+        response = self.app.get('/metrics')
+        self.assertEqual(response.status_code, STATUS_CODE.SUCCESS)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        text = response.get_data(as_text=True)
+        self.assertIn('receipt_responses_total{route="/receipts/process",status="200"} 1', text)
+        self.assertIn('receipt_responses_total{route="/receipts/process",status="400"} 1', text)
+        self.assertIn('receipt_responses_total{route="/receipts/<receipt_id>/points",'
+                      'status="404"} 1', text)
+        self.assertIn('receipt_request_seconds_count{route="/receipts/process"} 2', text)
+        self.assertIn('receipt_storage_receipts 1', text)
+        self.assertIn('receipt_storage_bytes ', text)
+
+    def test_disabled(self):
+        metrics.set_enabled(False)
+        self.app.post('/receipts/process', json=valid_receipt)
+        self.assertEqual(metrics.STAGE_SECONDS.count(metrics.STAGE_PARSE), 0)
+        self.assertEqual(metrics.PROCESSED.value(), 0)
+        self.assertEqual(self.app.get('/metrics').status_code, STATUS_CODE.NO_RECORD_FOUND)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import math
+import os
+import random
+import unittest
+from decimal import Decimal
+
+from src.model.money import to_cents, cents_to_amount
+from src.model.points_calculator import PointsCalculator
+from src.model.receipt_parser import parse_money
+
+# RECEIPT_SLOW_TESTS=1 cross-checks 2M amounts, which takes longer than the rest of the suite
+CROSS_CHECK_PRICES = 2_000_000 if os.environ.get('RECEIPT_SLOW_TESTS') == '1' else 20_000
+AMOUNT_LIMITS = (10_000, 10_000, 1_000_000, 10 ** 14)
+PRICE_FIELD = {'pattern': "^\\d+\\.\\d{2}$"}
+
+
+def random_amounts(rnd, count):
+    """Amount strings up to 10^12 (small prices most of all), every other one a quarter multiple."""
+    for position in range(count):
+        cents = rnd.randrange(AMOUNT_LIMITS[position % len(AMOUNT_LIMITS)])
+        if position % 2:
+            cents -= cents % 25
+        yield f"{cents // 100}.{cents % 100:02d}"
+
+
+class MoneyTests(unittest.TestCase):
+    def test_to_cents(self):
+        self.assertEqual(to_cents("35.35"), 3535)
+        self.assertEqual(to_cents("0.07"), 7)
+        self.assertEqual(to_cents(12.1), 1210)
+        self.assertEqual(to_cents("1.005"), 100)
+        with self.assertRaises(ValueError):
+            to_cents("1,00")
+
+    def test_cross_check_against_decimal(self):
+        """Integer cents parsing, scoring and JSON output against a Decimal reference."""
+        rules = PointsCalculator.rules
+        round_dollar = rules['total_round_dollar']['method']
+        quarters = rules['total_in_quarters']['method']
+        item_points = rules['items_names_in3']['method']
+        one, quarter, fifth = Decimal(1), Decimal('0.25'), Decimal('0.2')
+
+        texts = list(random_amounts(random.Random(14), CROSS_CHECK_PRICES))
+        amounts = [Decimal(text) for text in texts]
+        cents = [parse_money(text, PRICE_FIELD, '') for text in texts]
+        # whole lists are compared at once, per-value assertions would dominate the run time
+        self._assert_all(texts, cents, [int(amount * 100) for amount in amounts])
+        self._assert_all(texts, [round_dollar(value) for value in cents],
+                         [50 if amount % one == 0 else 0 for amount in amounts])
+        self._assert_all(texts, [quarters(value) for value in cents],
+                         [25 if amount % quarter == 0 else 0 for amount in amounts])
+        self._assert_all(texts, [item_points([{"shortDescription": "abc", "price": value}])
+                                 for value in cents],
+                         [math.ceil(fifth * amount) for amount in amounts])
+        self._assert_all(texts, [Decimal(repr(cents_to_amount(value))) for value in cents],
+                         amounts)
+
+    def _assert_all(self, texts, actual, expected):
+        if actual != expected:
+            position = next(position for position, (value, reference)
+                            in enumerate(zip(actual, expected)) if value != reference)
+            self.fail(f"{texts[position]}: {actual[position]} != {expected[position]}")
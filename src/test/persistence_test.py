@@ -0,0 +1,147 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from src.persistence import ReceiptLog, encode_record, iter_frames, FSYNC_ALWAYS, FSYNC_NEVER
+from src.receipt_storage import ReceiptStorage
+from src.compact_receipt_storage import CompactReceiptStorage
+from src.exceptions import ReceiptIsDuplicate
+
+valid_receipt = {
+    "retailer": "Walgreens",
+    "purchaseDate": "2022-01-02",
+    "purchaseTime": "08:13",
+    "total": "2.65",
+    "items": [
+        {"shortDescription": "Pepsi - 12-oz", "price": "1.25"},
+        {"shortDescription": "Dasani", "price": "1.40"},
+    ],
+}
+
+
+def receipt_at(minute):
+    return dict(valid_receipt, purchaseTime=f"{minute // 60:02d}:{minute % 60:02d}")
+
+
+class ReceiptLogTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.logs = []
+
+    def tearDown(self):
+        for log in self.logs:
+            log.close()
+        self.directory.cleanup()
+
+    def open_storage(self, storage_class=ReceiptStorage, **log_options):
+        log_options.setdefault('fsync_policy', FSYNC_NEVER)
+        log = ReceiptLog(self.directory.name, **log_options)
+        self.logs.append(log)
+        storage = storage_class()
+        storage.recover(log)
+        return storage
+
+    def test_record_round_trip(self):
+        storage = ReceiptStorage()
+        receipt_id, record = storage.process_receipt(valid_receipt)
+        decoded = list(iter_frames(encode_record(record)))
+        self.assertEqual(len(decoded), 1)
+        self.assertEqual(decoded[0][0], storage.get_receipt(receipt_id))
+
+    def test_recover_from_log(self):
+        storage = self.open_storage(fsync_policy=FSYNC_ALWAYS)
+        first_id, _ = storage.process_receipt(receipt_at(1))
+        results = storage.process_receipts([receipt_at(2), receipt_at(1), receipt_at(3)])
+
+        recovered = self.open_storage()
+        self.assertEqual(len(recovered), 3)
+        for receipt_id in (first_id, results[0], results[2]):
+            self.assertEqual(recovered.get_receipt(receipt_id), storage.get_receipt(receipt_id))
+        with self.assertRaises(ReceiptIsDuplicate):
+            recovered.process_receipt(receipt_at(1))
+
+    def test_recover_from_snapshot_and_tail(self):
+        storage = self.open_storage(CompactReceiptStorage, segment_max_bytes=256)
+        ids = [storage.process_receipt(receipt_at(minute))[0] for minute in range(10)]
+        storage.snapshot()
+        ids += [storage.process_receipt(receipt_at(minute))[0] for minute in range(10, 15)]
+
+        recovered = self.open_storage(CompactReceiptStorage)
+        self.assertEqual(len(recovered), 15)
+        self.assertEqual([recovered.get_receipt_points(receipt_id) for receipt_id in ids],
+                         [storage.get_receipt_points(receipt_id) for receipt_id in ids])
+
+    def test_snapshot_restores_into_other_backend(self):
+        storage = self.open_storage()
+        ids = [storage.process_receipt(dict(receipt_at(minute), retailer="Café Ñandú"))[0]
+               for minute in range(5)]
+        storage.snapshot()
+
+        recovered = self.open_storage(CompactReceiptStorage)
+        for receipt_id in ids:
+            self.assertEqual(recovered.get_receipt(receipt_id), storage.get_receipt(receipt_id))
+        with self.assertRaises(ReceiptIsDuplicate):
+            recovered.process_receipt(dict(receipt_at(0), retailer="Café Ñandú"))
+
+    def test_periodic_snapshot(self):
+        storage = self.open_storage(snapshot_every=5)
+        for minute in range(6):
+            storage.process_receipt(receipt_at(minute))
+        for thread in threading.enumerate():
+            if thread.name == 'receipt-snapshot':
+                thread.join()
+        self.assertTrue(os.path.exists(storage.log.snapshot_path))
+        self.assertEqual(len(self.open_storage()), 6)
+
+    def test_torn_tail_is_truncated(self):
+        storage = self.open_storage()
+        storage.process_receipt(receipt_at(1))
+        storage.process_receipt(receipt_at(2))
+        storage.log.close()
+        path = storage.log.segment_path(storage.log.segment_numbers()[-1])
+        os.truncate(path, os.path.getsize(path) - 3)
+
+        recovered = self.open_storage()
+        self.assertEqual(len(recovered), 1)
+        recovered.process_receipt(receipt_at(2))
+        self.assertEqual(len(self.open_storage()), 2)
+
+    def test_clear_resets_log(self):
+        storage = self.open_storage()
+        storage.process_receipt(receipt_at(1))
+        storage.snapshot()
+        storage.clear()
+        self.assertEqual(len(self.open_storage()), 0)
+
+    def test_clear_waits_for_a_running_snapshot(self):
+        storage = self.open_storage()
+        storage.process_receipt(receipt_at(1))
+        reading, release = threading.Event(), threading.Event()
+
+        def read_table():
+            reading.set()
+            release.wait(5)
+            return storage.snapshot_table()
+
+        snapshot = threading.Thread(target=storage.log.snapshot, args=(read_table,))
+        snapshot.start()
+        reading.wait(5)
+        clear = threading.Thread(target=storage.clear)
+        clear.start()
+        clear.join(0.2)
+        self.assertTrue(clear.is_alive())
+        release.set()
+        snapshot.join()
+        clear.join()
+        # the snapshot taken before the clear is dropped with the log
+        self.assertFalse(os.path.exists(storage.log.snapshot_path))
+        self.assertEqual(len(self.open_storage()), 0)
+
+    def test_unknown_fsync_policy(self):
+        with self.assertRaises(ValueError):
+            ReceiptLog(self.directory.name, fsync_policy='sometimes')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import random
+import unittest
+from unittest.mock import patch
+
+from src.model import points_calculator
+from src.model.points_calculator import PointsCalculator, CompiledRules
+from src.model.receipt import Receipt
+
+
+def random_receipt_data(rnd):
+    return {
+        "retailer": rnd.choice(["Target", "M&M Corner Market", "Walgreens", "7-Eleven", "A B"]),
+        "purchaseDate":
+            f"20{rnd.randint(10, 23)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+        "purchaseTime": f"{rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}",
+        "total": f"{rnd.randint(0, 300)}.{rnd.choice([0, 25, 50, 75, rnd.randint(0, 99)]):02d}",
+        "items": [
+            {"shortDescription": " " * rnd.randint(0, 2) + "x" * rnd.randint(1, 12),
+             "price": f"{rnd.randint(0, 100)}.{rnd.randint(0, 99):02d}"}
+            for _ in range(rnd.randint(2, 8))
+        ],
+    }
+
+
+class PointsCalculatorBatchTests(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(42)
+        self.receipts = [Receipt(**random_receipt_data(rnd)) for _ in range(2000)]
+
+    def test_batch_matches_scalar(self):
+        self.assertEqual(
+            PointsCalculator.calculate_points_batch(self.receipts),
+            [PointsCalculator.calculate_points(receipt) for receipt in self.receipts]
+        )
+
+    def test_batch_without_numpy(self):
+        with patch.object(points_calculator, 'np', None):
+            self.assertEqual(
+                PointsCalculator.calculate_points_batch(self.receipts[:10]),
+                [receipt.points for receipt in self.receipts[:10]]
+            )
+
+    def test_batch_counts_non_ascii_retailers(self):
+        rnd = random.Random(3)
+        receipts = [Receipt(**dict(random_receipt_data(rnd), retailer=retailer))
+                    for retailer in ("Café Müller", "Target", "Ŝtore 7", "Target")]
+        self.assertEqual(PointsCalculator.calculate_points_batch(receipts),
+                         [PointsCalculator.calculate_points(receipt) for receipt in receipts])
+        self.assertEqual(PointsCalculator.calculate_points_batch(receipts[1:2]),
+                         [receipts[1].points])
+
+    def test_batch_empty(self):
+        self.assertEqual(PointsCalculator.calculate_points_batch([]), [])
+
+
+class CompiledRulesTests(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(7)
+        self.receipts = [Receipt(**random_receipt_data(rnd)) for _ in range(500)]
+
+    def tearDown(self):
+        PointsCalculator.reset_rules()
+
+    def test_compiled_matches_rules(self):
+        for receipt in self.receipts:
+            interpreted = sum(info['method'](getattr(receipt, info['field']))
+                              for info in PointsCalculator.rules.values())
+            self.assertEqual(PointsCalculator.calculate_points(receipt), interpreted)
+            self.assertEqual(sum(PointsCalculator.parse_rules(receipt).values()), interpreted)
+
+    def test_memo(self):
+        compiled = CompiledRules(PointsCalculator.rules, memo_size=8)
+        for receipt in self.receipts:
+            compiled.score(receipt)
+        info = compiled.memo_info()['retailer_alnum']
+        self.assertEqual(info.misses, 5)  # distinct retailers of random_receipt_data
+        self.assertEqual(info.hits, len(self.receipts) - 5)
+        self.assertEqual(CompiledRules(PointsCalculator.rules, memo_size=0).memo_info(), {})
+
+    def test_register_rules(self):
+        receipt = self.receipts[0]
+        points = receipt.points
+        PointsCalculator.register_rules({"bonus": {'field': 'total', 'method': lambda total: 1000}})
+        self.assertEqual(PointsCalculator.calculate_points(receipt), points + 1000)
+        self.assertEqual(PointsCalculator.parse_rules(receipt)["bonus"], 1000)
+        self.assertEqual(PointsCalculator.calculate_points_batch(self.receipts[:3]),
+                         [r.points + 1000 for r in self.receipts[:3]])
+        self.assertEqual(Receipt(**random_receipt_data(random.Random(7))).points, points + 1000)
+
+        PointsCalculator.register_rules({}, replace=True)
+        self.assertEqual(PointsCalculator.calculate_points(receipt), 0)
+
+        PointsCalculator.reset_rules()
+        self.assertEqual(PointsCalculator.calculate_points(receipt), points)
+
+
+if __name__ == '__main__':
+    unittest.main()
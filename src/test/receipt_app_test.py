@@ -3,6 +3,7 @@ from unittest.mock import patch, Mock
 from flask import json
 
 from src.receipt_app import app, receipt_storage # type: ignore
+from src.bounded_receipt_storage import BoundedReceiptStorage
 from src.config import STATUS_CODE
 
 valid_receipt = {
@@ -61,13 +62,69 @@ class ReceiptProcessingTests(unittest.TestCase):
         response = self.app.post('/receipts/process', json=valid_receipt)
         self.assertEqual(response.status_code, STATUS_CODE.SUCCESS)
 
-        duplicate = self.app.post('/receipts/process', json=valid_receipt)
+        # same retailer and purchase date-time, another body: not a retry
+        duplicate = self.app.post('/receipts/process',
+                                  json=dict(valid_receipt, items=valid_receipt['items'][::-1]))
         self.assertEqual(duplicate.status_code, STATUS_CODE.INPUT_ERROR)
         self.assertEqual(
             json.loads(duplicate.data.decode('utf-8'))['message'],
             "Provided receipt is duplicate: ('Walgreens', '2022-01-02 08:13')"
         )
 
+    def test_retry_gets_the_original_id(self):
+        receipt_id = self.app.post('/receipts/process', json=valid_receipt).json['id']
+        with patch.object(receipt_storage, 'process_receipt',
+                          return_value=('keyed-id', None)) as process_receipt:
+            retry = self.app.post('/receipts/process', json=valid_receipt)
+            keyed = self.app.post('/receipts/process', json=dict(valid_receipt, retailer='Target'),
+                                  headers={'Idempotency-Key': 'retry-1'})
+        self.assertEqual((retry.status_code, retry.json), (STATUS_CODE.SUCCESS, {'id': receipt_id}))
+        self.assertEqual(keyed.json, {'id': 'keyed-id'})
+        process_receipt.assert_called_once()
+
+        # the key is answered whatever the body, before it is parsed
+        replay = self.app.post('/receipts/process', data='not json',
+                               headers={'Idempotency-Key': 'retry-1'})
+        self.assertEqual(replay.json, keyed.json)
+
+    def test_process_batch(self):
+        other_receipt = dict(valid_receipt, retailer="Target")
+        invalid_receipt = dict(valid_receipt, total="2.655")
+        batch = [valid_receipt, invalid_receipt, other_receipt, valid_receipt]
+        response = self.app.post('/receipts/process/batch', json=batch)
+        self.assertEqual(response.status_code, STATUS_CODE.SUCCESS)
+        results = json.loads(response.data)['results']
+        self.assertEqual(len(results), 4)
+
+        self.assertTrue(self.receipt_storage.is_in(results[0]['id']))
+        self.assertEqual(self.receipt_storage.get_receipt_points(results[0]['id']), 15)
+        self.assertEqual(results[1]['status'], STATUS_CODE.INPUT_ERROR)
+        self.assertIn('total', results[1]['message'])
+        self.assertTrue(self.receipt_storage.is_in(results[2]['id']))
+        self.assertEqual(results[3], {
+            'message': "Provided receipt is duplicate: ('Walgreens', '2022-01-02 08:13')",
+            'status': STATUS_CODE.INPUT_ERROR
+        })
+        self.assertEqual(len(self.receipt_storage), 2)
+
+    def test_process_batch_ndjson(self):
+        body = "\n".join([json.dumps(valid_receipt), "not json", ""])
+        response = self.app.post('/receipts/process/batch', data=body,
+                                 content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, STATUS_CODE.SUCCESS)
+        results = json.loads(response.data)['results']
+        self.assertEqual(len(results), 2)
+        self.assertIn('id', results[0])
+        self.assertEqual(results[1]['status'], STATUS_CODE.INPUT_ERROR)
+
+    def test_process_batch_not_array(self):
+        response = self.app.post('/receipts/process/batch', json=valid_receipt)
+        self.assertEqual(response.status_code, STATUS_CODE.INPUT_ERROR)
+        self.assertIn("Input Error", response.json['message'])
+
+        response = self.app.post('/receipts/process/batch', json=[])
+        self.assertEqual(response.status_code, STATUS_CODE.INPUT_ERROR)
+
     def test_process_receipt_invalid_retailer(self):
         invalid_receipt = {
             "retailer": "Target!",  # Invalid character
@@ -187,6 +244,151 @@ class ReceiptProcessingTests(unittest.TestCase):
                 self.assertEqual(view_response.status_code, STATUS_CODE.UNKNOWN_ERROR)
                 self.assertEqual(view_response.json['message'], 'An unexpected error occurred.')
 
+    def test_read_etag_and_not_modified(self):
+        receipt_id = self.app.post('/receipts/process', json=valid_receipt).json['id']
+        for path in (f'/receipts/{receipt_id}/points', f'/receipts/{receipt_id}'):
+            response = self.app.get(path)
+            self.assertEqual(response.status_code, STATUS_CODE.SUCCESS)
+            with app.app_context():
+                self.assertEqual(response.data, app.json.response(response.json).data)
+            etag = response.headers['ETag']
+
+            cached = self.app.get(path)
+            self.assertEqual((cached.data, cached.headers['ETag']), (response.data, etag))
+
+            not_modified = self.app.get(path, headers={'If-None-Match': etag})
+            self.assertEqual(not_modified.status_code, STATUS_CODE.NOT_MODIFIED)
+            self.assertEqual(not_modified.data, b'')
+            self.assertEqual(not_modified.headers['ETag'], etag)
+
+            self.assertEqual(self.app.get(path, headers={'If-None-Match': '"other"'}).status_code,
+                             STATUS_CODE.SUCCESS)
+
+    def test_cleared_receipts_are_not_served_from_cache(self):
+        receipt_id = self.app.post('/receipts/process', json=valid_receipt).json['id']
+        self.assertEqual(self.app.get(f'/receipts/{receipt_id}/points').status_code,
+                         STATUS_CODE.SUCCESS)
+        self.receipt_storage.clear()
+        self.assertEqual(self.app.get(f'/receipts/{receipt_id}/points').status_code,
+                         STATUS_CODE.NO_RECORD_FOUND)
+
+    def test_search_and_stats(self):
+        receipts = [dict(valid_receipt, purchaseTime=f"08:{minute:02d}") for minute in range(5)]
+        receipts.append(dict(valid_receipt, retailer="Target", purchaseDate="2022-01-03"))
+        ids = [result['id'] for result in self.app.post('/receipts/process/batch',
+                                                         json=receipts).json['results']]
+
+        page = self.app.get('/receipts/search?retailer=Walgreens&limit=3').json
+        self.assertEqual([receipt['id'] for receipt in page['receipts']], ids[:3])
+        self.assertEqual(page['receipts'][0]['purchaseDateTime'], '2022-01-02 08:00')
+        self.assertEqual(page['next'], ids[2])
+        page = self.app.get(f"/receipts/search?retailer=Walgreens&after={page['next']}").json
+        self.assertEqual([receipt['id'] for receipt in page['receipts']], ids[3:5])
+        self.assertIsNone(page['next'])
+        page = self.app.get('/receipts/search?start=2022-01-02T08:04&end=2022-01-04').json
+        self.assertEqual([receipt['id'] for receipt in page['receipts']], [ids[4], ids[5]])
+
+        retailers = self.app.get('/receipts/stats/retailers').json['retailers']
+        self.assertEqual(retailers, [
+            {'retailer': 'Target', 'count': 1, 'total': 2.65, 'points': 18},
+            {'retailer': 'Walgreens', 'count': 5, 'total': 13.25, 'points': 75}])
+        days = self.app.get('/receipts/stats/days?end=2022-01-03').json['days']
+        self.assertEqual(days, [{'date': '2022-01-02', 'count': 5, 'total': 13.25, 'points': 75}])
+
+    def test_search_invalid_arguments(self):
+        for query in ('start=yesterday', 'start=2022-01-01T00:00:00%2B00:00', 'end=2022-01-01Z',
+                      'limit=0', 'limit=5000', 'after=unknown'):
+            response = self.app.get(f'/receipts/search?{query}')
+            self.assertEqual(response.status_code, STATUS_CODE.INPUT_ERROR, query)
+            self.assertIn('Input Error', response.json['message'])
+
+    def test_export(self):
+        receipts = [dict(valid_receipt, purchaseTime=f"08:{minute:02d}") for minute in range(5)]
+        receipts.append(dict(valid_receipt, retailer="Target", purchaseDate="2022-01-03"))
+        ids = [result['id'] for result in self.app.post('/receipts/process/batch',
+                                                         json=receipts).json['results']]
+
+        response = self.app.get('/receipts/export')
+        self.assertEqual(response.status_code, STATUS_CODE.SUCCESS)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        rows = [json.loads(line) for line in response.data.splitlines()]
+        self.assertEqual([row['id'] for row in rows], ids)
+        self.assertEqual({key: value for key, value in rows[0].items() if key != 'cursor'},
+                         self.app.get(f'/receipts/{ids[0]}').json['receipt'])
+
+        with patch('src.receipt_export.Config.EXPORT_CHUNK', 2):
+            response = self.app.get(f"/receipts/export?cursor={rows[1]['cursor']}&limit=3")
+            self.assertEqual([json.loads(line)['id'] for line in response.data.splitlines()],
+                             ids[2:5])
+        response = self.app.get('/receipts/export?retailer=Walgreens&start=2022-01-02T08:03')
+        self.assertEqual([json.loads(line)['id'] for line in response.data.splitlines()],
+                         ids[3:5])
+
+        # the last cursor picks up receipts stored after the export
+        later_id = self.app.post('/receipts/process', json=dict(
+            valid_receipt, purchaseDate="2022-01-04")).json['id']
+        response = self.app.get(f"/receipts/export?cursor={rows[-1]['cursor']}")
+        self.assertEqual([json.loads(line)['id'] for line in response.data.splitlines()],
+                         [later_id])
+
+    def test_export_csv(self):
+        receipt_id = self.app.post('/receipts/process', json=valid_receipt).json['id']
+        response = self.app.get('/receipts/export?format=csv')
+        self.assertEqual(response.mimetype, 'text/csv')
+        self.assertEqual(response.data.decode().splitlines(), [
+            'cursor,id,retailer,purchaseDateTime,total,points,items',
+            f'1,{receipt_id},Walgreens,2022-01-02 08:13,2.65,15,'
+            '"[{""price"":1.25,""shortDescription"":""Pepsi - 12-oz""},'
+            '{""price"":1.4,""shortDescription"":""Dasani""}]"'])
+
+    def test_export_invalid_arguments(self):
+        self.app.post('/receipts/process', json=valid_receipt)
+        for query in ('format=xml', 'cursor=-1', 'cursor=abc', 'limit=x', 'end=tomorrow',
+                      'start=2022-01-01T00:00:00%2B00:00'):
+            response = self.app.get(f'/receipts/export?{query}')
+            self.assertEqual(response.status_code, STATUS_CODE.INPUT_ERROR, query)
+            self.assertIn('Input Error', response.json['message'])
+
+    def test_export_cursor_rejected_on_bounded_storage(self):
+        bounded = BoundedReceiptStorage(max_bytes=10 ** 6)
+        receipt_id, _ = bounded.process_receipt(valid_receipt)
+        with patch('src.receipt_app.receipt_storage', bounded):
+            response = self.app.get('/receipts/export')
+            self.assertEqual([json.loads(line)['id'] for line in response.data.splitlines()],
+                             [receipt_id])
+            response = self.app.get('/receipts/export?cursor=1')
+            self.assertEqual(response.status_code, STATUS_CODE.INPUT_ERROR)
+            self.assertIn('can not be resumed', response.json['message'])
+
+    def test_stats_reject_time_zones(self):
+        for route in ('/receipts/stats/retailers', '/receipts/stats/days'):
+            response = self.app.get(f'{route}?start=2022-01-01T00:00%2B02:00')
+            self.assertEqual(response.status_code, STATUS_CODE.INPUT_ERROR, route)
+
+    def test_batch_get(self):
+        receipts = [dict(valid_receipt, purchaseTime=f"08:{minute:02d}") for minute in range(3)]
+        ids = [result['id'] for result in self.app.post('/receipts/process/batch',
+                                                         json=receipts).json['results']]
+        requested = {'ids': [ids[2], 'unknown', ids[0], ids[2]]}
+
+        response = self.app.post('/receipts/points:batchGet', json=requested)
+        self.assertEqual(response.status_code, STATUS_CODE.SUCCESS)
+        self.assertEqual(response.json, {'points': [{'id': ids[2], 'points': 15},
+                                                    {'id': ids[0], 'points': 15}],
+                                         'notFound': ['unknown']})
+        response = self.app.post('/receipts:batchGet', json=requested)
+        self.assertEqual([receipt['id'] for receipt in response.json['receipts']],
+                         [ids[2], ids[0]])
+        self.assertEqual(response.json['receipts'][1],
+                         self.app.get(f'/receipts/{ids[0]}').json['receipt'])
+        self.assertEqual(response.json['notFound'], ['unknown'])
+
+    def test_batch_get_invalid_body(self):
+        for body in ([], {'ids': 'abc'}, {'ids': [1]}, {'ids': ['a'] * 1001}):
+            for route in ('/receipts/points:batchGet', '/receipts:batchGet'):
+                response = self.app.post(route, json=body)
+                self.assertEqual(response.status_code, STATUS_CODE.INPUT_ERROR, (route, body))
+
 
 if __name__ == '__main__':
     unittest.main()
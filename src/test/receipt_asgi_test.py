@@ -0,0 +1,128 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import patch
+
+from src.config import STATUS_CODE
+from src.receipt_asgi import ReceiptASGIApp
+from src.receipt_storage import ReceiptStorage
+
+valid_receipt = {
+    "retailer": "Walgreens",
+    "purchaseDate": "2022-01-02",
+    "purchaseTime": "08:13",
+    "total": "2.65",
+    "items": [
+        {"shortDescription": "Pepsi - 12-oz", "price": "1.25"},
+        {"shortDescription": "Dasani", "price": "1.40"}
+    ]
+}
+
+
+def call(app, method, path, body=b'', content_type='application/json', headers=()):
+    """Runs one request through the ASGI app, returns (status, parsed JSON body or None)."""
+    scope = {'type': 'http', 'method': method, 'path': path,
+             'headers': [(b'content-type', content_type.encode()), *headers]}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    body = messages[1]['body']
+    return messages[0]['status'], json.loads(body) if body else None
+
+
+class ReceiptASGITests(unittest.TestCase):
+    def setUp(self):
+        self.receipt_storage = ReceiptStorage()
+        self.app = ReceiptASGIApp(self.receipt_storage)
+
+    def post(self, data, **kwargs):
+        return call(self.app, 'POST', '/receipts/process', json.dumps(data).encode(), **kwargs)
+
+    def test_process_and_read(self):
+        status, data = self.post(valid_receipt)
+        self.assertEqual(status, STATUS_CODE.SUCCESS)
+        receipt_id = data['id']
+
+        self.assertEqual(call(self.app, 'GET', f'/receipts/{receipt_id}/points'),
+                         (STATUS_CODE.SUCCESS, {'points': 15}))
+        status, data = call(self.app, 'GET', f'/receipts/{receipt_id}')
+        self.assertEqual(status, STATUS_CODE.SUCCESS)
+        self.assertEqual(data['receipt']['purchaseDateTime'], '2022-01-02 08:13')
+        self.assertEqual(data['receipt']['points'], 15)
+
+    def test_head_sends_headers_only(self):
+        _, data = self.post(valid_receipt)
+        for path in (f'/receipts/{data["id"]}/points', f'/receipts/{data["id"]}', '/metrics'):
+            status, body = call(self.app, 'HEAD', path)
+            self.assertEqual((status, body), (STATUS_CODE.SUCCESS, None), path)
+
+    def test_read_not_modified(self):
+        _, data = self.post(valid_receipt)
+        path = f'/receipts/{data["id"]}/points'
+        self.assertEqual(call(self.app, 'GET', path), (STATUS_CODE.SUCCESS, {'points': 15}))
+        etag = self.app.response_cache.get(('points', data['id'])).etag
+        self.assertEqual(call(self.app, 'GET', path, headers=[(b'if-none-match', etag.encode())]),
+                         (STATUS_CODE.NOT_MODIFIED, None))
+
+    def test_process_duplicate(self):
+        self.post(valid_receipt)
+        self.assertEqual(self.post(dict(valid_receipt, items=valid_receipt['items'][::-1])),
+                         (STATUS_CODE.INPUT_ERROR, {
+            'message': "Provided receipt is duplicate: ('Walgreens', '2022-01-02 08:13')"}))
+
+    def test_retry_gets_the_original_id(self):
+        _, data = self.post(valid_receipt)
+        self.assertEqual(self.post(valid_receipt), (STATUS_CODE.SUCCESS, data))
+        headers = [(b'idempotency-key', b'retry-1')]
+        _, keyed = self.post(dict(valid_receipt, retailer='Target'), headers=headers)
+        self.assertEqual(self.post({}, headers=headers), (STATUS_CODE.SUCCESS, keyed))
+        self.assertEqual(len(self.receipt_storage), 2)
+
+    def test_process_invalid_input(self):
+        status, data = self.post(dict(valid_receipt, retailer="Target!"))
+        self.assertEqual(status, STATUS_CODE.INPUT_ERROR)
+        self.assertTrue(data['message'].startswith('Input Error 400 Bad Request: '))
+        self.assertIn('Target!', data['message'])
+
+        status, data = call(self.app, 'POST', '/receipts/process', b'invalid_json')
+        self.assertEqual(status, STATUS_CODE.INPUT_ERROR)
+        self.assertIn('Input Error', data['message'])
+
+        status, _ = self.post(valid_receipt, content_type='text/plain')
+        self.assertEqual(status, 415)
+
+    def test_not_found(self):
+        self.assertEqual(call(self.app, 'GET', '/receipts/invalid_id/points'),
+                         (STATUS_CODE.NO_RECORD_FOUND,
+                          {'message': 'No receipt found with id=invalid_id'}))
+        self.assertEqual(call(self.app, 'GET', '/receipts/invalid_id')[0],
+                         STATUS_CODE.NO_RECORD_FOUND)
+        self.assertEqual(call(self.app, 'GET', '/unknown')[0], STATUS_CODE.NO_RECORD_FOUND)
+
+    def test_server_error(self):
+        with patch.object(self.receipt_storage, 'process_receipt',
+                          side_effect=Exception("Mocked failure")):
+            self.assertEqual(self.post(valid_receipt), (STATUS_CODE.UNKNOWN_ERROR, {
+                'message': 'An error occurred during receipt processing - Mocked failure'}))
+        with patch.object(self.receipt_storage, 'get_receipt_points',
+                          side_effect=Exception("Mocked failure")):
+            self.assertEqual(call(self.app, 'GET', '/receipts/some_id/points'),
+                             (STATUS_CODE.UNKNOWN_ERROR,
+                              {'message': 'An unexpected error occurred.'}))
+
+    def test_blocking_storage_runs_in_executor(self):
+        self.receipt_storage.blocking = True
+        status, data = self.post(valid_receipt)
+        self.assertEqual(status, STATUS_CODE.SUCCESS)
+        self.assertTrue(self.receipt_storage.is_in(data['id']))
+        self.app.storage.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import time
+import unittest
+import uuid
+from unittest.mock import patch
+
+from src.model.receipt import Receipt
+from src.model.receipt_ids import (UUID4IdGenerator, UUID7IdGenerator, COUNTER_BITS,
+                                   create_id_generator, format_receipt_id, parse_receipt_id)
+from src.test.receipt_storage_test import valid_receipt
+
+MILLIS = 1_700_000_000_000
+
+
+class ReceiptIdTests(unittest.TestCase):
+    def test_format_and_parse(self):
+        value = uuid.uuid4()
+        self.assertEqual(format_receipt_id(value.int), str(value))
+        self.assertEqual(parse_receipt_id(str(value)), value.int)
+        self.assertEqual(parse_receipt_id(value.hex), value.int)
+        self.assertEqual(parse_receipt_id('{' + str(value).upper() + '}'), value.int)
+        for invalid in ('invalid_id', 'g' * 8 + str(value)[8:], '', None, 5):
+            self.assertIsNone(parse_receipt_id(invalid), invalid)
+
+    def test_uuid7_is_monotonic_across_batches(self):
+        generator = UUID7IdGenerator(batch_size=8)
+        ids = [generator.new_id() for _ in range(20)] + generator.new_ids(30)
+        ids.append(generator.new_id())
+        self.assertEqual(ids, sorted(set(ids)))
+        value = uuid.UUID(int=ids[0])
+        self.assertEqual((value.version, value.variant), (7, uuid.RFC_4122))
+        self.assertAlmostEqual(ids[0] >> 80, time.time_ns() // 1_000_000, delta=60_000)
+
+    def test_uuid7_when_the_clock_goes_back(self):
+        now = [MILLIS * 1_000_000]
+        generator = UUID7IdGenerator(batch_size=4, clock=lambda: now[0])
+        first = generator.new_ids(4)
+        now[0] -= 5_000_000_000
+        second = generator.new_ids(4)
+        self.assertEqual(first + second, sorted(first + second))
+        self.assertEqual({value >> 80 for value in first + second}, {MILLIS})
+
+    def test_uuid7_ids_after_a_pause_carry_the_new_time(self):
+        now = [MILLIS * 1_000_000]
+        generator = UUID7IdGenerator(batch_size=8, clock=lambda: now[0], max_age_ms=2)
+        first = [generator.new_id(), generator.new_id()]
+        now[0] += 2_000_000
+        first.append(generator.new_id())
+        now[0] += 60_000_000_000
+        later = [generator.new_id(), generator.new_id()] + generator.new_ids(10)
+        self.assertEqual({value >> 80 for value in first}, {MILLIS})
+        self.assertEqual({value >> 80 for value in later}, {MILLIS + 60_002})
+        self.assertEqual(first + later, sorted(first + later))
+
+    def test_uuid7_counter_overflow_moves_to_next_millisecond(self):
+        generator = UUID7IdGenerator(clock=lambda: MILLIS * 1_000_000)
+        # counter steps of 1
+        with patch.object(generator, '_seed', return_value=(1 << COUNTER_BITS) - 3), \
+                patch('src.model.receipt_ids.os.urandom', lambda size: bytes(size)):
+            ids = generator.new_ids(3)
+        self.assertEqual([value >> 80 for value in ids], [MILLIS, MILLIS, MILLIS + 1])
+        self.assertEqual(ids, sorted(ids))
+
+    def test_uuid4(self):
+        generator = create_id_generator('uuid4', batch_size=4)
+        self.assertIsInstance(generator, UUID4IdGenerator)
+        ids = [generator.new_id() for _ in range(10)] + generator.new_ids(3)
+        self.assertEqual(len(set(ids)), 13)
+        for value in ids:
+            self.assertEqual(uuid.UUID(int=value).version, 4)
+        with self.assertRaises(ValueError):
+            create_id_generator('sequence')
+
+    def test_receipt_id_rendered_from_int(self):
+        receipt = Receipt.from_input(valid_receipt)
+        self.assertEqual(parse_receipt_id(receipt.receipt_id), receipt.id_int)
+        self.assertEqual(Receipt.from_input(valid_receipt, id_int=receipt.id_int).receipt_id,
+                         receipt.receipt_id)
+        restored = Receipt.from_record(receipt.to_dict())
+        self.assertEqual((restored.receipt_id, restored.id_int),
+                         (receipt.receipt_id, receipt.id_int))
+
+
+if __name__ == "__main__":
+    unittest.main()
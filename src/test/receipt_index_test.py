@@ -0,0 +1,130 @@
+import datetime
+import os
+import random
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.config import Config
+from src.storage_factory import create_receipt_storage
+from src.receipt_index import ReceiptIndex
+from src.receipt_storage import ReceiptStorage
+from src.compact_receipt_storage import CompactReceiptStorage
+from src.sqlite_receipt_storage import SqliteReceiptStorage
+from src.test.receipt_storage_test import valid_receipt
+
+RETAILERS = ["Walgreens", "Target", "M&M Corner Market"]
+DAY = datetime.datetime(2022, 1, 1)
+
+
+def random_receipts(count, seed=18):
+    """valid_receipt variants over a few retailers and days, in random purchase order."""
+    rnd = random.Random(seed)
+    minutes = rnd.sample(range(10 * 24 * 60), count)
+    receipts = []
+    for minute in minutes:
+        purchase = DAY + datetime.timedelta(minutes=minute)
+        receipts.append(dict(valid_receipt, retailer=rnd.choice(RETAILERS),
+                             purchaseDate=purchase.strftime('%Y-%m-%d'),
+                             purchaseTime=purchase.strftime('%H:%M'),
+                             total=f"{rnd.randint(0, 50)}.{rnd.choice([0, 25, 99]):02d}"))
+    return receipts
+
+
+class ReceiptIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.indexed = ReceiptStorage()
+        self.indexed.enable_index()
+        self.inputs = random_receipts(300)
+        self.indexed.process_receipts(self.inputs[:200])
+        for input_data in self.inputs[200:]:
+            self.indexed.process_receipt(input_data)
+        # the same receipts without an index: every query is a full scan
+        self.scanned = ReceiptStorage()
+        self.scanned.restore(self.indexed.iter_receipts())
+
+    def assert_same_queries(self, storage):
+        """storage answers every query like the full scan of self.scanned."""
+        ranges = [(None, None), (DAY + datetime.timedelta(days=2, hours=5), None),
+                  (None, DAY + datetime.timedelta(days=3)),
+                  (DAY + datetime.timedelta(days=1), DAY + datetime.timedelta(days=1, minutes=30))]
+        for retailer in [None, "Target", "Unknown"]:
+            for start, end in ranges:
+                for limit in (1, 7, 1000):
+                    self.assertEqual(storage.query_receipt_ids(retailer, start, end, limit=limit),
+                                     self.scanned.query_receipt_ids(retailer, start, end,
+                                                                    limit=limit))
+                after = self.scanned.query_receipt_ids(retailer, start, end, limit=7)[-1:]
+                if after:
+                    self.assertEqual(
+                        storage.query_receipt_ids(retailer, start, end, after[0], limit=7),
+                        self.scanned.query_receipt_ids(retailer, start, end, after[0], limit=7))
+                self.assertEqual(storage.day_totals(retailer, start, end),
+                                 self.scanned.day_totals(retailer, start, end))
+            self.assertEqual(storage.retailer_totals(start, end),
+                             self.scanned.retailer_totals(start, end))
+
+    def test_queries_match_a_full_scan(self):
+        self.assert_same_queries(self.indexed)
+
+    def test_sqlite_queries_match_a_full_scan(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sqlite = SqliteReceiptStorage(os.path.join(directory, 'receipts.db'))
+            sqlite.restore(self.indexed.iter_receipts())
+            self.assert_same_queries(sqlite)
+            sqlite.close()
+
+    def test_pages_follow_purchase_order(self):
+        receipt_ids, after = [], None
+        while True:
+            page = self.indexed.query_receipt_ids("Walgreens", after=after, limit=16)
+            receipt_ids.extend(page)
+            if len(page) < 16:
+                break
+            after = page[-1]
+        purchases = [self.indexed.get_receipt(receipt_id)['purchaseDateTime']
+                     for receipt_id in receipt_ids]
+        self.assertEqual(purchases, sorted(purchases))
+        self.assertEqual(len(receipt_ids), sum(r['retailer'] == "Walgreens" for r in self.inputs))
+
+    def test_running_totals(self):
+        count, total, points = self.indexed.retailer_totals()["Target"]
+        records = [r for r in self.indexed.iter_receipts() if r['retailer'] == "Target"]
+        self.assertEqual((count, total, points), (len(records), sum(r['total'] for r in records),
+                                                  sum(r['points'] for r in records)))
+        self.assertEqual(sum(day[1] for day in self.indexed.day_totals()), 300)
+
+    def test_clear_and_recovered_storages(self):
+        compact = CompactReceiptStorage()
+        compact.restore_table(self.indexed.snapshot_table())
+        compact.enable_index()
+        self.assertEqual(compact.query_receipt_ids(limit=1000),
+                         self.indexed.query_receipt_ids(limit=1000))
+        self.indexed.clear()
+        self.assertEqual(self.indexed.query_receipt_ids(), [])
+        self.assertEqual(self.indexed.retailer_totals(), {})
+        self.assertEqual(len(self.indexed.index), 0)
+
+    def test_factory_indexes_unbounded_storages_only(self):
+        with patch.object(Config, 'SECONDARY_INDEXES', True):
+            self.assertIsNotNone(create_receipt_storage('memory').index)
+            # an index of every receipt ever stored would outgrow the memory budget
+            bounded = create_receipt_storage('bounded')
+        self.assertIsNone(bounded.index)
+        self.assertFalse(SqliteReceiptStorage.indexable)
+        bounded.restore(self.indexed.iter_receipts())
+        self.assertEqual(bounded.query_receipt_ids("Target", limit=1000),
+                         self.indexed.query_receipt_ids("Target", limit=1000))
+
+    def test_out_of_order_entries_are_sorted_on_read(self):
+        index = ReceiptIndex()
+        for minute in (30, 10, 20):
+            index.add(f"id-{minute}", "Target", DAY + datetime.timedelta(minutes=minute), 100, 5)
+        self.assertEqual(index.receipt_ids(), ["id-10", "id-20", "id-30"])
+        index.add("id-0", "Target", DAY, 100, 5)
+        self.assertEqual(index.receipt_ids(retailer="Target", limit=2), ["id-0", "id-10"])
+        self.assertEqual(index.day_totals(), [(DAY.date(), 4, 400, 20)])
+
+
+if __name__ == "__main__":
+    unittest.main()
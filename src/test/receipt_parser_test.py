@@ -0,0 +1,92 @@
+import copy
+import random
+import unittest
+
+from jsonschema.validators import validator_for
+
+from src.exceptions import ReceiptValidationError
+from src.model.receipt import Receipt
+from src.model.receipt_parser import parse_receipt_input
+from src.validation_schema import request_schema
+from src.test.points_calculator_test import random_receipt_data
+
+MUTATIONS = [
+    None, 1, 1.5, True, [], {}, "", " ", "1.5", "01.50", "1.500", ".50", "1,50", "1.50\n",
+    "١.٥٠", "2022-1-01", "2022-01-01 ", "2022-13-45", "12:3", "1230", "99:99", "٠٩:٣٠",
+    "Target!", "M&M", "a\tb", "\n", "x" * 3, "2022-01-01", "12:30", "10.00",
+]
+# the reference the parser is checked against
+request_validator = validator_for(request_schema)(request_schema)
+
+
+def mutate(data, rnd):
+    data = copy.deepcopy(data)
+    choice = rnd.random()
+    if choice < 0.15:
+        del data[rnd.choice(list(data))]
+    elif choice < 0.3:
+        data["items"] = rnd.choice([[], {}, "items", [None], [{"price": "1.00"}], [[]]])
+    elif choice < 0.6:
+        item = rnd.choice(data["items"])
+        item[rnd.choice(["shortDescription", "price"])] = rnd.choice(MUTATIONS)
+    else:
+        data[rnd.choice(list(data))] = rnd.choice(MUTATIONS)
+    return data
+
+
+class ReceiptParserTests(unittest.TestCase):
+    def test_accepts_what_the_schema_accepts(self):
+        rnd = random.Random(7)
+        for _ in range(5000):
+            data = random_receipt_data(rnd)
+            if rnd.random() < 0.8:
+                data = mutate(data, rnd)
+            schema_valid = request_validator.is_valid(data)
+            try:
+                parse_receipt_input(data)
+                parser_valid = True
+            except ReceiptValidationError:
+                parser_valid = False
+            except ValueError:
+                # schema-valid out of range date or time
+                parser_valid = True
+            self.assertEqual(parser_valid, schema_valid, data)
+
+    def test_matches_previous_parsing(self):
+        rnd = random.Random(11)
+        for _ in range(2000):
+            data = random_receipt_data(rnd)
+            parsed = Receipt.from_input(data)
+            expected = Receipt(**data)
+            for name in ("retailer", "purchase_date", "purchase_time", "purchase_date_time",
+                         "total", "items", "points"):
+                self.assertEqual(getattr(parsed, name), getattr(expected, name), data)
+
+    def test_error_messages(self):
+        data = random_receipt_data(random.Random(1))
+        del data["retailer"]
+        with self.assertRaisesRegex(ReceiptValidationError, "'retailer' is a required property"):
+            parse_receipt_input(data)
+
+        data = random_receipt_data(random.Random(1))
+        data["total"] = "25.755"
+        with self.assertRaisesRegex(ReceiptValidationError,
+                                    r"'25.755' does not match .* on instance\['total'\]"):
+            parse_receipt_input(data)
+
+        data["total"] = "1.00"
+        data["items"][1]["price"] = 3
+        with self.assertRaisesRegex(ReceiptValidationError,
+                                    r"3 is not of type 'string' on instance\['items'\]\[1\]"):
+            parse_receipt_input(data)
+
+    def test_out_of_range_date_is_not_an_input_error(self):
+        data = random_receipt_data(random.Random(1))
+        data["purchaseDate"] = "2022-02-30"
+        with self.assertRaises(ValueError) as context:
+            parse_receipt_input(data)
+        self.assertNotIsInstance(context.exception, ReceiptValidationError)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,23 @@
 import unittest
 import datetime
+import os
+import multiprocessing
+import random
+import sys
+import tempfile
+import threading
 
 from src.config import DATE_FORMAT, DT_FORMAT
 from src.model.points_calculator import PointsCalculator
 from src.receipt_storage import ReceiptStorage, Receipt
+from src.compact_receipt_storage import CompactReceiptStorage
+from src.concurrent_receipt_storage import ConcurrentReceiptStorage
+from src.sqlite_receipt_storage import SqliteReceiptStorage
+from src.bounded_receipt_storage import BoundedReceiptStorage, record_bytes
+from src.shared_receipt_storage import SharedReceiptStorage
+from src.persistence import ReceiptLog
+from src import metrics
+from src.exceptions import ReceiptIsDuplicate, ReceiptNotFound, ReceiptStorageFull
 
 valid_receipt = {
     "retailer": "Walgreens",
@@ -29,7 +43,7 @@ class ReceiptStorageTests(unittest.TestCase):
         self.assertEqual(len(self.receipt_storage), 1)
 
         self.assertEqual(result["retailer"], valid_receipt["retailer"])
-        self.assertEqual(result["total"], float(valid_receipt["total"]))
+        self.assertEqual(result["total"], 265)
 
         date_time_string = "{} {}".format(  # pylint: disable=consider-using-f-string
             valid_receipt["purchaseDate"],
@@ -48,7 +62,7 @@ class ReceiptStorageTests(unittest.TestCase):
         )
         self.assertEqual(
             [r["price"] for r in result["items"]],
-            [float(p["price"]) for p in valid_receipt["items"]]
+            [125, 140]
         )
         self.assertEqual(result["points"], 15, "Points do not match")
 
@@ -66,6 +80,20 @@ class ReceiptStorageTests(unittest.TestCase):
             "Provided receipt is duplicate: ('Walgreens', '2022-01-02 08:13')"
         )
 
+    def test_process_receipts_batch(self):
+        self.receipt_storage.process_receipt(valid_receipt)
+        other_receipt = dict(valid_receipt, purchaseTime="09:13")
+        results = self.receipt_storage.process_receipts(
+            [other_receipt, valid_receipt, other_receipt, {"retailer": "Target"}]
+        )
+        self.assertEqual(len(self.receipt_storage), 2)
+        self.assertEqual(self.receipt_storage.get_receipt_points(results[0]), 15)
+        self.assertEqual(str(results[1]),
+                         "Provided receipt is duplicate: ('Walgreens', '2022-01-02 08:13')")
+        self.assertEqual(str(results[2]),
+                         "Provided receipt is duplicate: ('Walgreens', '2022-01-02 09:13')")
+        self.assertIsInstance(results[3], Exception)
+
     def test_calculate_receipt_points(self):
         recipt_data = {
             "retailer": "Target",
@@ -134,6 +162,32 @@ class ReceiptStorageTests(unittest.TestCase):
             self.receipt_storage.get_receipt_points(receipt_id)
         self.assertEqual(str(context.exception), "No receipt found with id=invalid_id")
 
+    def test_get_many(self):
+        receipt_ids = [self.receipt_storage.process_receipt(input_data)[0]
+                       for input_data in minute_receipts(3)]
+        requested = ["invalid_id", receipt_ids[2], receipt_ids[0], receipt_ids[2]]
+        records = self.receipt_storage.get_many(requested)
+        self.assertEqual(list(records), [receipt_ids[2], receipt_ids[0]])
+        self.assertEqual(records[receipt_ids[0]], self.receipt_storage.get_receipt(receipt_ids[0]))
+        self.assertEqual(self.receipt_storage.get_many_points(requested),
+                         {receipt_ids[2]: 15, receipt_ids[0]: 15})
+        self.assertEqual(self.receipt_storage.get_many([]), {})
+
+    def test_export_records(self):
+        receipt_ids = [self.receipt_storage.process_receipt(input_data)[0]
+                       for input_data in minute_receipts(5)]
+        rows = list(self.receipt_storage.export_records())
+        self.assertEqual(sorted(record["id"] for _, record in rows), sorted(receipt_ids))
+        # a row's position resumes the export after it
+        for index, (position, _) in enumerate(rows):
+            self.assertEqual(list(self.receipt_storage.export_records(position)), rows[index + 1:])
+
+        first, last = (datetime.datetime(2022, 1, 2, 0, minute) for minute in (1, 3))
+        filtered = self.receipt_storage.export_records(start=first, end=last, retailer="Walgreens")
+        self.assertEqual(sorted(record["purchaseDateTime"].minute for _, record in filtered),
+                         [1, 2])
+        self.assertEqual(list(self.receipt_storage.export_records(retailer="Target")), [])
+
     def test_receipt_with_future_date(self):
         future_date = (datetime.datetime.now() + datetime.timedelta(days=1)).strftime(DATE_FORMAT)
         purchase_time = "12:30"
@@ -153,5 +207,344 @@ class ReceiptStorageTests(unittest.TestCase):
             Receipt(**receipt_data)
         self.assertEqual(str(context.exception), "Purchase date cannot be in the future")
 
+
+class ThreadedInsertTests:  # pylint: disable=no-member
+    """
+    Storages written by several threads: each receipt is stored once, the rest are duplicates.
+    Mixed into the TestCase of a thread-safe storage, which provides the assertions.
+    """
+    def test_concurrent_inserts(self):
+        receipts = [dict(valid_receipt, purchaseTime=f"{hour:02d}:{minute:02d}")
+                    for hour in range(24) for minute in range(0, 60, 6)]
+        thread_count = 16
+        stored_ids = [[] for _ in range(thread_count)]
+        duplicates = [0] * thread_count
+        start = threading.Barrier(thread_count)
+
+        def worker(number):
+            rnd = random.Random(number)
+            own_receipts = receipts[:]
+            rnd.shuffle(own_receipts)
+            start.wait()
+            for position, input_data in enumerate(own_receipts):
+                if position % 2:
+                    outcomes = self.receipt_storage.process_receipts([input_data])
+                else:
+                    try:
+                        outcomes = [self.receipt_storage.process_receipt(input_data)[0]]
+                    except ReceiptIsDuplicate as e:
+                        outcomes = [e]
+                for outcome in outcomes:
+                    if isinstance(outcome, ReceiptIsDuplicate):
+                        duplicates[number] += 1
+                    else:
+                        stored_ids[number].append(outcome)
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=worker, args=(n,)) for n in range(thread_count)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+        all_ids = [receipt_id for ids in stored_ids for receipt_id in ids]
+        self.assertEqual(len(all_ids), len(receipts))
+        self.assertEqual(sum(duplicates), len(receipts) * (thread_count - 1))
+        self.assertEqual(len(self.receipt_storage), len(receipts))
+        stored = {self.receipt_storage.get_receipt_dict(receipt_id)['purchaseDateTime']
+                  for receipt_id in all_ids}
+        self.assertEqual(len(stored), len(receipts))
+
+    def test_concurrent_distinct_inserts(self):
+        thread_count, per_thread = 8, 1000
+        start = threading.Barrier(thread_count)
+        errors = []
+
+        def worker(number):
+            own_receipts = [dict(input_data, retailer=f"Retailer {number}")
+                            for input_data in minute_receipts(per_thread)]
+            start.wait()
+            try:
+                for input_data in own_receipts:
+                    receipt_id, record = self.receipt_storage.process_receipt(input_data)
+                    self.assertEqual(self.receipt_storage.get_receipt(receipt_id)["total"],
+                                     record["total"])
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                errors.append(e)
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=worker, args=(n,)) for n in range(thread_count)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.receipt_storage), thread_count * per_thread)
+        self.assertEqual(len(list(self.receipt_storage.iter_receipts())), thread_count * per_thread)
+
+
+class CompactReceiptStorageTests(ThreadedInsertTests, ReceiptStorageTests):
+    def setUp(self):
+        self.receipt_storage = CompactReceiptStorage()
+
+    def test_get_receipt_dict(self):
+        receipt_id, _ = self.receipt_storage.process_receipt(valid_receipt)
+        self.assertEqual(self.receipt_storage.get_receipt_dict(receipt_id), {
+            "id": receipt_id,
+            "retailer": "Walgreens",
+            "purchaseDateTime": datetime.datetime(2022, 1, 2, 8, 13),
+            "total": 2.65,
+            "items": [
+                {"shortDescription": "Pepsi - 12-oz", "price": 1.25},
+                {"shortDescription": "Dasani", "price": 1.40},
+            ],
+            "points": 15,
+        })
+
+    def test_clear(self):
+        receipt_id, _ = self.receipt_storage.process_receipt(valid_receipt)
+        self.receipt_storage.clear()
+        self.assertEqual(len(self.receipt_storage), 0)
+        self.assertFalse(self.receipt_storage.is_in(receipt_id))
+        self.receipt_storage.process_receipt(valid_receipt)
+        self.assertEqual(len(self.receipt_storage), 1)
+
+
+class ConcurrentReceiptStorageTests(ThreadedInsertTests, ReceiptStorageTests):
+    def setUp(self):
+        self.receipt_storage = ConcurrentReceiptStorage(shard_count=8)
+
+
+class SqliteReceiptStorageTests(ReceiptStorageTests):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.receipt_storage = SqliteReceiptStorage(os.path.join(self.directory.name,
+                                                                 'receipts.db'))
+
+    def tearDown(self):
+        super().tearDown()
+        self.receipt_storage.close()
+        self.directory.cleanup()
+
+    def test_iter_receipts(self):
+        results = self.receipt_storage.process_receipts(
+            [dict(valid_receipt, purchaseTime=f"10:{minute:02d}") for minute in range(30)])
+        records = list(self.receipt_storage.iter_receipts())
+        self.assertEqual([record["id"] for record in records], results)
+        self.assertEqual(records[3], self.receipt_storage.get_receipt(results[3]))
+
+    def test_threads_share_database(self):
+        receipt_id, _ = self.receipt_storage.process_receipt(valid_receipt)
+        outcomes = []
+
+        def worker():
+            outcomes.append(self.receipt_storage.get_receipt_points(receipt_id))
+            try:
+                self.receipt_storage.process_receipt(valid_receipt)
+            except ReceiptIsDuplicate as e:
+                outcomes.append(e)
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        self.assertEqual(outcomes[0], 15)
+        self.assertIsInstance(outcomes[1], ReceiptIsDuplicate)
+
+
+def minute_receipts(count):
+    return [dict(valid_receipt, purchaseTime=f"{minute // 60:02d}:{minute % 60:02d}")
+            for minute in range(count)]
+
+
+class BoundedReceiptStorageTests(ReceiptStorageTests):
+    # room for about 3 receipts like valid_receipt
+    BUDGET = 3 * 1500
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.spill_path = os.path.join(self.directory.name, 'spill.db')
+        self.receipt_storage = BoundedReceiptStorage(self.BUDGET, spill_path=self.spill_path)
+
+    def tearDown(self):
+        super().tearDown()
+        if self.receipt_storage.spill is not None:
+            self.receipt_storage.spill.close()
+        self.directory.cleanup()
+
+    def test_blocking_with_a_spill_database(self):
+        # async callers run the spill's SQLite I/O in their thread pool
+        self.assertTrue(self.receipt_storage.blocking)
+        self.assertFalse(BoundedReceiptStorage(self.BUDGET).blocking)
+
+    def test_evicted_receipts_fault_back_in(self):
+        inputs = minute_receipts(20)
+        receipt_ids = self.receipt_storage.process_receipts(inputs)
+        storage = self.receipt_storage
+        self.assertGreater(storage.evictions, 0)
+        self.assertLessEqual(storage.approximate_bytes(), self.BUDGET)
+        self.assertEqual(len(storage), 20)
+
+        for receipt_id in receipt_ids:
+            self.assertEqual(storage.get_receipt_points(receipt_id), 15)
+            self.assertEqual(storage.get_receipt_dict(receipt_id)['total'], 2.65)
+        self.assertGreater(storage.faults, 0)
+        self.assertEqual(storage.misses, storage.faults)
+        self.assertEqual(len(storage), 20)
+        self.assertEqual(sorted(record['id'] for record in storage.iter_receipts()),
+                         sorted(receipt_ids))
+        self.assertLessEqual(storage.approximate_bytes(), self.BUDGET)
+
+        # evicted or resident, every receipt is still a duplicate
+        for outcome in storage.process_receipts(inputs):
+            self.assertIsInstance(outcome, ReceiptIsDuplicate)
+
+    def test_dropped_receipts_stay_duplicates(self):
+        self.receipt_storage = BoundedReceiptStorage(self.BUDGET)
+        inputs = minute_receipts(20)
+        receipt_ids = self.receipt_storage.process_receipts(inputs)
+        with self.assertRaises(ReceiptNotFound):
+            self.receipt_storage.get_receipt(receipt_ids[0])
+        self.assertEqual(self.receipt_storage.get_receipt_points(receipt_ids[-1]), 15)
+        with self.assertRaises(ReceiptIsDuplicate):
+            self.receipt_storage.process_receipt(inputs[0])
+        self.assertGreater(len(self.receipt_storage.evicted_identifiers), 0)
+
+    def test_eviction_policies(self):
+        inputs = minute_receipts(3)
+        # lru keeps the receipt just read, age evicts the earliest stored regardless
+        for policy, first_resident in (('lru', True), ('age', False)):
+            storage = BoundedReceiptStorage(self.BUDGET, policy=policy)
+            first_id, second_id, _ = storage.process_receipts(inputs)
+            storage.get_receipt(first_id)
+            fourth_id, = storage.process_receipts(minute_receipts(4)[3:])
+            self.assertEqual(storage.is_in(first_id), first_resident, policy)
+            self.assertFalse(storage.is_in(second_id), policy)
+            self.assertTrue(storage.is_in(fourth_id), policy)
+
+    def test_ttl_evicts_old_purchases(self):
+        storage = BoundedReceiptStorage(self.BUDGET * 10, policy='ttl', ttl_days=30,
+                                        spill_path=self.spill_path)
+        recent = (datetime.date.today() - datetime.timedelta(days=1)).strftime(DATE_FORMAT)
+        old_id, recent_id, _ = storage.process_receipts([
+            valid_receipt, dict(valid_receipt, purchaseDate=recent),
+            dict(valid_receipt, purchaseDate=recent, purchaseTime="00:01")])
+        self.assertNotIn(old_id, storage.receipt_storage)
+        self.assertIn(recent_id, storage.receipt_storage)
+        self.assertEqual(storage.get_receipt_points(old_id), 15)
+        storage.spill.close()
+
+    def test_record_bytes_estimate(self):
+        receipt_id, record = self.receipt_storage.process_receipt(valid_receipt)
+        measured = metrics.deep_sizeof(record) + sys.getsizeof(receipt_id)
+        self.assertAlmostEqual(record_bytes(record) / measured, 1.3, delta=0.3)
+
+    def test_counters_exposed(self):
+        metrics.register_storage(self.receipt_storage)
+        self.addCleanup(lambda: [metrics.REGISTRY.metrics.pop(f'receipt_storage_{name}_total')
+                                 for name in BoundedReceiptStorage.COUNTERS])
+        receipt_id, _ = self.receipt_storage.process_receipt(valid_receipt)
+        hits = self.receipt_storage.hits
+        self.receipt_storage.get_receipt_points(receipt_id)
+        text = metrics.REGISTRY.render()
+        self.assertIn('# TYPE receipt_storage_hits_total counter', text)
+        self.assertIn(f'receipt_storage_hits_total {hits + 1}', text)
+        self.assertIn('receipt_storage_evictions_total 0', text)
+
+
+def shared_store_worker(path, inputs, seed, results):
+    """Forked worker: stores inputs in its own order, half one by one and half as batches."""
+    storage = SharedReceiptStorage(path)
+    inputs = list(inputs)
+    random.Random(seed).shuffle(inputs)
+    stored = []
+    for input_data in inputs[:len(inputs) // 2]:
+        try:
+            stored.append(storage.process_receipt(input_data)[0])
+        except ReceiptIsDuplicate:
+            pass
+    for start in range(len(inputs) // 2, len(inputs), 10):
+        stored.extend(outcome for outcome in storage.process_receipts(inputs[start:start + 10])
+                      if isinstance(outcome, str))
+    results.put(stored)
+
+
+class SharedReceiptStorageTests(ReceiptStorageTests):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.path = os.path.join(self.directory.name, 'receipts.shm')
+        self.receipt_storage = SharedReceiptStorage(self.path, capacity=1000)
+
+    def tearDown(self):
+        super().tearDown()
+        self.receipt_storage.close()
+        self.directory.cleanup()
+
+    def test_processes_insert_each_identifier_once(self):
+        inputs = minute_receipts(300)
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        workers = [context.Process(target=shared_store_worker,
+                                   args=(self.path, inputs, seed, results))
+                   for seed in range(4)]
+        for worker in workers:
+            worker.start()
+        stored = [receipt_id for _ in workers for receipt_id in results.get(timeout=60)]
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+
+        # one winner per identifier across the processes, every id readable here
+        self.assertEqual(len(stored), len(inputs))
+        self.assertEqual(len(self.receipt_storage), len(inputs))
+        records = list(self.receipt_storage.iter_receipts())
+        self.assertEqual(sorted(record['id'] for record in records), sorted(stored))
+        self.assertEqual(len({record['purchaseDateTime'] for record in records}), len(inputs))
+        for receipt_id in stored:
+            self.assertEqual(self.receipt_storage.get_receipt_points(receipt_id), 15)
+        for outcome in self.receipt_storage.process_receipts(inputs):
+            self.assertIsInstance(outcome, ReceiptIsDuplicate)
+
+    def test_attached_storage_shares_receipts(self):
+        receipt_id, _ = self.receipt_storage.process_receipt(valid_receipt)
+        # an attaching process gets the file's layout, whatever capacity it asks for
+        attached = SharedReceiptStorage(self.path, capacity=10)
+        self.addCleanup(attached.close)
+        self.assertEqual(attached.capacity, self.receipt_storage.capacity)
+        self.assertEqual(attached.get_receipt_dict(receipt_id),
+                         self.receipt_storage.get_receipt_dict(receipt_id))
+        with self.assertRaises(ReceiptIsDuplicate):
+            attached.process_receipt(valid_receipt)
+        attached.clear()
+        self.assertFalse(self.receipt_storage.is_in(receipt_id))
+
+    def test_full_storage_rejects_receipts(self):
+        small = SharedReceiptStorage(os.path.join(self.directory.name, 'small.shm'), capacity=8)
+        self.addCleanup(small.close)
+        outcomes = small.process_receipts(minute_receipts(small.capacity))
+        self.assertTrue(all(isinstance(outcome, str) for outcome in outcomes))
+        with self.assertRaises(ReceiptStorageFull):
+            small.process_receipt(minute_receipts(small.capacity + 1)[-1])
+        self.assertEqual(len(small), small.capacity)
+
+    def test_unknown_ids_are_not_found(self):
+        for receipt_id in ('abc', '', 'ffffffff-ffff-ffff-ffff-ffffffffffff'):
+            self.assertFalse(self.receipt_storage.is_in(receipt_id))
+            with self.assertRaises(ReceiptNotFound):
+                self.receipt_storage.get_receipt_points(receipt_id)
+
+    def test_no_receipt_log(self):
+        with self.assertRaises(ValueError):
+            self.receipt_storage.recover(ReceiptLog(self.directory.name, fsync_policy='never'))
+
+
 if __name__ == "__main__":
     unittest.main()
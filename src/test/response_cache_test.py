@@ -0,0 +1,48 @@
+import unittest
+
+from src.response_cache import (ResponseCache, etag_matches, serialize, ENTRY_OVERHEAD_BYTES)
+
+
+class ResponseCacheTests(unittest.TestCase):
+    def test_serialize_like_jsonify(self):
+        self.assertEqual(serialize({'points': 15, 'a': 1.5}), b'{"a":1.5,"points":15}\n')
+
+    def test_lru_bounded_by_bytes(self):
+        body_bytes = len(serialize({'points': 10}))
+        cache = ResponseCache(max_bytes=3 * (body_bytes + ENTRY_OVERHEAD_BYTES))
+        for key in range(3):
+            cache.put(key, {'points': 10 + key})
+        self.assertIsNotNone(cache.get(0))  # 0 becomes the most recently used
+        cache.put(3, {'points': 13})
+
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(0).body, b'{"points":10}\n')
+        self.assertEqual(cache.evictions, 1)
+        self.assertLessEqual(cache.size_bytes, cache.max_bytes)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_disabled(self):
+        cache = ResponseCache(max_bytes=0)
+        response = cache.put('key', {'points': 1})
+        self.assertEqual(response.body, b'{"points":1}\n')
+        self.assertIsNone(cache.get('key'))
+
+    def test_strong_etag(self):
+        cache = ResponseCache()
+        first = cache.put('a', {'points': 1})
+        self.assertEqual(first.etag, cache.put('b', {'points': 1}).etag)
+        self.assertNotEqual(first.etag, cache.put('c', {'points': 2}).etag)
+        self.assertTrue(first.etag.startswith('"') and first.etag.endswith('"'))
+
+    def test_etag_matches(self):
+        etag = '"abc"'
+        self.assertTrue(etag_matches('"abc"', etag))
+        self.assertTrue(etag_matches('"x", W/"abc"', etag))
+        self.assertTrue(etag_matches('*', etag))
+        self.assertFalse(etag_matches('"abcd"', etag))
+        self.assertFalse(etag_matches(None, etag))
+
+
+if __name__ == '__main__':
+    unittest.main()